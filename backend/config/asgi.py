@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WORKSPACE_GATEWAY_ENABLED:
+    # Serve /w/<workspace_id>/ by proxying to workspace containers
+    from containers.gateway import WorkspaceGateway  # noqa: E402
+
+    application = WorkspaceGateway(application)
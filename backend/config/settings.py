@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import dj_database_url
+import json
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -177,3 +178,183 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # NextJS frontend
 ]
 CORS_ALLOW_CREDENTIALS = True
+
+# Workspace settings
+WORKSPACE_ROOT = os.getenv('WORKSPACE_ROOT', str(BASE_DIR / 'workspace_data'))
+
+# Warm pool of pre-started code-server containers.
+# WARM_POOL_SIZES maps a ResourceClass name to the number of idle containers
+# to keep per image, e.g. '{"Basic": 3, "Standard": 1}'.
+WARM_POOL_DEFAULT_SIZE = int(os.getenv('WARM_POOL_DEFAULT_SIZE', '0'))
+WARM_POOL_SIZES = json.loads(os.getenv('WARM_POOL_SIZES', '{}'))
+
+# Background workspace provisioning. Jobs are queued in the database and run by
+# threads inside the web process (started on the first job), and by any
+# `manage.py run_provisioning_workers` processes; set
+# PROVISIONING_IN_PROCESS_WORKERS to 0 when only dedicated workers should run them.
+PROVISIONING_IN_PROCESS_WORKERS = int(os.getenv('PROVISIONING_IN_PROCESS_WORKERS', '2'))
+PROVISIONING_POLL_INTERVAL = float(os.getenv('PROVISIONING_POLL_INTERVAL', '1.0'))
+PROVISIONING_JOB_TIMEOUT = int(os.getenv('PROVISIONING_JOB_TIMEOUT', '1800'))
+# Running workers look for jobs orphaned by a dead worker this often, and
+# give a job up as failed once it has been claimed this many times
+PROVISIONING_REQUEUE_INTERVAL = float(os.getenv('PROVISIONING_REQUEUE_INTERVAL', '60'))
+PROVISIONING_MAX_ATTEMPTS = int(os.getenv('PROVISIONING_MAX_ATTEMPTS', '3'))
+
+# Generated Dockerfiles are written to IMAGE_BUILD_ROOT/<content hash>/
+IMAGE_BUILD_ROOT = os.getenv('IMAGE_BUILD_ROOT', str(BASE_DIR / 'image_builds'))
+
+# Prefetch every template image in the background when the web process starts.
+# Deploy pipelines can run `manage.py prebuild_images` instead.
+PREBUILD_IMAGES_ON_STARTUP = os.getenv('PREBUILD_IMAGES_ON_STARTUP', 'False').lower() == 'true'
+PREBUILD_IMAGES_WORKERS = int(os.getenv('PREBUILD_IMAGES_WORKERS', '2'))
+
+# Copying workspace files into containers: glob patterns to skip (matched against
+# relative paths and file names), optional gzip and a size guard in bytes (0 = no limit)
+WORKSPACE_SEED_EXCLUDES = [
+    pattern for pattern in os.getenv('WORKSPACE_SEED_EXCLUDES', 'node_modules,.venv,__pycache__').split(',')
+    if pattern
+]
+WORKSPACE_SEED_GZIP = os.getenv('WORKSPACE_SEED_GZIP', 'False').lower() == 'true'
+WORKSPACE_SEED_MAX_BYTES = int(os.getenv('WORKSPACE_SEED_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# 'auto' skips copying workspace files when the container bind-mounts the
+# workspace directory from this host; 'copy' always copies (volume-backed or
+# remote Docker daemons)
+WORKSPACE_SEED_MODE = os.getenv('WORKSPACE_SEED_MODE', 'auto')
+
+# GitHub template downloads (override the URLs to point at a mirror or a test server)
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_RAW_URL = os.getenv('GITHUB_RAW_URL', 'https://raw.githubusercontent.com')
+GITHUB_TOKEN = os.getenv('GITHUB_TOKEN', '')
+TEMPLATE_DOWNLOAD_WORKERS = int(os.getenv('TEMPLATE_DOWNLOAD_WORKERS', '8'))
+
+# Extracted templates are cached here and revalidated against GitHub with
+# conditional requests at most every TEMPLATE_CACHE_REVALIDATE_SECONDS
+TEMPLATE_CACHE_ROOT = os.getenv('TEMPLATE_CACHE_ROOT', str(BASE_DIR / 'template_cache'))
+TEMPLATE_CACHE_REVALIDATE_SECONDS = int(os.getenv('TEMPLATE_CACHE_REVALIDATE_SECONDS', '60'))
+
+# How workspaces are populated from the template cache: 'auto' (reflink when the
+# filesystem supports it, else copy), 'reflink', 'overlay' (needs mount privileges)
+# or 'copy'
+WORKSPACE_MATERIALIZE_STRATEGY = os.getenv('WORKSPACE_MATERIALIZE_STRATEGY', 'auto')
+
+# Host ports leased to workspace containers (inclusive range)
+WORKSPACE_PORT_RANGE_START = int(os.getenv('WORKSPACE_PORT_RANGE_START', '20000'))
+WORKSPACE_PORT_RANGE_END = int(os.getenv('WORKSPACE_PORT_RANGE_END', '20999'))
+
+# Workspace gateway: proxy /w/<workspace_id>/ to containers on an internal Docker
+# network instead of publishing a host port per container (requires serving
+# config.asgi, e.g. with uvicorn)
+WORKSPACE_GATEWAY_ENABLED = os.getenv('WORKSPACE_GATEWAY_ENABLED', 'False').lower() == 'true'
+WORKSPACE_GATEWAY_URL = os.getenv('WORKSPACE_GATEWAY_URL', 'http://localhost:8001').rstrip('/')
+WORKSPACE_NETWORK = os.getenv('WORKSPACE_NETWORK', 'ide-workspaces')
+WORKSPACE_GATEWAY_MAX_CONNECTIONS = int(os.getenv('WORKSPACE_GATEWAY_MAX_CONNECTIONS', '1000'))
+WORKSPACE_GATEWAY_MAX_KEEPALIVE = int(os.getenv('WORKSPACE_GATEWAY_MAX_KEEPALIVE', '200'))
+WORKSPACE_GATEWAY_RESOLVE_TTL = int(os.getenv('WORKSPACE_GATEWAY_RESOLVE_TTL', '30'))
+# How long the owner ticket from the workspace `open` action (and the gateway cookie it becomes) lasts
+WORKSPACE_GATEWAY_TICKET_MAX_AGE = int(os.getenv('WORKSPACE_GATEWAY_TICKET_MAX_AGE', str(12 * 60 * 60)))
+
+# Container event watcher keeping workspace status in sync with the runtime:
+# 'off', 'in_process' (a thread in the web process) or 'external'
+# (python manage.py watch_container_events). When not 'off', the status
+# endpoint answers from the database.
+CONTAINER_EVENTS_WATCHER = os.getenv('CONTAINER_EVENTS_WATCHER', 'off')
+CONTAINER_EVENTS_BATCH_INTERVAL = float(os.getenv('CONTAINER_EVENTS_BATCH_INTERVAL', '0.5'))
+
+# Seconds a container status read from the daemon is reused across requests
+CONTAINER_STATUS_CACHE_TTL = float(os.getenv('CONTAINER_STATUS_CACHE_TTL', '2'))
+
+# Streaming container logs (server-sent events)
+LOG_STREAM_BACKLOG_LINES = int(os.getenv('LOG_STREAM_BACKLOG_LINES', '200'))
+LOG_STREAM_SUBSCRIBER_LINES = int(os.getenv('LOG_STREAM_SUBSCRIBER_LINES', '1000'))
+LOG_STREAM_HEARTBEAT_SECONDS = float(os.getenv('LOG_STREAM_HEARTBEAT_SECONDS', '15'))
+LOG_STREAM_MAX_SECONDS = float(os.getenv('LOG_STREAM_MAX_SECONDS', '300'))
+
+# Container metrics sampler (one streaming stats subscription per running
+# workspace): 'off', 'in_process' (threads in every web process that reads
+# metrics) or 'external' (python manage.py sample_container_metrics, which
+# publishes samples every METRICS_PUBLISH_INTERVAL seconds to the cache the
+# web processes read from; needs a CACHE_BACKEND all processes share)
+METRICS_SAMPLER = os.getenv('METRICS_SAMPLER', 'off')
+METRICS_PUBLISH_INTERVAL = float(os.getenv('METRICS_PUBLISH_INTERVAL', '5'))
+METRICS_HISTORY_SIZE = int(os.getenv('METRICS_HISTORY_SIZE', '300'))
+METRICS_DISCOVERY_INTERVAL = float(os.getenv('METRICS_DISCOVERY_INTERVAL', '10'))
+METRICS_MAX_CONTAINERS = int(os.getenv('METRICS_MAX_CONTAINERS', '500'))
+
+# Django cache; the default is per process, set CACHE_BACKEND (e.g.
+# django.core.cache.backends.redis.RedisCache or .filebased.FileBasedCache)
+# and CACHE_LOCATION to share it between processes
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Idle workspaces: containers with no API/gateway access, no code-server
+# heartbeat and CPU below IDLE_CPU_THRESHOLD percent for IDLE_TIMEOUT_SECONDS
+# are paused ('pause': keeps memory, resumes instantly) or stopped ('stop':
+# frees memory, resume reboots code-server). IDLE_REAPER is 'off',
+# 'in_process' or 'external' (python manage.py reap_idle_workspaces). CPU is
+# only considered when METRICS_SAMPLER is not 'off'.
+IDLE_REAPER = os.getenv('IDLE_REAPER', 'off')
+IDLE_TIMEOUT_SECONDS = int(os.getenv('IDLE_TIMEOUT_SECONDS', '1800'))
+IDLE_CPU_THRESHOLD = float(os.getenv('IDLE_CPU_THRESHOLD', '5.0'))
+IDLE_ACTION = os.getenv('IDLE_ACTION', 'pause')
+IDLE_REAPER_INTERVAL = float(os.getenv('IDLE_REAPER_INTERVAL', '60'))
+# Let the gateway resume a suspended workspace on its next request
+IDLE_RESUME_ON_ACCESS = os.getenv('IDLE_RESUME_ON_ACCESS', 'True').lower() == 'true'
+
+# Shared Docker clients: request/response calls use a pool of
+# DOCKER_MAX_POOL_SIZE connections, followed streams (events, logs, stats) a
+# separate pool; the daemon is re-pinged after DOCKER_HEALTH_CHECK_INTERVAL
+# seconds without a check
+DOCKER_TIMEOUT = int(os.getenv('DOCKER_TIMEOUT', '120'))
+DOCKER_MAX_POOL_SIZE = int(os.getenv('DOCKER_MAX_POOL_SIZE', '32'))
+DOCKER_STREAM_POOL_SIZE = int(os.getenv('DOCKER_STREAM_POOL_SIZE', '1000'))
+DOCKER_HEALTH_CHECK_INTERVAL = float(os.getenv('DOCKER_HEALTH_CHECK_INTERVAL', '30'))
+
+# Container runtime driver: 'docker', or 'fake' (in-memory, for load tests and
+# CI without Docker). The fake sleeps FAKE_RUNTIME_LATENCY seconds per call
+# (FAKE_RUNTIME_LATENCIES overrides per operation, e.g. '{"create": 0.5}'),
+# varied by +/- FAKE_RUNTIME_JITTER as a fraction, and fails state-changing
+# calls at FAKE_RUNTIME_FAILURE_RATE.
+CONTAINER_RUNTIME = os.getenv('CONTAINER_RUNTIME', 'docker')
+FAKE_RUNTIME_LATENCY = float(os.getenv('FAKE_RUNTIME_LATENCY', '0'))
+FAKE_RUNTIME_LATENCIES = json.loads(os.getenv('FAKE_RUNTIME_LATENCIES', '{}'))
+FAKE_RUNTIME_JITTER = float(os.getenv('FAKE_RUNTIME_JITTER', '0'))
+FAKE_RUNTIME_FAILURE_RATE = float(os.getenv('FAKE_RUNTIME_FAILURE_RATE', '0'))
+
+# Multi-node scheduling: workspaces are bin-packed onto registered DockerNodes
+# (python manage.py docker_nodes) by their resource class; committed CPU and RAM
+# may exceed a node's capacity by these factors
+NODE_CPU_OVERCOMMIT = float(os.getenv('NODE_CPU_OVERCOMMIT', '1.0'))
+NODE_RAM_OVERCOMMIT = float(os.getenv('NODE_RAM_OVERCOMMIT', '1.0'))
+
+# Admission control for container operations: at most ADMISSION_MAX_IN_FLIGHT
+# run at once per process (0: unlimited), the rest wait in a queue that serves
+# users in turn, for up to ADMISSION_QUEUE_TIMEOUT seconds and
+# ADMISSION_MAX_QUEUE waiters. Users may have WORKSPACE_MAX_RUNNING_PER_USER
+# workspaces running (0: unlimited).
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '60'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '500'))
+WORKSPACE_MAX_RUNNING_PER_USER = int(os.getenv('WORKSPACE_MAX_RUNNING_PER_USER', '5'))
+
+# Threads used by bulk workspace actions (POST /api/workspaces/bulk/, python
+# manage.py bulk_workspaces); the admission controller still bounds daemon load
+BULK_WORKERS = int(os.getenv('BULK_WORKERS', '16'))
+
+# Rolling image upgrades (python manage.py upgrade_workspaces): containers on
+# outdated images are recreated UPGRADE_BATCH_SIZE at a time, UPGRADE_BATCH_PAUSE
+# seconds apart; the rollout halts when UPGRADE_MAX_UNAVAILABLE workspaces are
+# down or failed
+UPGRADE_BATCH_SIZE = int(os.getenv('UPGRADE_BATCH_SIZE', '5'))
+UPGRADE_MAX_UNAVAILABLE = int(os.getenv('UPGRADE_MAX_UNAVAILABLE', '5'))
+UPGRADE_BATCH_PAUSE = float(os.getenv('UPGRADE_BATCH_PAUSE', '0'))
+
+# The workspace list returns WORKSPACE_PAGE_SIZE workspaces per page;
+# ?page_size= may raise that up to WORKSPACE_MAX_PAGE_SIZE, which also caps
+# how many workspaces one bulk status call reports on
+WORKSPACE_PAGE_SIZE = int(os.getenv('WORKSPACE_PAGE_SIZE', '50'))
+WORKSPACE_MAX_PAGE_SIZE = int(os.getenv('WORKSPACE_MAX_PAGE_SIZE', '500'))
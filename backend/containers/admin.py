@@ -1,3 +1,22 @@
 from django.contrib import admin
+from .models import DockerNode, PortLease
 
-# Register your models here.
+
+@admin.register(PortLease)
+class PortLeaseAdmin(admin.ModelAdmin):
+    list_display = ('port', 'node', 'container_name', 'workspace', 'leased_at')
+    list_filter = ('node', 'leased_at')
+    search_fields = ('container_name',)
+    raw_id_fields = ('workspace',)
+    list_select_related = ('node', 'workspace__owner')
+
+
+@admin.register(DockerNode)
+class DockerNodeAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'base_url', 'driver', 'cpu_capacity', 'ram_gb_capacity', 'disk_gb_capacity',
+        'used_cpu', 'used_ram_gb', 'running_containers', 'is_schedulable', 'is_healthy', 'last_seen',
+    )
+    list_filter = ('driver', 'is_schedulable', 'is_healthy')
+    search_fields = ('name', 'base_url')
+    readonly_fields = ('used_cpu', 'used_ram_gb', 'running_containers', 'last_seen', 'created_at')
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ContainersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'containers'
+
+    def ready(self):
+        if settings.IDLE_REAPER == 'in_process':
+            from .services import DockerService
+            from .services.reaper import start_reaper_on_startup
+            start_reaper_on_startup(DockerService.in_process)
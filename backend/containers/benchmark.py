@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import shutil
+import logging
+import secrets
+import platform
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from workspaces.models import GitTemplate, ProvisioningJob, ResourceClass, Workspace
+from workspaces.services.git_service import GitService
+from workspaces.services.provisioning import ProvisioningRunner
+from workspaces.services.template_cache import TemplateCache
+from .runtime import get_runtime
+from .services import DockerService
+from .services.stages import StageRecorder
+
+logger = logging.getLogger(__name__)
+
+# API calls made for every workspace, in order
+OPERATIONS = ('create', 'provision', 'start', 'status', 'logs', 'stop', 'delete')
+PERCENTILES = (50, 90, 95, 99)
+
+BENCHMARK_REPOSITORY = ('benchmark', 'templates', 'main')
+
+
+def percentile(sorted_values, q):
+    """Linearly interpolated q-th percentile of already sorted values"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, errors=0):
+    """Latency summary in milliseconds"""
+    values = sorted(seconds * 1000 for seconds in samples)
+    summary = {'count': len(values), 'errors': errors}
+    if values:
+        summary['mean_ms'] = round(sum(values) / len(values), 3)
+        for q in PERCENTILES:
+            summary[f"p{q}_ms"] = round(percentile(values, q), 3)
+        summary['max_ms'] = round(values[-1], 3)
+    return summary
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Stages and operations whose p50 or p95 grew by more than ``threshold``
+    (a fraction) relative to a baseline report.
+    """
+    regressions = []
+    for section in ('operations', 'stages'):
+        for name, now in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                if before.get(key) and now.get(key) is not None and now[key] > before[key] * (1 + threshold):
+                    regressions.append({
+                        'section': section, 'name': name, 'metric': key,
+                        'baseline': before[key], 'current': now[key],
+                        'change': round(now[key] / before[key] - 1, 3),
+                    })
+    return regressions
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _write_sample_project(path, files):
+    for index in range(files):
+        directory = os.path.join(path, f"pkg{index // 50}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{index}.py"), 'w') as f:
+            f.write(f"def handler_{index}(request):\n    return {index}\n" * 20)
+    with open(os.path.join(path, 'README.md'), 'w') as f:
+        f.write('Benchmark workspace\n')
+
+
+class WorkspaceBenchmark:
+    """
+    Drives the workspace API through the whole lifecycle and records latency.
+
+    Each workspace goes create -> provision -> start -> status -> logs ->
+    stop -> delete through WorkspaceViewSet (DRF test client, so routing,
+    authentication and serialization are included). Provisioning runs
+    synchronously with the regular ProvisioningRunner, with the template
+    served from a local template cache so GitHub is not part of the numbers.
+    Provisioning stages (template fetch, image resolve, container run, seed
+    copy, DB save) are timed through containers.services.stages.
+
+    The container runtime is whatever get_runtime() returns, so the same
+    run measures the fake runtime or a local Docker daemon.
+    """
+
+    def __init__(self, iterations=20, concurrency=1, template_dir=None, template_files=200,
+                 language='python', seed_mode=None):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.template_dir = template_dir
+        self.template_files = template_files
+        self.language = language
+        self.seed_mode = seed_mode
+        self._samples = {operation: [] for operation in OPERATIONS}
+        self._errors = {operation: 0 for operation in OPERATIONS}
+        self._error_messages = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Run the benchmark and return the JSON-serializable report"""
+        scratch = tempfile.mkdtemp(prefix='workspace-benchmark-')
+        overrides = {
+            'WORKSPACE_ROOT': os.path.join(scratch, 'workspaces'),
+            # Jobs are run by the benchmark itself, not by background workers
+            'PROVISIONING_IN_PROCESS_WORKERS': 0,
+            # The host name the DRF test client sends
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+        }
+        if self.seed_mode:
+            overrides['WORKSPACE_SEED_MODE'] = self.seed_mode
+        try:
+            with override_settings(**overrides):
+                os.makedirs(overrides['WORKSPACE_ROOT'])
+                self._setup(scratch)
+                try:
+                    with StageRecorder() as recorder:
+                        started = time.perf_counter()
+                        if self.concurrency > 1:
+                            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='benchmark') as executor:
+                                list(executor.map(self._thread_cycle, range(self.iterations)))
+                        else:
+                            for index in range(self.iterations):
+                                self._cycle(index)
+                        elapsed = time.perf_counter() - started
+                finally:
+                    self._teardown()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return self._report(recorder, elapsed)
+
+    def _setup(self, scratch):
+        from django.contrib.auth import get_user_model
+
+        self.user = get_user_model().objects.create_user(
+            username=f"benchmark-{secrets.token_hex(4)}", password=secrets.token_urlsafe(16)
+        )
+        owner, repo, branch = BENCHMARK_REPOSITORY
+        self.template = GitTemplate.objects.create(
+            name=f"Benchmark {self.language}",
+            description='Created by the workspace benchmark',
+            repository_url=f"https://github.com/{owner}/{repo}",
+            language=self.language,
+            default_branch=branch,
+            created_by=self.user,
+        )
+        self.resource_class = ResourceClass.objects.get(id=ResourceClass.get_default_class())
+
+        source_dir = self.template_dir
+        if not source_dir:
+            source_dir = os.path.join(scratch, 'template')
+            _write_sample_project(source_dir, self.template_files)
+        template_cache = TemplateCache(root=os.path.join(scratch, 'template_cache'), revalidate_seconds=float('inf'))
+        template_cache.seed(owner, repo, branch, f"{self.language}-template", source_dir)
+        self.runner = ProvisioningRunner(
+            git_service=GitService(template_cache=template_cache),
+            docker_service=DockerService.in_process(),
+        )
+
+    def _teardown(self):
+        docker_service = DockerService.in_process()
+        for workspace in Workspace.objects.filter(owner=self.user):
+            docker_service.delete_container(workspace)
+        Workspace.objects.filter(owner=self.user).delete()
+        self.template.delete()
+        self.user.delete()
+
+    def _thread_cycle(self, index):
+        try:
+            self._cycle(index)
+        finally:
+            connection.close()
+
+    def _call(self, operation, request):
+        """Time one operation; returns its result, or None if it failed"""
+        started = time.perf_counter()
+        try:
+            response = request()
+            status_code = getattr(response, 'status_code', 200)
+            ok = status_code < 400
+            error = None if ok else f"{operation}: HTTP {status_code}"
+        except Exception as e:
+            response, ok, error = None, False, f"{operation}: {str(e)}"
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if ok:
+                self._samples[operation].append(elapsed)
+            else:
+                self._errors[operation] += 1
+                if len(self._error_messages) < 20:
+                    self._error_messages.append(error)
+        return response if ok else None
+
+    def _provision(self, job_id):
+        job = ProvisioningJob.objects.get(id=job_id)
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts'])
+        if not self.runner.run(job):
+            raise RuntimeError(job.error or 'provisioning failed')
+        return job
+
+    def _cycle(self, index):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = self._call('create', lambda: client.post('/api/workspaces/', {
+            'name': f"benchmark-{index}",
+            'git_template': self.template.id,
+            'resource_class': self.resource_class.id,
+        }, format='json'))
+        if response is None:
+            return
+        workspace_url = f"/api/workspaces/{response.data['id']}/"
+
+        if self._call('provision', lambda: self._provision(response.data['job']['id'])) is not None:
+            self._call('start', lambda: client.post(f"{workspace_url}start/"))
+            self._call('status', lambda: client.get(f"{workspace_url}status/"))
+            self._call('logs', lambda: client.get(f"{workspace_url}logs/"))
+            self._call('stop', lambda: client.post(f"{workspace_url}stop/"))
+        self._call('delete', lambda: client.delete(workspace_url))
+
+    def _report(self, recorder, elapsed):
+        runtime = get_runtime()
+        completed = len(self._samples['delete'])
+        return {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'runtime': runtime.name,
+                'iterations': self.iterations,
+                'concurrency': self.concurrency,
+                'language': self.language,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'workspaces_per_second': round(completed / elapsed, 2) if elapsed else None,
+            'operations': {
+                operation: summarize(self._samples[operation], self._errors[operation])
+                for operation in OPERATIONS
+            },
+            'stages': {name: summarize(samples) for name, samples in sorted(recorder.samples.items())},
+            'errors': self._error_messages,
+        }
+
+
+def dump_report(report, path=None):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    return text
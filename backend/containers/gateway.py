@@ -0,0 +1,441 @@
+import re
+import time
+import socket
+import asyncio
+import logging
+import httpx
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from websockets.asyncio.client import connect as websocket_connect
+from .runtime import ContainerNotFound, get_runtime
+from websockets.exceptions import ConnectionClosed, InvalidHandshake, InvalidStatus
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_PATH = re.compile(r'^/w/(\d+)(/.*)?$')
+CODE_SERVER_PORT = 8080
+
+# Owner tickets: handed out by the workspace API, exchanged for a cookie scoped to /w/<id>/
+TICKET_PARAM = 'ticket'
+TICKET_COOKIE = 'workspace_ticket'
+TICKET_SALT = 'containers.gateway.ticket'
+
+# Connection-level headers that must not be forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP = {
+    b'connection', b'keep-alive', b'proxy-authenticate', b'proxy-authorization',
+    b'te', b'trailer', b'transfer-encoding', b'upgrade',
+}
+
+# Handshake headers the websocket client generates itself
+WEBSOCKET_HANDSHAKE = HOP_BY_HOP | {
+    b'host', b'origin', b'sec-websocket-key', b'sec-websocket-version',
+    b'sec-websocket-extensions', b'sec-websocket-protocol',
+}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a workspace has no reachable container"""
+
+
+def issue_ticket(workspace):
+    """A signed token proving its bearer was let in to the workspace by its owner's API session"""
+    return signing.dumps({'w': workspace.pk, 'u': workspace.owner_id}, salt=TICKET_SALT)
+
+
+def ticket_user(ticket, workspace_id):
+    """The user id a ticket was issued to for this workspace, or None if it is invalid or expired"""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.WORKSPACE_GATEWAY_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not isinstance(payload, dict) or payload.get('w') != workspace_id:
+        return None
+    return payload.get('u')
+
+
+class UpstreamResolver:
+    """
+    Maps workspace ids to container addresses, with a short cache: the
+    workspace network address for the default runtime, the published port
+    on the node's public host for registered nodes (which the workspace
+    network does not reach).
+    """
+
+    def __init__(self, network=None, ttl=None):
+        self.network = network or settings.WORKSPACE_NETWORK
+        self.ttl = ttl if ttl is not None else settings.WORKSPACE_GATEWAY_RESOLVE_TTL
+        self._cache = {}
+        self._accessed = {}
+
+    def runtime(self, node_id=None):
+        """The runtime of the node a workspace is placed on (the default one when unplaced)"""
+        if node_id is None:
+            return get_runtime()
+        from .services import DockerService
+        return DockerService.for_node(node_id).runtime
+
+    async def resolve(self, workspace_id, user_id=None):
+        """
+        The container address of a workspace. Only traffic of the owner
+        (``user_id`` from a gateway ticket) counts as activity for the idle
+        reaper or resumes a suspended container; anyone else is routed to a
+        running container only.
+        """
+        cached = self._cache.get(workspace_id)
+        if cached and cached[2] > time.monotonic():
+            address, owner_id = cached[0], cached[1]
+            if user_id is not None and user_id == owner_id:
+                await self._mark_accessed(workspace_id)
+            return address
+
+        container_id, node_id, owner_id = await sync_to_async(self._container_id)(workspace_id)
+        if not container_id:
+            raise UpstreamUnavailable(f"Workspace {workspace_id} has no container")
+        is_owner = user_id is not None and user_id == owner_id
+        if is_owner:
+            await self._mark_accessed(workspace_id)
+        address = await sync_to_async(self._container_address, thread_sensitive=False)(
+            container_id, workspace_id, node_id, resume=is_owner
+        )
+        self._cache[workspace_id] = (address, owner_id, time.monotonic() + self.ttl)
+        return address
+
+    async def _mark_accessed(self, workspace_id):
+        # Traffic keeps the workspace from being suspended by the idle reaper
+        from .services.reaper import ACCESS_WRITE_INTERVAL, mark_accessed
+
+        now = time.monotonic()
+        if self._accessed.get(workspace_id, 0) > now:
+            return
+        self._accessed[workspace_id] = now + ACCESS_WRITE_INTERVAL
+        await sync_to_async(mark_accessed)(workspace_id)
+
+    def invalidate(self, workspace_id):
+        self._cache.pop(workspace_id, None)
+
+    def _container_id(self, workspace_id):
+        from workspaces.models import Workspace
+
+        return (
+            Workspace.objects.filter(pk=workspace_id).values_list('container_id', 'node_id', 'owner_id').first()
+            or (None, None, None)
+        )
+
+    def _container_address(self, container_id, workspace_id, node_id=None, resume=False):
+        runtime = self.runtime(node_id)
+        try:
+            container = runtime.inspect(container_id)
+            if container.status in ('paused', 'exited') and resume and settings.IDLE_RESUME_ON_ACCESS:
+                container = self._resume(runtime, container, workspace_id, node_id)
+        except ContainerNotFound:
+            raise UpstreamUnavailable(f"Container {container_id} not found")
+        if container.status != 'running':
+            raise UpstreamUnavailable(f"Container {container.name} is {container.status}")
+        address = self._address(container, node_id)
+        if not address:
+            raise UpstreamUnavailable(f"Container {container.name} has no address the gateway can reach")
+        return address
+
+    def _address(self, container, node_id=None):
+        if node_id is not None:
+            from .services import DockerService
+            return DockerService.for_node(node_id).upstream_address(container)
+        ip_address = container.networks.get(self.network)
+        return f"{ip_address}:{CODE_SERVER_PORT}" if ip_address else None
+
+    def _resume(self, runtime, container, workspace_id, node_id=None):
+        """Bring back a container suspended by the idle reaper, under admission control"""
+        from workspaces.models import Workspace
+        from .services import DockerService
+        from .services.admission import AdmissionTimeout, QuotaExceeded
+        from .services.scheduler import NoCapacity
+
+        booting = container.status == 'exited'
+        workspace = Workspace.objects.select_related('owner', 'node').get(pk=workspace_id)
+        try:
+            started = DockerService.in_process().start_container(workspace)
+        except (QuotaExceeded, AdmissionTimeout, NoCapacity) as e:
+            raise UpstreamUnavailable(f"Workspace {workspace_id} cannot resume: {str(e)}")
+        if not started:
+            raise UpstreamUnavailable(f"Workspace {workspace_id} failed to resume")
+        container = runtime.inspect(container.id)
+        logger.info(f"Gateway resumed workspace {workspace_id}")
+        if booting:
+            # A stopped container has to boot code-server again; wait for it to listen
+            address = self._address(container, node_id)
+            deadline = time.monotonic() + 30
+            while address and time.monotonic() < deadline:
+                host, port = address.rsplit(':', 1)
+                try:
+                    socket.create_connection((host, int(port)), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.25)
+        return container
+
+
+class WorkspaceGateway:
+    """
+    ASGI middleware that serves ``/w/<workspace_id>/...`` by proxying HTTP and
+    WebSocket traffic to the workspace container's code-server on the internal
+    Docker network, so containers do not need published host ports. Every
+    other path goes to the wrapped Django application.
+
+    Upstream HTTP connections are kept alive in one shared httpx pool.
+    code-server keeps doing its own password authentication; the gateway
+    only tells the owner apart, by the ticket the workspace API's ``open``
+    action hands out, so that their traffic alone keeps the workspace
+    awake and resumes it once suspended.
+    """
+
+    def __init__(self, app, resolver=None):
+        self.app = app
+        self.resolver = resolver or UpstreamResolver()
+        self._http = None
+
+    @property
+    def http(self):
+        # Created lazily so it binds to the server's event loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.WORKSPACE_GATEWAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.WORKSPACE_GATEWAY_MAX_KEEPALIVE,
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(30, read=None),
+                follow_redirects=False,
+            )
+        return self._http
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        # Match on the raw path so percent-encoding reaches code-server untouched
+        raw_path = scope.get('raw_path')
+        match = WORKSPACE_PATH.match(raw_path.decode('latin-1') if raw_path else scope.get('path', ''))
+        if not match or scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        workspace_id = int(match.group(1))
+        path = match.group(2)
+        if path is None and scope['type'] == 'http':
+            # code-server uses relative URLs, so the prefix needs a trailing slash
+            return await self._redirect(scope, send, f"/w/{workspace_id}/")
+
+        query = parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        ticket = next((value for name, value in query if name == TICKET_PARAM), None)
+        if ticket is not None and scope['type'] == 'http':
+            return await self._exchange_ticket(scope, receive, send, workspace_id, path, query, ticket)
+
+        try:
+            upstream = await self.resolver.resolve(workspace_id, self._ticket_user(scope, workspace_id))
+        except UpstreamUnavailable as e:
+            logger.info(f"Gateway cannot route workspace {workspace_id}: {str(e)}")
+            return await self._reject(scope, receive, send, 503, b'Workspace is not running')
+        except Exception as e:
+            logger.error(f"Error resolving workspace {workspace_id}: {str(e)}")
+            return await self._reject(scope, receive, send, 502, b'Workspace is unreachable')
+
+        if scope['type'] == 'http':
+            await self._proxy_http(scope, receive, send, workspace_id, upstream, path)
+        else:
+            await self._proxy_websocket(scope, receive, send, workspace_id, upstream, path or '/')
+
+    async def _lifespan(self, receive, send):
+        # Django does not implement lifespan, so the gateway answers it and
+        # closes its upstream pool on shutdown
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._http is not None:
+                    await self._http.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _ticket_user(self, scope, workspace_id):
+        cookies = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                try:
+                    cookies.load(value.decode('latin-1'))
+                except Exception:
+                    continue
+        morsel = cookies.get(TICKET_COOKIE)
+        return ticket_user(morsel.value, workspace_id) if morsel else None
+
+    async def _exchange_ticket(self, scope, receive, send, workspace_id, path, query, ticket):
+        # Trade the ticket for a cookie and drop it from the URL, so it never reaches code-server
+        if ticket_user(ticket, workspace_id) is None:
+            return await self._respond(send, 403, b'Workspace link is invalid or has expired')
+        location = f"/w/{workspace_id}{path}"
+        rest = [(name, value) for name, value in query if name != TICKET_PARAM]
+        if rest:
+            location += '?' + urlencode(rest)
+        cookie = (
+            f"{TICKET_COOKIE}={ticket}; Path=/w/{workspace_id}/; "
+            f"Max-Age={settings.WORKSPACE_GATEWAY_TICKET_MAX_AGE}; HttpOnly; SameSite=Lax"
+        )
+        if scope.get('scheme') == 'https':
+            cookie += '; Secure'
+        await send({
+            'type': 'http.response.start',
+            'status': 303,
+            'headers': [
+                (b'location', location.encode('latin-1')),
+                (b'set-cookie', cookie.encode('latin-1')),
+                (b'content-length', b'0'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def _target(self, scope, upstream, path, scheme):
+        url = f"{scheme}://{upstream}{path}"
+        if scope.get('query_string'):
+            url += '?' + scope['query_string'].decode('latin-1')
+        return url
+
+    def _forwarded_headers(self, scope, workspace_id, skip):
+        headers = [(name, value) for name, value in scope['headers'] if name.lower() not in skip]
+        client = scope.get('client')
+        if client:
+            headers.append((b'x-forwarded-for', client[0].encode()))
+        host = dict(scope['headers']).get(b'host')
+        if host:
+            # code-server checks the websocket Origin against this host
+            headers.append((b'x-forwarded-host', host))
+        headers.append((b'x-forwarded-proto', b'https' if scope.get('scheme') in ('https', 'wss') else b'http'))
+        headers.append((b'x-forwarded-prefix', f"/w/{workspace_id}".encode()))
+        return headers
+
+    async def _proxy_http(self, scope, receive, send, workspace_id, upstream, path):
+        headers = self._forwarded_headers(scope, workspace_id, HOP_BY_HOP)
+        request_headers = {name.lower() for name, _ in scope['headers']}
+        if b'content-length' in request_headers or b'transfer-encoding' in request_headers:
+            content = self._request_body(receive)
+        else:
+            content = None
+
+        request = self.http.build_request(
+            scope['method'], self._target(scope, upstream, path, 'http'), headers=headers, content=content
+        )
+        try:
+            response = await self.http.send(request, stream=True)
+        except httpx.TransportError as e:
+            self.resolver.invalidate(workspace_id)
+            logger.warning(f"Gateway upstream error for workspace {workspace_id}: {str(e)}")
+            return await self._respond(send, 502, b'Workspace is unreachable')
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [
+                    (name, value) for name, value in response.headers.raw if name.lower() not in HOP_BY_HOP
+                ],
+            })
+            # Raw bytes, so Content-Encoding and Content-Length stay valid
+            async for chunk in response.aiter_raw():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await response.aclose()
+
+    async def _request_body(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            yield message.get('body', b'')
+            if not message.get('more_body'):
+                return
+
+    async def _proxy_websocket(self, scope, receive, send, workspace_id, upstream, path):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        origin = next((value.decode('latin-1') for name, value in scope['headers'] if name == b'origin'), None)
+        try:
+            upstream_socket = await websocket_connect(
+                self._target(scope, upstream, path, 'ws'),
+                additional_headers=[
+                    (name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in self._forwarded_headers(scope, workspace_id, WEBSOCKET_HANDSHAKE)
+                ],
+                origin=origin,
+                subprotocols=scope.get('subprotocols') or None,
+                user_agent_header=None,
+                compression=None,
+                max_size=None,
+                open_timeout=10,
+            )
+        except (OSError, asyncio.TimeoutError, InvalidHandshake) as e:
+            if not isinstance(e, InvalidStatus):
+                self.resolver.invalidate(workspace_id)
+            logger.warning(f"Gateway websocket upstream error for workspace {workspace_id}: {str(e)}")
+            await send({'type': 'websocket.close', 'code': 1011})
+            return
+
+        await send({'type': 'websocket.accept', 'subprotocol': upstream_socket.subprotocol})
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                if message.get('bytes') is not None:
+                    await upstream_socket.send(message['bytes'])
+                elif message.get('text') is not None:
+                    await upstream_socket.send(message['text'])
+
+        async def upstream_to_client():
+            try:
+                async for data in upstream_socket:
+                    if isinstance(data, bytes):
+                        await send({'type': 'websocket.send', 'bytes': data})
+                    else:
+                        await send({'type': 'websocket.send', 'text': data})
+            except ConnectionClosed:
+                pass
+            await send({'type': 'websocket.close', 'code': upstream_socket.close_code or 1000})
+
+        tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream_socket.close()
+
+    async def _reject(self, scope, receive, send, status, body):
+        if scope['type'] == 'websocket':
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1013 if status == 503 else 1011})
+        else:
+            await self._respond(send, status, body)
+
+    async def _respond(self, send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _redirect(self, scope, send, location):
+        if scope.get('query_string'):
+            location += '?' + scope['query_string'].decode('latin-1')
+        await send({
+            'type': 'http.response.start',
+            'status': 308,
+            'headers': [(b'location', location.encode('latin-1')), (b'content-length', b'0')],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
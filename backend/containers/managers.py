@@ -1,37 +1,25 @@
-from datetime import datetime
+import logging
 from django.utils import timezone
 from .services import DockerService
 from workspaces.models import Workspace
 
+logger = logging.getLogger(__name__)
+
+
 class ContainerManager:
-    def __init__(self):
-        self.docker_service = DockerService()
+    def __init__(self, docker_service=None):
+        self.docker_service = docker_service or DockerService.in_process()
 
     def create_workspace_container(self, workspace: Workspace) -> bool:
         """Create and start a new container for a workspace."""
         try:
-            # Get resource specifications from the resource class
-            cpu_count = workspace.resource_class.cpu_count
-            memory_gb = workspace.resource_class.ram_gb
-            
-            # Create container
-            container_info = self.docker_service.create_workspace_container(
-                workspace_id=workspace.id,
-                cpu_count=cpu_count,
-                memory_limit=f"{memory_gb}g"
-            )
-
-            # Update workspace with container information
-            workspace.container_id = container_info["container_id"]
-            workspace.container_status = container_info["status"]
-            workspace.container_port = container_info["port"]
-            workspace.is_running = True
+            if not self.docker_service.initialize_container(workspace):
+                return False
             workspace.last_accessed = timezone.now()
-            workspace.save()
-
+            workspace.save(update_fields=['last_accessed'])
             return True
         except Exception as e:
-            print(f"Error creating container for workspace {workspace.id}: {str(e)}")
+            logger.error(f"Error creating container for workspace {workspace.id}: {str(e)}")
             return False
 
     def stop_workspace_container(self, workspace: Workspace) -> bool:
@@ -39,7 +27,7 @@ class ContainerManager:
         if not workspace.container_id:
             return False
 
-        if self.docker_service.stop_container(workspace.container_id):
+        if self.docker_service.stop_container(workspace):
             workspace.is_running = False
             workspace.container_status = "stopped"
             workspace.save()
@@ -51,23 +39,19 @@ class ContainerManager:
         if not workspace.container_id:
             return False
 
-        if self.docker_service.start_container(workspace.container_id):
-            workspace.is_running = True
-            workspace.container_status = "running"
-            workspace.last_accessed = timezone.now()
-            workspace.save()
-            return True
-        return False
+        # start_container marks the workspace running and records the access
+        return self.docker_service.start_container(workspace)
 
     def delete_workspace_container(self, workspace: Workspace) -> bool:
         """Delete a workspace container."""
         if not workspace.container_id:
             return True
 
-        if self.docker_service.delete_container(workspace.container_id):
+        if self.docker_service.delete_container(workspace):
             workspace.container_id = None
-            workspace.container_status = None
+            workspace.container_status = "stopped"
             workspace.container_port = None
+            workspace.container_url = None
             workspace.is_running = False
             workspace.save()
             return True
@@ -81,7 +65,7 @@ class ContainerManager:
                 "is_running": False
             }
 
-        container_status = self.docker_service.get_container_status(workspace.container_id)
+        container_status = self.docker_service.get_container_statuses([workspace]).get(workspace.id)
         if not container_status:
             return {
                 "status": "not_found",
@@ -89,8 +73,7 @@ class ContainerManager:
             }
 
         return {
-            "status": container_status["status"],
-            "is_running": container_status["status"] == "running",
-            "ports": container_status["ports"],
-            "state": container_status["state"]
+            "status": container_status,
+            "is_running": container_status == "running",
+            "port": workspace.container_port,
         }
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-17 00:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('workspaces', '0006_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('port', models.PositiveIntegerField(unique=True)),
+                ('container_name', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('leased_at', models.DateTimeField(blank=True, null=True)),
+                ('workspace', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='port_lease', to='workspaces.workspace')),
+            ],
+            options={
+                'ordering': ['port'],
+                'indexes': [models.Index(fields=['leased_at', 'port'], name='containers__leased__731a55_idx')],
+            },
+        ),
+    ]
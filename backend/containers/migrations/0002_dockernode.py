@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('containers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DockerNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('base_url', models.CharField(blank=True, help_text='Docker endpoint, e.g. tcp://10.0.0.5:2375 (empty for the local daemon)', max_length=255)),
+                ('driver', models.CharField(choices=[('docker', 'Docker'), ('fake', 'Fake (in-memory)')], default='docker', max_length=20)),
+                ('public_host', models.CharField(default='localhost', help_text='Host name browsers reach published workspace ports on', max_length=255)),
+                ('cpu_capacity', models.IntegerField(help_text='CPUs available to workspaces')),
+                ('ram_gb_capacity', models.IntegerField(help_text='RAM available to workspaces')),
+                ('disk_gb_capacity', models.IntegerField(help_text='Disk available to workspaces')),
+                ('is_schedulable', models.BooleanField(default=True, help_text='Place new workspaces here (off drains the node)')),
+                ('is_healthy', models.BooleanField(default=True)),
+                ('used_cpu', models.FloatField(default=0)),
+                ('used_ram_gb', models.FloatField(default=0)),
+                ('running_containers', models.IntegerField(default=0)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.20 on 2026-10-17 01:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_lease_nodes(apps, schema_editor):
+    """Existing leases held by placed workspaces belong to those workspaces' nodes"""
+    PortLease = apps.get_model('containers', 'PortLease')
+    for lease in PortLease.objects.filter(workspace__node__isnull=False).select_related('workspace'):
+        lease.node_id = lease.workspace.node_id
+        lease.save(update_fields=['node'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('containers', '0002_dockernode'),
+        ('workspaces', '0007_workspace_node'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portlease',
+            name='node',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='port_leases', to='containers.dockernode'),
+        ),
+        migrations.RunPython(set_lease_nodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.20 on 2026-10-17 01:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('containers', '0003_portlease_node'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dockernode',
+            name='public_host',
+            field=models.CharField(default='localhost', help_text='Host name browsers and the gateway reach published workspace ports on', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='portlease',
+            name='node',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='port_leases', to='containers.dockernode'),
+        ),
+        migrations.AlterField(
+            model_name='portlease',
+            name='port',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='portlease',
+            constraint=models.UniqueConstraint(fields=('node', 'port'), name='unique_node_port'),
+        ),
+        migrations.AddConstraint(
+            model_name='portlease',
+            constraint=models.UniqueConstraint(condition=models.Q(('node__isnull', True)), fields=('port',), name='unique_default_port'),
+        ),
+    ]
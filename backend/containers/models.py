@@ -1,3 +1,74 @@
 from django.db import models
 
-# Create your models here.
+
+class PortLease(models.Model):
+    """Host port reserved for a container's code-server binding"""
+    port = models.PositiveIntegerField()
+    workspace = models.OneToOneField(
+        'workspaces.Workspace',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='port_lease',
+    )
+    container_name = models.CharField(max_length=100, blank=True, db_index=True)
+    # Node whose host the port is published on; None for the default runtime
+    node = models.ForeignKey(
+        'containers.DockerNode',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='port_leases',
+    )
+    leased_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['port']
+        indexes = [
+            models.Index(fields=['leased_at', 'port']),
+        ]
+        constraints = [
+            # Each node publishes ports on its own host
+            models.UniqueConstraint(fields=['node', 'port'], name='unique_node_port'),
+            # NULLs never collide, so the default runtime needs its own constraint
+            models.UniqueConstraint(fields=['port'], condition=models.Q(node__isnull=True), name='unique_default_port'),
+        ]
+
+    def __str__(self):
+        return f"Port {self.port} ({self.container_name or 'free'})"
+
+
+class DockerNode(models.Model):
+    """A Docker host workspace containers can be scheduled on"""
+    DRIVER_CHOICES = [
+        ('docker', 'Docker'),
+        ('fake', 'Fake (in-memory)'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    base_url = models.CharField(
+        max_length=255, blank=True,
+        help_text='Docker endpoint, e.g. tcp://10.0.0.5:2375 (empty for the local daemon)',
+    )
+    driver = models.CharField(max_length=20, choices=DRIVER_CHOICES, default='docker')
+    public_host = models.CharField(
+        max_length=255, default='localhost',
+        help_text='Host name browsers and the gateway reach published workspace ports on',
+    )
+    cpu_capacity = models.IntegerField(help_text='CPUs available to workspaces')
+    ram_gb_capacity = models.IntegerField(help_text='RAM available to workspaces')
+    disk_gb_capacity = models.IntegerField(help_text='Disk available to workspaces')
+    is_schedulable = models.BooleanField(default=True, help_text='Place new workspaces here (off drains the node)')
+    is_healthy = models.BooleanField(default=True)
+    # Measured at the last refresh, next to what placed workspaces have reserved
+    used_cpu = models.FloatField(default=0)
+    used_ram_gb = models.FloatField(default=0)
+    running_containers = models.IntegerField(default=0)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
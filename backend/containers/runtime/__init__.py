@@ -0,0 +1,50 @@
+import threading
+from django.conf import settings
+from .base import ContainerInfo, ContainerNotFound, ContainerRuntime, ContainerRuntimeError, ImageInfo
+from .fake_driver import FakeRuntime
+
+__all__ = [
+    'ContainerInfo', 'ContainerNotFound', 'ContainerRuntime', 'ContainerRuntimeError', 'ImageInfo',
+    'FakeRuntime', 'get_runtime', 'set_runtime', 'runtime_for_node',
+]
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def _create_runtime(driver=None, base_url=None):
+    driver = driver or settings.CONTAINER_RUNTIME
+    if driver == 'fake':
+        return FakeRuntime(
+            latency=settings.FAKE_RUNTIME_LATENCY,
+            latencies=settings.FAKE_RUNTIME_LATENCIES,
+            jitter=settings.FAKE_RUNTIME_JITTER,
+            failure_rate=settings.FAKE_RUNTIME_FAILURE_RATE,
+        )
+    if driver == 'docker':
+        # Imported here: the driver uses containers.services, which imports this package
+        from .docker_driver import DockerRuntime
+        from ..services.client import DockerClientProvider
+        return DockerRuntime(DockerClientProvider(base_url) if base_url else None)
+    raise ValueError(f"Unknown container runtime {driver!r}")
+
+
+def get_runtime():
+    """The container runtime driver selected by CONTAINER_RUNTIME, shared by the process"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = _create_runtime()
+        return _runtime
+
+
+def set_runtime(runtime):
+    """Replace the process-wide runtime (benchmarks and tests); None re-reads the settings"""
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
+
+
+def runtime_for_node(node):
+    """A new runtime driver for a registered DockerNode"""
+    return _create_runtime(node.driver, node.base_url)
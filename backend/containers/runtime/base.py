@@ -0,0 +1,137 @@
+class ContainerRuntimeError(Exception):
+    """Raised when the container runtime cannot carry out an operation"""
+
+
+class ContainerNotFound(ContainerRuntimeError):
+    """Raised when a container (or image) does not exist"""
+
+
+class ContainerInfo:
+    """A runtime-neutral snapshot of one container"""
+
+    def __init__(self, id, name, status, labels=None, env=None, ports=None, mounts=None, networks=None,
+                 image=None, image_id=None):
+        self.id = id
+        self.name = name
+        # Docker's vocabulary: created, running, paused, restarting, exited, dead
+        self.status = status
+        self.labels = labels or {}
+        self.env = env or {}
+        # '8080/tcp' -> published host port
+        self.ports = ports or {}
+        # (host source, container destination) of bind mounts
+        self.mounts = mounts or []
+        # network name -> IP address
+        self.networks = networks or {}
+        # The reference the container was created from and the id it resolved to
+        self.image = image
+        self.image_id = image_id
+
+    def __repr__(self):
+        return f"<ContainerInfo {self.name} {self.status}>"
+
+
+class ImageInfo:
+    def __init__(self, id, tags=None, size=None):
+        self.id = id
+        self.tags = tags or []
+        self.size = size
+
+
+class ContainerRuntime:
+    """
+    What DockerService needs from a container engine.
+
+    Containers are addressed by id (or name); ``create`` takes docker-py's
+    ``containers.run`` keyword arguments, which every driver interprets.
+    Drivers raise ContainerNotFound for missing containers and
+    ContainerRuntimeError for everything else.
+    """
+    name = None
+    # Whether bind mount sources are paths on this host
+    shares_host_filesystem = True
+
+    def ping(self):
+        raise NotImplementedError
+
+    def create(self, config, start=True):
+        """Create a container (and start it) from docker-py run() arguments; returns ContainerInfo"""
+        raise NotImplementedError
+
+    def start(self, container_id):
+        raise NotImplementedError
+
+    def stop(self, container_id, timeout=10):
+        raise NotImplementedError
+
+    def pause(self, container_id):
+        raise NotImplementedError
+
+    def unpause(self, container_id):
+        raise NotImplementedError
+
+    def remove(self, container_id, force=False):
+        raise NotImplementedError
+
+    def rename(self, container_id, name):
+        raise NotImplementedError
+
+    def inspect(self, container_id):
+        raise NotImplementedError
+
+    def list(self, name=None, label=None, status=None, details=False):
+        """
+        Containers (stopped ones included) filtered like ``docker ps -a``.
+        Without ``details`` the driver may leave ``env`` empty to save work.
+        """
+        raise NotImplementedError
+
+    def statuses(self, container_ids):
+        """{container id: status} for the given containers that still exist, in one call"""
+        raise NotImplementedError
+
+    def logs(self, container_id, tail=100):
+        """The last ``tail`` log lines, prefixed with their timestamps"""
+        raise NotImplementedError
+
+    def follow_logs(self, container_id, tail=0):
+        """A closable iterator of timestamped log bytes that ends when the container stops"""
+        raise NotImplementedError
+
+    def events(self, since=None, actions=None):
+        """
+        A closable iterator of Docker-format container events
+        ({'Action': ..., 'Actor': {'ID': ..., 'Attributes': {'name': ...}}})
+        from ``since`` (epoch seconds) on, limited to ``actions`` if given.
+        """
+        raise NotImplementedError
+
+    def stats(self, container_id):
+        """One Docker-format stats document"""
+        raise NotImplementedError
+
+    def follow_stats(self, container_id):
+        """An iterator of Docker-format stats documents, about one per second"""
+        raise NotImplementedError
+
+    def exec(self, container_id, command, user=None):
+        """Run a command in a running container; returns (exit code, output bytes)"""
+        raise NotImplementedError
+
+    def put_archive(self, container_id, path, data):
+        """Extract a tar archive (bytes or an iterator of chunks) at path inside the container"""
+        raise NotImplementedError
+
+    def ensure_network(self, name):
+        raise NotImplementedError
+
+    def image(self, reference):
+        """ImageInfo for a local image, or None"""
+        raise NotImplementedError
+
+    def pull(self, reference):
+        raise NotImplementedError
+
+    def build(self, path, tag, labels=None):
+        """Build an image; yields Docker-format progress documents ({'stream': ...} / {'error': ...})"""
+        raise NotImplementedError
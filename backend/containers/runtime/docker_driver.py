@@ -0,0 +1,214 @@
+import functools
+import docker
+from docker.errors import DockerException
+from ..services import client as docker_client
+from .base import ContainerInfo, ContainerNotFound, ContainerRuntime, ContainerRuntimeError, ImageInfo
+
+
+def _translate_errors(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except docker.errors.NotFound as e:
+            raise ContainerNotFound(str(e)) from e
+        except DockerException as e:
+            raise ContainerRuntimeError(str(e)) from e
+    return wrapper
+
+
+def _from_container(container):
+    """ContainerInfo from a fully inspected docker-py container"""
+    attrs = container.attrs
+    config = attrs.get('Config') or {}
+    network_settings = attrs.get('NetworkSettings') or {}
+    ports = {}
+    for port, bindings in (network_settings.get('Ports') or {}).items():
+        if bindings:
+            ports[port] = int(bindings[0]['HostPort'])
+    return ContainerInfo(
+        id=container.id,
+        name=attrs.get('Name', '').lstrip('/'),
+        status=(attrs.get('State') or {}).get('Status'),
+        labels=config.get('Labels') or {},
+        env=dict(item.split('=', 1) for item in config.get('Env') or [] if '=' in item),
+        ports=ports,
+        mounts=[
+            (mount.get('Source'), mount.get('Destination'))
+            for mount in attrs.get('Mounts') or [] if mount.get('Type') == 'bind'
+        ],
+        networks={
+            name: network.get('IPAddress')
+            for name, network in (network_settings.get('Networks') or {}).items()
+        },
+        image=config.get('Image'),
+        image_id=attrs.get('Image'),
+    )
+
+
+def _from_summary(container):
+    """ContainerInfo from a sparse ``docker ps`` entry (no environment)"""
+    attrs = container.attrs
+    return ContainerInfo(
+        id=container.id,
+        name=(attrs.get('Names') or [''])[0].lstrip('/'),
+        status=attrs.get('State'),
+        labels=attrs.get('Labels') or {},
+        ports={
+            f"{port['PrivatePort']}/{port['Type']}": port['PublicPort']
+            for port in attrs.get('Ports') or [] if port.get('PublicPort')
+        },
+        mounts=[
+            (mount.get('Source'), mount.get('Destination'))
+            for mount in attrs.get('Mounts') or [] if mount.get('Type') == 'bind'
+        ],
+        networks={
+            name: network.get('IPAddress')
+            for name, network in ((attrs.get('NetworkSettings') or {}).get('Networks') or {}).items()
+        },
+        image=attrs.get('Image'),
+        image_id=attrs.get('ImageID'),
+    )
+
+
+class DockerRuntime(ContainerRuntime):
+    """Runs workspace containers on the Docker daemon through the shared docker-py clients"""
+    name = 'docker'
+
+    def __init__(self, provider=None):
+        # The process-wide clients of the local daemon unless given another daemon's
+        self.provider = provider or docker_client.provider
+
+    @property
+    def client(self):
+        return self.provider.get()
+
+    @property
+    def shares_host_filesystem(self):
+        # docker-py rewrites unix:// and npipe:// sockets to these URLs
+        return self.client.api.base_url in ('http+docker://localhost', 'http+docker://localnpipe')
+
+    @_translate_errors
+    def ping(self):
+        return self.client.ping()
+
+    @_translate_errors
+    def create(self, config, start=True):
+        if start:
+            container = self.client.containers.run(**dict(config, detach=True))
+        else:
+            container = self.client.containers.create(**config)
+        container.reload()
+        return _from_container(container)
+
+    @_translate_errors
+    def start(self, container_id):
+        self.client.api.start(container_id)
+
+    @_translate_errors
+    def stop(self, container_id, timeout=10):
+        self.client.api.stop(container_id, timeout=timeout)
+
+    @_translate_errors
+    def pause(self, container_id):
+        self.client.api.pause(container_id)
+
+    @_translate_errors
+    def unpause(self, container_id):
+        self.client.api.unpause(container_id)
+
+    @_translate_errors
+    def remove(self, container_id, force=False):
+        self.client.api.remove_container(container_id, force=force)
+
+    @_translate_errors
+    def rename(self, container_id, name):
+        self.client.api.rename(container_id, name)
+
+    @_translate_errors
+    def inspect(self, container_id):
+        return _from_container(self.client.containers.get(container_id))
+
+    @_translate_errors
+    def list(self, name=None, label=None, status=None, details=False):
+        filters = {}
+        if name:
+            filters['name'] = name
+        if label:
+            filters['label'] = label
+        if status:
+            filters['status'] = status
+        # sparse avoids one inspect request per container
+        containers = self.client.containers.list(all=True, sparse=not details, filters=filters)
+        return [_from_container(c) if details else _from_summary(c) for c in containers]
+
+    @_translate_errors
+    def statuses(self, container_ids):
+        if not container_ids:
+            return {}
+        containers = self.client.containers.list(all=True, sparse=True, filters={'id': list(container_ids)})
+        return {container.id: container.status for container in containers}
+
+    @_translate_errors
+    def logs(self, container_id, tail=100):
+        output = self.client.api.logs(container_id, tail=tail, timestamps=True)
+        return output.decode('utf-8', errors='replace').splitlines()
+
+    @_translate_errors
+    def follow_logs(self, container_id, tail=0):
+        # A long-lived request, so it goes through the streaming client
+        return self.provider.get(streaming=True).api.logs(
+            container_id, stream=True, follow=True, timestamps=True, tail=tail
+        )
+
+    @_translate_errors
+    def events(self, since=None, actions=None):
+        filters = {'type': 'container'}
+        if actions:
+            filters['event'] = list(actions)
+        return self.provider.get(streaming=True).events(decode=True, since=since, filters=filters)
+
+    @_translate_errors
+    def stats(self, container_id):
+        return self.client.api.stats(container_id, stream=False)
+
+    @_translate_errors
+    def follow_stats(self, container_id):
+        return self.provider.get(streaming=True).api.stats(container_id, stream=True, decode=True)
+
+    @_translate_errors
+    def exec(self, container_id, command, user=None):
+        result = self.client.containers.get(container_id).exec_run(command, user=user or '')
+        return result.exit_code, result.output
+
+    @_translate_errors
+    def put_archive(self, container_id, path, data):
+        return self.client.api.put_archive(container_id, path, data)
+
+    @_translate_errors
+    def ensure_network(self, name):
+        try:
+            self.client.networks.get(name)
+        except docker.errors.NotFound:
+            self.client.networks.create(name, driver='bridge')
+
+    @_translate_errors
+    def image(self, reference):
+        try:
+            image = self.client.images.get(reference)
+        except docker.errors.ImageNotFound:
+            return None
+        return ImageInfo(image.id, image.tags, image.attrs.get('Size'))
+
+    @_translate_errors
+    def pull(self, reference):
+        image = self.client.images.pull(reference)
+        return ImageInfo(image.id, image.tags, image.attrs.get('Size'))
+
+    def build(self, path, tag, labels=None):
+        try:
+            yield from self.client.api.build(
+                path=path, tag=tag, rm=True, forcerm=True, decode=True, labels=labels or {}
+            )
+        except DockerException as e:
+            raise ContainerRuntimeError(str(e)) from e
@@ -0,0 +1,399 @@
+import os
+import time
+import queue
+import random
+import hashlib
+import secrets
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from .base import ContainerInfo, ContainerNotFound, ContainerRuntime, ContainerRuntimeError, ImageInfo
+
+# Operations that change state; these are the ones that can be made to fail
+MUTATING_OPERATIONS = {
+    'create', 'start', 'stop', 'pause', 'unpause', 'remove', 'rename',
+    'exec', 'put_archive', 'pull', 'build',
+}
+
+
+def _image_id(reference):
+    return f"sha256:{hashlib.sha256(reference.encode()).hexdigest()}"
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class _FakeContainer:
+    def __init__(self, info, config):
+        self.info = info
+        self.config = config
+        self.log_lines = []
+        self.archive_bytes = 0
+        self.cpu_total = 0
+        self.system_total = 0
+        self.changed = threading.Condition()
+
+
+class _FakeLogStream:
+    """Closable iterator over a fake container's log lines, like docker-py's CancellableStream"""
+
+    def __init__(self, container, tail):
+        self.container = container
+        self.position = max(len(container.log_lines) - tail, 0) if tail else len(container.log_lines)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.container.changed:
+            while not self.closed:
+                if self.position < len(self.container.log_lines):
+                    line = self.container.log_lines[self.position]
+                    self.position += 1
+                    return line + b'\n'
+                if self.container.info.status not in ('running', 'paused'):
+                    break
+                self.container.changed.wait(1)
+        raise StopIteration
+
+    def close(self):
+        self.closed = True
+        with self.container.changed:
+            self.container.changed.notify_all()
+
+
+class _FakeEventStream:
+    """Closable iterator over a fake runtime's container events, like docker-py's events()"""
+
+    def __init__(self, runtime, since, actions):
+        self.runtime = runtime
+        self.actions = set(actions or ())
+        self._queue = queue.Queue()
+        with runtime._lock:
+            runtime._subscribers.append(self)
+            backlog = [event for event in runtime._events if since is not None and event['time'] >= since]
+        for event in backlog:
+            self.push(event)
+
+    def push(self, event):
+        if not self.actions or event['Action'] in self.actions:
+            self._queue.put(event)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self._queue.get()
+        if event is None:
+            raise StopIteration
+        return event
+
+    def close(self):
+        with self.runtime._lock:
+            if self in self.runtime._subscribers:
+                self.runtime._subscribers.remove(self)
+        self._queue.put(None)
+
+
+class FakeRuntime(ContainerRuntime):
+    """
+    An in-memory container runtime for load tests and CI without Docker.
+
+    Containers, images and networks only exist in this process. Every call
+    sleeps for its configured latency (``latencies`` per operation, falling
+    back to ``latency``, varied by +/- ``jitter`` as a fraction), and
+    state-changing calls fail with ContainerRuntimeError at ``failure_rate``.
+    Semantics follow Docker closely enough for DockerService: names are
+    unique, a paused container must be unpaused to start, removing a
+    running one needs ``force``, starting one creates missing bind-mount
+    sources on this host, and stats documents have Docker's shape.
+    """
+    name = 'fake'
+    shares_host_filesystem = True
+
+    def __init__(self, latency=0.0, latencies=None, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._containers = {}
+        self._images = {}
+        self._networks = set()
+        self._addresses = 1
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=1000)
+        self._subscribers = []
+        self.calls = {}
+
+    def _operation(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            delay = self.latencies.get(operation, self.latency)
+            if delay and self.jitter:
+                delay *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            fail = operation in MUTATING_OPERATIONS and self.failure_rate and self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ContainerRuntimeError(f"Simulated {operation} failure")
+
+    def _get(self, container_id):
+        container = self._containers.get(container_id)
+        if container is None:
+            # Docker accepts names and id prefixes too
+            for candidate in self._containers.values():
+                if candidate.info.name == container_id or candidate.info.id.startswith(container_id):
+                    return candidate
+            raise ContainerNotFound(f"No such container: {container_id}")
+        return container
+
+    def _set_status(self, container, status, log_line):
+        with container.changed:
+            container.info.status = status
+            container.log_lines.append(f"{_now()} {log_line}".encode())
+            container.changed.notify_all()
+
+    def _emit(self, container, *actions):
+        for action in actions:
+            event = {
+                'Type': 'container',
+                'Action': action,
+                'Actor': {'ID': container.info.id, 'Attributes': {'name': container.info.name}},
+                'time': int(time.time()),
+            }
+            with self._lock:
+                self._events.append(event)
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber.push(event)
+
+    def _run(self, container):
+        # Like dockerd, resolve bind sources by path at every start
+        for source in (container.config.get('volumes') or {}):
+            os.makedirs(source, exist_ok=True)
+        self._set_status(container, 'running', 'HTTP server listening on http://0.0.0.0:8080/')
+        self._emit(container, 'start')
+
+    def ping(self):
+        self._operation('ping')
+        return True
+
+    def create(self, config, start=True):
+        self._operation('create')
+        with self._lock:
+            name = config.get('name') or f"fake_{secrets.token_hex(4)}"
+            if any(container.info.name == name for container in self._containers.values()):
+                raise ContainerRuntimeError(f"Conflict. The container name \"/{name}\" is already in use")
+            container_id = hashlib.sha256(secrets.token_bytes(16)).hexdigest()
+            image = self._images.get(config.get('image'))
+            networks = {}
+            if config.get('network'):
+                self._addresses += 1
+                networks[config['network']] = f"10.{self._addresses >> 16 & 255}.{self._addresses >> 8 & 255}.{self._addresses & 255}"
+            info = ContainerInfo(
+                id=container_id,
+                name=name,
+                status='created',
+                labels=dict(config.get('labels') or {}),
+                env=dict(config.get('environment') or {}),
+                ports={port: int(host_port) for port, host_port in (config.get('ports') or {}).items()},
+                mounts=[(source, volume['bind']) for source, volume in (config.get('volumes') or {}).items()],
+                networks=networks,
+                image=config.get('image'),
+                image_id=image.id if image else _image_id(config.get('image') or ''),
+            )
+            container = self._containers[container_id] = _FakeContainer(info, config)
+        self._emit(container, 'create')
+        if start:
+            self._run(container)
+        return self._copy(container)
+
+    def start(self, container_id):
+        self._operation('start')
+        container = self._get(container_id)
+        if container.info.status == 'paused':
+            raise ContainerRuntimeError(f"Cannot start paused container {container_id}, try unpause instead")
+        if container.info.status != 'running':
+            self._run(container)
+
+    def stop(self, container_id, timeout=10):
+        self._operation('stop')
+        container = self._get(container_id)
+        if container.info.status in ('running', 'paused'):
+            self._set_status(container, 'exited', 'Received SIGTERM, shutting down')
+            self._emit(container, 'die', 'stop')
+
+    def pause(self, container_id):
+        self._operation('pause')
+        container = self._get(container_id)
+        if container.info.status != 'running':
+            raise ContainerRuntimeError(f"Container {container_id} is not running")
+        container.info.status = 'paused'
+        self._emit(container, 'pause')
+
+    def unpause(self, container_id):
+        self._operation('unpause')
+        container = self._get(container_id)
+        if container.info.status != 'paused':
+            raise ContainerRuntimeError(f"Container {container_id} is not paused")
+        container.info.status = 'running'
+        self._emit(container, 'unpause')
+
+    def remove(self, container_id, force=False):
+        self._operation('remove')
+        container = self._get(container_id)
+        if container.info.status in ('running', 'paused') and not force:
+            raise ContainerRuntimeError(f"Cannot remove running container {container_id}, stop it first")
+        with self._lock:
+            self._containers.pop(container.info.id, None)
+        self._set_status(container, 'removing', 'Removed')
+        self._emit(container, 'destroy')
+
+    def rename(self, container_id, name):
+        self._operation('rename')
+        container = self._get(container_id)
+        with self._lock:
+            if any(other.info.name == name for other in self._containers.values() if other is not container):
+                raise ContainerRuntimeError(f"Conflict. The container name \"/{name}\" is already in use")
+            container.info.name = name
+        self._emit(container, 'rename')
+
+    def _copy(self, container):
+        info = container.info
+        return ContainerInfo(
+            info.id, info.name, info.status, dict(info.labels), dict(info.env),
+            dict(info.ports), list(info.mounts), dict(info.networks), info.image, info.image_id,
+        )
+
+    def inspect(self, container_id):
+        self._operation('inspect')
+        return self._copy(self._get(container_id))
+
+    def list(self, name=None, label=None, status=None, details=False):
+        self._operation('list')
+        with self._lock:
+            containers = list(self._containers.values())
+        results = []
+        for container in containers:
+            info = container.info
+            if name and name not in info.name:
+                continue
+            if label:
+                key, _, value = label.partition('=')
+                if key not in info.labels or (value and info.labels[key] != value):
+                    continue
+            if status and info.status != status:
+                continue
+            results.append(self._copy(container))
+        return results
+
+    def statuses(self, container_ids):
+        self._operation('statuses')
+        with self._lock:
+            return {
+                container_id: self._containers[container_id].info.status
+                for container_id in container_ids if container_id in self._containers
+            }
+
+    def logs(self, container_id, tail=100):
+        self._operation('logs')
+        container = self._get(container_id)
+        with container.changed:
+            lines = container.log_lines[-tail:] if tail else list(container.log_lines)
+        return [line.decode('utf-8', errors='replace') for line in lines]
+
+    def follow_logs(self, container_id, tail=0):
+        self._operation('follow_logs')
+        return _FakeLogStream(self._get(container_id), tail)
+
+    def events(self, since=None, actions=None):
+        self._operation('events')
+        return _FakeEventStream(self, since, actions)
+
+    def stats(self, container_id):
+        self._operation('stats')
+        container = self._get(container_id)
+        previous = (container.cpu_total, container.system_total)
+        if container.info.status == 'running':
+            container.cpu_total += self._random.randint(0, 50_000_000)
+        container.system_total += 1_000_000_000
+        return {
+            'read': _now(),
+            'cpu_stats': {
+                'cpu_usage': {'total_usage': container.cpu_total},
+                'system_cpu_usage': container.system_total,
+                'online_cpus': 1,
+            },
+            'precpu_stats': {
+                'cpu_usage': {'total_usage': previous[0]},
+                'system_cpu_usage': previous[1],
+            },
+            'memory_stats': {'usage': 200 * 1024 ** 2, 'limit': 4 * 1024 ** 3, 'stats': {'inactive_file': 0}},
+            'networks': {'eth0': {'rx_bytes': 0, 'tx_bytes': 0}},
+            'blkio_stats': {'io_service_bytes_recursive': []},
+        }
+
+    def follow_stats(self, container_id):
+        container = self._get(container_id)
+        while container.info.status in ('running', 'paused'):
+            yield self.stats(container_id)
+            time.sleep(1)
+
+    def exec(self, container_id, command, user=None):
+        self._operation('exec')
+        container = self._get(container_id)
+        if container.info.status != 'running':
+            raise ContainerRuntimeError(f"Container {container_id} is not running")
+        return 0, b''
+
+    def put_archive(self, container_id, path, data):
+        self._operation('put_archive')
+        container = self._get(container_id)
+        # Drain streamed archives so the cost of producing them is measured too
+        size = len(data) if isinstance(data, (bytes, bytearray)) else sum(len(chunk) for chunk in data)
+        container.archive_bytes += size
+        return True
+
+    def ensure_network(self, name):
+        self._operation('ensure_network')
+        with self._lock:
+            self._networks.add(name)
+
+    def image(self, reference):
+        self._operation('image')
+        with self._lock:
+            return self._images.get(reference)
+
+    def pull(self, reference):
+        self._operation('pull')
+        return self._add_image(reference)
+
+    def build(self, path, tag, labels=None):
+        self._operation('build')
+        yield {'stream': f"Step 1/1 : fake build of {tag}\n"}
+        self._add_image(tag)
+        yield {'stream': f"Successfully tagged {tag}\n"}
+
+    def _add_image(self, reference):
+        with self._lock:
+            image = self._images.get(reference)
+            if image is None:
+                image = ImageInfo(_image_id(reference), [reference], 0)
+                self._images[reference] = image
+            return image
+
+    def replace_image(self, reference):
+        """Point a tag at a new image id, like pulling an updated ``:latest``"""
+        with self._lock:
+            image = self._images[reference] = ImageInfo(_image_id(reference + secrets.token_hex(8)), [reference], 0)
+            return image
+
+    def write_log(self, container_id, message):
+        """Append a timestamped line to a container's output, like the process inside printing it"""
+        container = self._get(container_id)
+        with container.changed:
+            container.log_lines.append(f"{_now()} {message}".encode())
+            container.changed.notify_all()
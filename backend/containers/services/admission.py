@@ -0,0 +1,182 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from django.conf import settings
+from workspaces.models import Workspace
+
+logger = logging.getLogger(__name__)
+
+# Workspace states that count towards the per-user quota (provisioning ones are about to run)
+RUNNING_STATES = ('provisioning', 'created', 'running')
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user already has as many running workspaces as allowed"""
+
+
+class AdmissionTimeout(Exception):
+    """Raised when an operation waited too long for a slot, or the queue is full"""
+
+
+class _Waiter:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.granted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """
+    Bounds how much container work the process puts on the daemon at once.
+
+    At most ADMISSION_MAX_IN_FLIGHT container operations (start, stop,
+    create, delete, suspend) run concurrently; the rest wait in a fair
+    queue that hands free slots to users in turn, so one user's burst of
+    starts does not hold everyone else back. Waiting longer than
+    ADMISSION_QUEUE_TIMEOUT seconds, or arriving at a queue of
+    ADMISSION_MAX_QUEUE waiters, fails with AdmissionTimeout.
+
+    Operations that bring a container up also count against the owner's
+    WORKSPACE_MAX_RUNNING_PER_USER quota (workspaces provisioning or
+    running, plus starts in flight) and fail with QuotaExceeded before
+    queueing. A limit of 0 disables it.
+    """
+    _in_process = None
+    _in_process_lock = threading.Lock()
+
+    def __init__(self, max_in_flight=None, max_running_per_user=None, queue_timeout=None, max_queue=None):
+        self.max_in_flight = max_in_flight if max_in_flight is not None else settings.ADMISSION_MAX_IN_FLIGHT
+        self.max_running_per_user = (
+            max_running_per_user if max_running_per_user is not None else settings.WORKSPACE_MAX_RUNNING_PER_USER
+        )
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT
+        self.max_queue = max_queue if max_queue is not None else settings.ADMISSION_MAX_QUEUE
+        self._lock = threading.Lock()
+        # user id -> waiting operations; users are served round-robin in this order
+        self._queues = OrderedDict()
+        self._depth = 0
+        self._in_flight = 0
+        self._starting = defaultdict(int)
+        self._waits = deque(maxlen=1000)
+        self._counters = defaultdict(int)
+
+    @classmethod
+    def in_process(cls):
+        """The controller shared by every DockerService in this process"""
+        with cls._in_process_lock:
+            if cls._in_process is None:
+                cls._in_process = cls()
+            return cls._in_process
+
+    @contextmanager
+    def admit(self, workspace, operation, starts=False):
+        """Hold a slot for one container operation on a workspace"""
+        user_id = workspace.owner_id
+        if starts:
+            self._check_quota(user_id, exclude=workspace, reserve=True)
+        try:
+            waited = self._acquire(user_id, operation)
+            try:
+                yield waited
+            finally:
+                self._release()
+        finally:
+            if starts:
+                with self._lock:
+                    self._starting[user_id] -= 1
+                    if not self._starting[user_id]:
+                        del self._starting[user_id]
+
+    def check_quota(self, user_id, exclude=None):
+        """Raise QuotaExceeded if the user cannot bring up another workspace"""
+        self._check_quota(user_id, exclude)
+
+    def _check_quota(self, user_id, exclude=None, reserve=False):
+        if not self.max_running_per_user:
+            running = 0
+        else:
+            running = Workspace.objects.filter(owner_id=user_id, container_status__in=RUNNING_STATES)
+            if exclude is not None:
+                running = running.exclude(pk=exclude.pk)
+            running = running.count()
+        with self._lock:
+            if self.max_running_per_user and running + self._starting[user_id] >= self.max_running_per_user:
+                self._counters['quota_rejected'] += 1
+                raise QuotaExceeded(
+                    f"You can run at most {self.max_running_per_user} workspaces at a time; stop one first"
+                )
+            if reserve:
+                self._starting[user_id] += 1
+
+    def _acquire(self, user_id, operation):
+        started = time.monotonic()
+        with self._lock:
+            if not self.max_in_flight or (self._in_flight < self.max_in_flight and not self._depth):
+                self._in_flight += 1
+                self._counters['admitted'] += 1
+                self._waits.append(0.0)
+                return 0.0
+            if self.max_queue and self._depth >= self.max_queue:
+                self._counters['rejected'] += 1
+                raise AdmissionTimeout(f"Too many container operations queued ({self._depth}), try again later")
+            waiter = _Waiter(user_id)
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            self._depth += 1
+            self._counters['queued'] += 1
+
+        if not waiter.event.wait(self.queue_timeout):
+            with self._lock:
+                if not waiter.granted:
+                    queue = self._queues[user_id]
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[user_id]
+                    self._depth -= 1
+                    self._counters['timed_out'] += 1
+                    raise AdmissionTimeout(
+                        f"Waited {self.queue_timeout:g}s for a slot to {operation}, the container host is busy"
+                    )
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._counters['admitted'] += 1
+            self._waits.append(waited)
+        if waited > 1:
+            logger.info(f"{operation} for user {user_id} waited {waited:.1f}s for admission")
+        return waited
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            # Hand free slots to the user at the front, then move them to the back
+            while self._queues and (not self.max_in_flight or self._in_flight < self.max_in_flight):
+                user_id, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(user_id)
+                else:
+                    del self._queues[user_id]
+                self._depth -= 1
+                self._in_flight += 1
+                waiter.granted = True
+                waiter.event.set()
+
+    def stats(self):
+        """Queue depth, in-flight operations, recent wait times and counters"""
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self._depth,
+                'queued_users': len(self._queues),
+                'starting': sum(self._starting.values()),
+                'max_running_per_user': self.max_running_per_user,
+                **{name: self._counters[name] for name in ('admitted', 'queued', 'timed_out', 'rejected', 'quota_rejected')},
+            }
+        for q in (50, 95, 99):
+            stats[f"wait_p{q}_ms"] = round(waits[min(len(waits) * q // 100, len(waits) - 1)] * 1000, 1) if waits else None
+        stats['wait_max_ms'] = round(waits[-1] * 1000, 1) if waits else None
+        return stats
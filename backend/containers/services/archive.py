@@ -0,0 +1,126 @@
+import os
+import queue
+import fnmatch
+import logging
+import tarfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class ArchiveTooLarge(Exception):
+    """Raised when a directory exceeds the configured archive size limit"""
+
+
+def _is_excluded(relative_path, excludes):
+    name = os.path.basename(relative_path)
+    return any(
+        fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern)
+        for pattern in excludes
+    )
+
+
+def iter_entries(source, excludes=()):
+    """Yield (path, arcname) for every file and directory under source, pruning excluded ones"""
+    for root, dirs, files in os.walk(source):
+        # Prune in place so os.walk never descends into excluded directories
+        kept_dirs = []
+        for d in dirs:
+            arcname = os.path.relpath(os.path.join(root, d), source)
+            if not _is_excluded(arcname, excludes):
+                kept_dirs.append(d)
+        dirs[:] = kept_dirs
+
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            arcname = os.path.relpath(path, source)
+            if name in files and _is_excluded(arcname, excludes):
+                continue
+            yield path, arcname
+
+
+def archive_size(source, excludes=()):
+    """Total size in bytes of the regular files that would be archived"""
+    total = 0
+    for path, _ in iter_entries(source, excludes):
+        if os.path.isfile(path) and not os.path.islink(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class _QueueWriter:
+    """File-like object that hands tarfile's output to the consuming generator"""
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(bytes(data), timeout=0.5)
+                return len(data)
+            except queue.Full:
+                continue
+        raise IOError('Archive consumer went away')
+
+
+def stream_tar(source, excludes=(), gzip=False, max_bytes=None, max_buffered_chunks=16):
+    """
+    Generate a tar archive of ``source`` lazily, in chunks.
+
+    The archive is written by a background thread into a bounded queue, so
+    memory use stays at a few tarfile records regardless of the size of the
+    directory. Suitable as the ``data`` argument of ``Container.put_archive``.
+    Raises ArchiveTooLarge before streaming anything if the files exceed
+    ``max_bytes``.
+    """
+    if max_bytes:
+        size = archive_size(source, excludes)
+        if size > max_bytes:
+            raise ArchiveTooLarge(f"{source} is {size} bytes, over the {max_bytes} byte limit")
+    return _generate_tar(source, excludes, gzip, max_bytes, max_buffered_chunks)
+
+
+def _generate_tar(source, excludes, gzip, max_bytes, max_buffered_chunks):
+    chunks = queue.Queue(maxsize=max_buffered_chunks)
+    cancelled = threading.Event()
+    errors = []
+
+    def produce():
+        written = 0
+        try:
+            mode = 'w|gz' if gzip else 'w|'
+            with tarfile.open(fileobj=_QueueWriter(chunks, cancelled), mode=mode) as tar:
+                for path, arcname in iter_entries(source, excludes):
+                    if os.path.isfile(path) and not os.path.islink(path):
+                        written += os.path.getsize(path)
+                        # Files may grow between the size check and streaming
+                        if max_bytes and written > max_bytes:
+                            raise ArchiveTooLarge(f"{source} grew over the {max_bytes} byte limit")
+                    tar.add(path, arcname=arcname, recursive=False)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            while not cancelled.is_set():
+                try:
+                    chunks.put(_DONE, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    producer = threading.Thread(target=produce, name='tar-stream', daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
+        producer.join()
@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import threading
+import docker
+from django.conf import settings
+from docker.errors import DockerException
+
+logger = logging.getLogger(__name__)
+
+
+class DockerClientProvider:
+    """
+    Process-wide Docker clients, connected on first use.
+
+    Every DockerService, the gateway resolver, the event watcher and the
+    metrics sampler share these instead of opening (and pinging) a client
+    each. Requests go through one connection pool of DOCKER_MAX_POOL_SIZE;
+    long-lived follow streams (events, logs, stats) get their own pool
+    without a read timeout, so they neither starve short calls nor time out
+    while a container is quiet. The daemon is pinged again when the client
+    has not been checked for DOCKER_HEALTH_CHECK_INTERVAL seconds, and the
+    client is rebuilt if the ping fails (e.g. after a daemon restart).
+
+    ``base_url`` connects to a specific daemon (e.g. a registered DockerNode)
+    instead of the one configured by the DOCKER_HOST environment.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self._clients = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, streaming=False):
+        kind = 'streaming' if streaming else 'api'
+        with self._lock:
+            client = self._clients.get(kind)
+            if client is not None and time.monotonic() - self._checked_at[kind] < settings.DOCKER_HEALTH_CHECK_INTERVAL:
+                return client
+            if client is not None:
+                try:
+                    client.ping()
+                    self._checked_at[kind] = time.monotonic()
+                    return client
+                except Exception as e:
+                    logger.warning(f"Docker daemon stopped answering, reconnecting: {str(e)}")
+                    self._discard(kind)
+            client = self._connect(streaming)
+            self._clients[kind] = client
+            self._checked_at[kind] = time.monotonic()
+            return client
+
+    def is_available(self):
+        try:
+            self.get()
+            return True
+        except DockerException:
+            return False
+
+    def reset(self):
+        """Close all clients; the next use reconnects"""
+        with self._lock:
+            for kind in list(self._clients):
+                self._discard(kind)
+
+    def _discard(self, kind):
+        client = self._clients.pop(kind, None)
+        self._checked_at.pop(kind, None)
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def _connect(self, streaming):
+        options = {
+            'timeout': None if streaming else settings.DOCKER_TIMEOUT,
+            'max_pool_size': settings.DOCKER_STREAM_POOL_SIZE if streaming else settings.DOCKER_MAX_POOL_SIZE,
+        }
+        try:
+            if self.base_url:
+                client = docker.DockerClient(base_url=self.base_url, **options)
+            elif os.name == 'nt':
+                # Windows - explicitly use named pipe
+                client = docker.DockerClient(base_url='npipe:////./pipe/docker_engine', **options)
+            else:
+                client = docker.from_env(**options)
+            client.ping()
+        except Exception as e:
+            error_msg = str(e)
+            if os.name == 'nt' and not self.base_url:
+                error_msg = "Error connecting to Docker. Please ensure Docker Desktop is running and WSL integration is disabled."
+            raise DockerException(f"Error initializing Docker client: {error_msg}")
+        logger.info(f"Connected to Docker daemon {self.base_url or ''} ({'streaming' if streaming else 'api'} client)")
+        return client
+
+
+provider = DockerClientProvider()
+
+
+def get_client(streaming=False):
+    """The shared Docker client; ``streaming`` for calls that follow a stream indefinitely"""
+    return provider.get(streaming)
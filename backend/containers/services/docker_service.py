@@ -1,145 +1,151 @@
 import os
-import docker
 import logging
+import functools
 import secrets
 import subprocess
 import tempfile
 import time
+import threading
 import platform
 from pathlib import Path
 from django.conf import settings
-from docker.errors import DockerException
+from django.utils import timezone
 import shutil
-import tarfile
-from io import BytesIO
+from collections import defaultdict
+from ..models import DockerNode
+from ..runtime import ContainerNotFound, ContainerRuntimeError, get_runtime, runtime_for_node
+from .archive import ArchiveTooLarge, stream_tar
+from .warm_pool import WarmPool
+from .image_cache import ImageCache, ImageNotBuilt
+from .ports import PortAllocator
+from .log_stream import LogStreamHub, aiter_log_events, iter_log_events
+from .metrics import MetricsSampler
+from .scheduler import NodeScheduler
+from .admission import AdmissionController
+from .stages import stage
+from .recipes import BASE_IMAGE, base_dockerfile, get_recipe
 
 logger = logging.getLogger(__name__)
 
-class DockerService:
-    def __init__(self, workspace_root):
-        """Initialize Docker service"""
-        self.workspace_root = workspace_root
-        self.is_available = False
-        self.client = None
-        self._initialize_docker_client()
-
-    def _initialize_docker_client(self):
-        """Initialize Docker client based on platform"""
-        try:
-            if os.name == 'nt':
-                # Windows - explicitly use named pipe
-                self.client = docker.DockerClient(
-                    base_url='npipe:////./pipe/docker_engine',
-                    timeout=120
-                )
-                self.client.ping()  # Test connection
-                self.is_available = True
-                logger.info("Connected to Docker daemon via Windows named pipe")
-            else:
-                # Unix-like systems - use default socket
-                self.client = docker.from_env(timeout=120)
-                self.client.ping()
-                self.is_available = True
-                logger.info("Connected to Docker daemon via Unix socket")
-        except Exception as e:
-            error_msg = str(e)
-            if os.name == 'nt':
-                error_msg = "Error connecting to Docker. Please ensure Docker Desktop is running and WSL integration is disabled."
-            raise DockerException(f"Error initializing Docker client: {error_msg}")
-
-    def _find_free_port(self, start=8000, end=9000):
-        """Find a free port in the given range"""
-        import socket
-        for port in range(start, end):
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                try:
-                    s.bind(('', port))
-                    return port
-                except OSError:
-                    continue
-        raise RuntimeError(f"No free ports found in range {start}-{end}")
 
-    def create_workspace_container(self, workspace_id, cpu_count=2, memory_limit="4g", workspace_dir="/workspace", image="codercom/code-server:latest"):
-        """Create a new container for a workspace"""
-        try:
-            # Generate container name and password
-            container_name = f"workspace_{workspace_id}"
-            password = secrets.token_urlsafe(16)
-
-            # Check if container already exists
-            try:
-                existing_container = self.client.containers.get(container_name)
-                logger.info(f"Found existing container {container_name}")
-                
-                # Remove existing container if it exists
-                existing_container.remove(force=True)
-                logger.info(f"Removed existing container {container_name}")
-            except docker.errors.NotFound:
-                pass
-
-            # Find a free port
-            port = self._find_free_port()
-
-            # Resource limits
-            cpu_period = 100000
-            cpu_quota = int(cpu_count * cpu_period)
+def _on_workspace_node(place=False):
+    """
+    Run a workspace operation on the DockerService of the node the workspace
+    is placed on. With ``place``, a workspace without a container or a node
+    is placed first (a no-op when no nodes are registered).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, workspace, *args, **kwargs):
+            if place and self.node is None and not workspace.node_id and not workspace.container_id:
+                self.place(workspace)
+            service = self.for_workspace(workspace)
+            if service is not self:
+                return getattr(service, method.__name__)(workspace, *args, **kwargs)
+            return method(self, workspace, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _admitted(starts=False):
+    """
+    Run a container operation under the admission controller; ``starts``
+    operations also count against the owner's running-workspace quota.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, workspace, *args, **kwargs):
+            with self.admission.admit(workspace, method.__name__, starts=starts):
+                return method(self, workspace, *args, **kwargs)
+        return wrapper
+    return decorator
 
-            # Create container
-            container = self.client.containers.run(
-                image=image,
-                name=container_name,
-                detach=True,
-                environment={
-                    "PASSWORD": password,
-                    "WORKSPACE_ID": str(workspace_id)
-                },
-                volumes={
-                    self.workspace_root: {
-                        'bind': workspace_dir,
-                        'mode': 'rw'
-                    }
-                },
-                ports={'8080/tcp': port},  # Map container's 8080 to host's free port
-                cpu_period=cpu_period,
-                cpu_quota=cpu_quota,
-                mem_limit=memory_limit,
-                restart_policy={
-                    'Name': 'unless-stopped'
-                }
-            )
 
-            logger.info(f"Created container {container_name} with ID {container.id} on port {port}")
-
-            # Construct container URL
-            container_url = f'http://localhost:{port}?password={password}'
-
-            # Return container info
-            return {
-                'container_id': container.id,
-                'name': container_name,
-                'password': password,
-                'port': port,
-                'container_url': container_url,
-                'status': 'created'
-            }
-
-        except Exception as e:
-            error_msg = f"Failed to create workspace container: {str(e)}"
-            logger.error(error_msg)
-            return {'error': error_msg, 'status': 'failed'}
+class DockerService:
+    _in_process = None
+    _in_process_lock = threading.Lock()
+    _nodes = {}
+
+    def __init__(self, workspace_root=None, runtime=None, node=None):
+        """Initialize Docker service; the daemon is not contacted until first use"""
+        self.workspace_root = workspace_root or settings.WORKSPACE_ROOT
+        self._runtime = runtime
+        # The DockerNode this service manages, or None for the default runtime
+        self.node = node
+        self.scheduler = NodeScheduler()
+        self.warm_pool = WarmPool(self)
+        self.image_cache = ImageCache(self)
+        self.ports = PortAllocator(node=node)
+        self.log_streams = LogStreamHub(self)
+        self.metrics = MetricsSampler(runtime)
+        self._ports_reclaimed = False
+        self._network_ready = False
+        # container id -> (docker status or None if gone, expiry), shared by all requests
+        self._status_cache = {}
+        self._status_lock = threading.Lock()
+
+    @classmethod
+    def in_process(cls):
+        """The DockerService shared by everything in this process (caches, streams, metrics)"""
+        with cls._in_process_lock:
+            if cls._in_process is None:
+                cls._in_process = cls()
+            return cls._in_process
+
+    @classmethod
+    def for_node(cls, node):
+        """The DockerService of a registered node (a DockerNode or its id), shared by the process"""
+        node_id = node.pk if isinstance(node, DockerNode) else node
+        with cls._in_process_lock:
+            service = cls._nodes.get(node_id)
+        if service is None:
+            if not isinstance(node, DockerNode):
+                node = DockerNode.objects.get(pk=node_id)
+            with cls._in_process_lock:
+                service = cls._nodes.setdefault(node_id, cls(runtime=runtime_for_node(node), node=node))
+        return service
+
+    def for_workspace(self, workspace):
+        """The DockerService managing a workspace's container: its node's, or this one"""
+        if self.node is not None or not workspace.node_id:
+            return self
+        return self.for_node(workspace.node_id)
+
+    def place(self, workspace):
+        """Reserve room for a workspace on a registered node; raises NoCapacity when none has any"""
+        if self.node is None:
+            self.scheduler.place(workspace)
+        return True
+
+    @property
+    def admission(self):
+        return AdmissionController.in_process()
+
+    @property
+    def runtime(self):
+        """The container runtime driver (CONTAINER_RUNTIME unless one was passed in)"""
+        return self._runtime or get_runtime()
+
+    @property
+    def is_available(self):
+        try:
+            self.runtime.ping()
+            return True
+        except ContainerRuntimeError:
+            return False
 
     def _check_docker_daemon(self):
         """Check if Docker daemon is running"""
         try:
-            if not self.client:
-                self._initialize_docker_client()
-            self.client.ping()
+            self.runtime.ping()
             return True
+        except ContainerRuntimeError:
+            raise
         except Exception as e:
             error_msg = str(e)
             if os.name == 'nt':
                 error_msg = "Docker is not running. Please ensure Docker Desktop is running."
-            raise DockerException(f"Error checking Docker daemon: {error_msg}")
+            raise ContainerRuntimeError(f"Error checking Docker daemon: {error_msg}")
 
     def _get_host_path(self, path):
         """Get the appropriate host path based on platform"""
@@ -165,116 +171,74 @@ class DockerService:
         except Exception as e:
             logger.error(f"Error checking Docker status: {e}")
 
-    def _get_image_for_workspace(self, workspace):
+    def _get_image_for_workspace(self, workspace, build=True):
         """Get the appropriate container image based on language"""
-        if not workspace.git_template:
-            return 'codercom/code-server:latest'
+        workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(workspace.id))
+        return self.resolve_image(workspace.git_template, workspace_path, build)
+
+    def resolve_image(self, template, source_dir=None, build=True):
+        """
+        Get the image for a template, building missing layers:
+        the shared ide-base apt layer, the language toolchain layer and, when the
+        template has dependency manifests in source_dir, a layer that runs its
+        build-time setup commands. With ``build=False`` only existing images
+        are looked up and the first missing layer raises ImageNotBuilt.
+        """
+        if not template:
+            return BASE_IMAGE
+
+        language = template.language.lower()
+        logger.info(f"Creating workspace for language: {language}")
+        recipe = get_recipe(language)
+        if not recipe:
+            return BASE_IMAGE
 
-        base_image = 'codercom/code-server:latest'
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
+        # Images are tagged by a hash of the Dockerfile and base image, so
+        # each layer only builds when it or something below it changed.
+        try:
+            base_tag = self.image_cache.ensure('ide-base', base_dockerfile(), BASE_IMAGE, build=build)
+            toolchain_tag = self.image_cache.ensure(
+                recipe.image_name, recipe.toolchain_dockerfile(base_tag), base_tag, build=build
+            )
+        except ImageNotBuilt:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to build custom image: {str(e)}")
+            raise  # Re-raise the exception instead of silently falling back
 
-        language = workspace.git_template.language.lower()
-        logger.info(f"Creating workspace for language: {language}")
-        
-        if language == 'go':
-            # Check if image already exists
-            try:
-                existing_image = self.client.images.get(f"ide-{language}:latest")
-                logger.info(f"Found existing image: {existing_image.tags}")
-                return f"ide-{language}:latest"
-            except Exception as e:
-                logger.info(f"No existing image found, building new one: {str(e)}")
-
-            setup_commands = [
-                'set -ex',  # Make script verbose
-                'apt-get update',
-                'apt-get install -y --no-install-recommends wget ca-certificates git curl',
-                'wget -q https://golang.org/dl/go1.21.0.linux-amd64.tar.gz',
-                'rm -rf /usr/local/go && tar -C /usr/local -xzf go1.21.0.linux-amd64.tar.gz',
-                'rm go1.21.0.linux-amd64.tar.gz',
-                'mkdir -p /home/coder/go/{bin,pkg,src}',
-                'chown -R coder:coder /home/coder/go'
-            ]
-
-            dockerfile_content = f"""
-FROM {base_image}
-
-USER root
-
-# Set environment variables first
-ENV PATH=/usr/local/go/bin:/home/coder/go/bin:/home/coder/.local/bin:/home/coder/.cargo/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
-ENV GOROOT=/usr/local/go
-ENV GOPATH=/home/coder/go
-ENV GOBIN=/home/coder/go/bin
-
-# Run setup commands
-RUN {' && '.join(setup_commands)}
-
-# Add environment variables to profile and bashrc
-RUN echo 'export PATH=/usr/local/go/bin:/home/coder/go/bin:$PATH' >> /etc/profile && \\
-    echo 'export GOROOT=/usr/local/go' >> /etc/profile && \\
-    echo 'export GOPATH=/home/coder/go' >> /etc/profile && \\
-    echo 'export GOBIN=/home/coder/go/bin' >> /etc/profile && \\
-    echo 'export PATH=/usr/local/go/bin:/home/coder/go/bin:$PATH' >> /home/coder/.bashrc && \\
-    echo 'export GOROOT=/usr/local/go' >> /home/coder/.bashrc && \\
-    echo 'export GOPATH=/home/coder/go' >> /home/coder/.bashrc && \\
-    echo 'export GOBIN=/home/coder/go/bin' >> /home/coder/.bashrc && \\
-    chown -R coder:coder /home/coder/.bashrc
-
-USER coder
-
-# Final verification
-RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
-    echo "=== Final Verification ===" && \\
-    echo "PATH=$PATH" && \\
-    echo "GOROOT=$GOROOT" && \\
-    echo "GOPATH=$GOPATH" && \\
-    ls -la /usr/local/go/bin && \\
-    which go && \\
-    go version'
-"""
-            logger.info("Writing Dockerfile...")
-            dockerfile_path = os.path.join(temp_dir, 'Dockerfile')
-            with open(dockerfile_path, 'w') as f:
-                f.write(dockerfile_content)
-
-            # Build custom image
-            tag = f"ide-{language}:latest"
-            try:
-                logger.info(f"Building custom image for {language}")
-                logger.info(f"Dockerfile contents:\n{dockerfile_content}")
-                
-                # Build the image with verbose output
-                logger.info("Starting Docker build...")
-                response = self.client.api.build(
-                    path=temp_dir,
-                    tag=tag,
-                    rm=True,
-                    forcerm=True
-                )
-                
-                # Log all build output
-                for chunk in response:
-                    if isinstance(chunk, dict):
-                        if 'stream' in chunk:
-                            log_line = chunk['stream'].strip()
-                            if log_line:
-                                logger.info(f"Build: {log_line}")
-                        elif 'error' in chunk:
-                            error_msg = chunk['error']
-                            logger.error(f"Build error: {error_msg}")
-                            raise Exception(f"Docker build failed: {error_msg}")
-                
-                # Verify image was built
-                built_image = self.client.images.get(tag)
-                logger.info(f"Successfully built image: {built_image.tags}")
-                return tag
-            except Exception as e:
-                logger.error(f"Failed to build custom image: {str(e)}")
-                raise  # Re-raise the exception instead of silently falling back
-        else:
-            return base_image
+        files = recipe.template_files(source_dir)
+        commands = recipe.template_commands(template.setup_commands)
+        if not files or not (commands or recipe.prepare_commands):
+            return toolchain_tag
+
+        try:
+            return self.image_cache.ensure(
+                f"{recipe.image_name}-template-{template.id}",
+                recipe.template_dockerfile(toolchain_tag, files, commands),
+                toolchain_tag,
+                context_files=files,
+                build=build,
+            )
+        except ImageNotBuilt:
+            raise
+        except Exception as e:
+            # The layer only sees the manifests, which some setup commands need
+            # more than; they still run in the workspace as before
+            logger.error(f"Failed to build template layer for {template.name}, using {toolchain_tag}: {str(e)}")
+            return toolchain_tag
+
+    def _daemon_is_local(self):
+        """Whether the Docker daemon shares this host's filesystem"""
+        return self.runtime.shares_host_filesystem
+
+    def _is_bind_mount_of(self, container, source_path, destination='/home/coder/project'):
+        """Check whether source_path is bind-mounted at destination in the container"""
+        if not self._daemon_is_local():
+            return False
+        for source, mount_destination in container.mounts:
+            if mount_destination == destination:
+                return os.path.realpath(source or '') == os.path.realpath(source_path)
+        return False
 
     def _initialize_container(self, container, workspace):
         """Initialize a container with template files"""
@@ -287,28 +251,53 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
                 logger.error(f"Workspace directory does not exist: {workspace_path}")
                 return False
 
-            # Copy files from workspace directory to container
+            # _create_container bind-mounts this directory at the project path, in
+            # which case the files are already there and copying is pure overhead
+            if settings.WORKSPACE_SEED_MODE != 'copy' and self._is_bind_mount_of(container, workspace_path):
+                logger.info(f"{workspace_path} is bind-mounted into container {container.id}, skipping copy")
+                return True
+
+            # Stream files from workspace directory to container; the tar is
+            # generated lazily so memory use does not grow with project size
             logger.info(f"Copying files from {workspace_path} to container")
-            tar_stream = BytesIO()
-            with tarfile.open(fileobj=tar_stream, mode='w') as tar:
-                for root, dirs, files in os.walk(workspace_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, workspace_path)
-                        tar.add(file_path, arcname=arcname)
-
-            tar_stream.seek(0)
-            if not container.put_archive('/home/coder/project', tar_stream.read()):
+            archive = stream_tar(
+                workspace_path,
+                excludes=settings.WORKSPACE_SEED_EXCLUDES,
+                gzip=settings.WORKSPACE_SEED_GZIP,
+                max_bytes=settings.WORKSPACE_SEED_MAX_BYTES,
+            )
+            with stage('seed_copy'):
+                copied = self.runtime.put_archive(container.id, '/home/coder/project', archive)
+            if not copied:
                 logger.error("Failed to copy files to container")
                 return False
 
             logger.info(f"Container {container.id} initialized successfully for workspace {workspace.id}")
             return True
 
+        except ArchiveTooLarge as e:
+            logger.error(f"Workspace {workspace.id} is too large to copy: {str(e)}")
+            return False
         except Exception as e:
             logger.error(f"Error initializing container: {str(e)}")
             return False
 
+    def _link_template_artifacts(self, container, workspace):
+        """Point the project at dependencies the template image installed at build time"""
+        recipe = get_recipe(workspace.git_template.language) if workspace.git_template else None
+        command = recipe.link_command() if recipe else None
+        if not command:
+            return
+        try:
+            exit_code, output = self.runtime.exec(container.id, ['sh', '-c', command], user='coder')
+            if exit_code:
+                logger.warning(f"Could not link template dependencies for workspace {workspace.id}: {output!r}")
+        except ContainerRuntimeError as e:
+            # The workspace still works; its dependencies are just installed again
+            logger.warning(f"Could not link template dependencies for workspace {workspace.id}: {str(e)}")
+
+    @_on_workspace_node(place=True)
+    @_admitted(starts=True)
     def initialize_container(self, workspace):
         """Initialize a new container for a workspace"""
         try:
@@ -322,14 +311,22 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             logger.info(f"Creating workspace for language: {workspace.git_template.language}")
 
             # Get image for workspace
-            image = self._get_image_for_workspace(workspace)
+            with stage('image_resolve'):
+                image = self._get_image_for_workspace(workspace)
             if not image:
                 raise Exception("No suitable image found for workspace")
             logger.info(f"Using image: {image} for workspace {workspace.id}")
 
+            # Take a pre-started container from the warm pool if one is available;
+            # its project directory is already the workspace directory.
+            with stage('warm_claim'):
+                container = self._claim_warm_container(workspace, image)
+            seeded = container is not None
+
             # Create container
-            logger.info(f"Creating container for workspace {workspace.id}")
-            container = self._create_container(workspace, image)
+            if not container:
+                logger.info(f"Creating container for workspace {workspace.id}")
+                container = self._create_container(workspace, image)
             if not container:
                 raise Exception("Failed to create container")
             
@@ -337,16 +334,18 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             logger.info(f"Container {container_id} created successfully")
 
             # Initialize container with template files
-            if not self._initialize_container(container, workspace):
+            if not seeded and not self._initialize_container(container, workspace):
                 self._cleanup_failed_workspace(workspace, container_id)  # Don't pass workspace_path
                 raise Exception("Failed to initialize container")
+            self._link_template_artifacts(container, workspace)
 
             # Update workspace with container info
             workspace.container_id = container.id
             workspace.container_status = 'created'
             workspace.container_port = self._get_container_port(container)
             workspace.container_url = self._get_container_url(workspace)
-            workspace.save()
+            with stage('db_save'):
+                workspace.save()
 
             logger.info(f"Container {container_id} initialized successfully for workspace {workspace.id}")
             return True
@@ -355,17 +354,27 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             logger.error(f"Error initializing container: {str(e)}")
             return False
 
+    @_on_workspace_node(place=True)
+    @_admitted(starts=True)
     def start_container(self, workspace):
         """Start a container for a workspace"""
         try:
             if workspace.container_id:
                 # Try to get existing container
                 try:
-                    container = self.client.containers.get(workspace.container_id)
-                    if container.status != 'running':
-                        container.start()
+                    container = self.runtime.inspect(workspace.container_id)
+                    if container.status == 'paused':
+                        # Suspended by the idle reaper; resumes in milliseconds
+                        self.runtime.unpause(container.id)
+                    elif container.status != 'running':
+                        self.runtime.start(container.id)
+                    self._forget_status(container.id)
+                    workspace.is_running = True
+                    workspace.container_status = 'running'
+                    workspace.last_accessed = timezone.now()
+                    workspace.save(update_fields=['is_running', 'container_status', 'last_accessed', 'updated_at'])
                     return True
-                except docker.errors.NotFound:
+                except ContainerNotFound:
                     # Container doesn't exist anymore, create new one
                     pass
 
@@ -374,114 +383,281 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             if container:
                 workspace.container_id = container.id
                 workspace.container_status = 'running'
-                workspace.container_url = f"http://localhost:{workspace.container_port}"
+                workspace.container_url = self._get_container_url(workspace)
                 workspace.save()
                 return True
 
             return False
 
-        except DockerException as e:
-            logger.error(f"Docker error starting container: {str(e)}")
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error starting container: {str(e)}")
             return False
         except Exception as e:
             logger.error(f"Error starting container: {str(e)}")
             return False
 
+    @_on_workspace_node()
+    @_admitted()
     def stop_container(self, workspace):
         """Stop a container for a workspace"""
         try:
             if workspace.container_id:
                 try:
-                    container = self.client.containers.get(workspace.container_id)
-                    container.stop()
+                    self.runtime.stop(workspace.container_id)
+                    self._forget_status(workspace.container_id)
                     workspace.container_status = 'stopped'
                     workspace.save()
                     return True
-                except docker.errors.NotFound:
+                except ContainerNotFound:
                     # Container already gone
                     pass
             return True
 
-        except DockerException as e:
-            logger.error(f"Docker error stopping container: {str(e)}")
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error stopping container: {str(e)}")
             return False
         except Exception as e:
             logger.error(f"Error stopping container: {str(e)}")
             return False
 
+    @_on_workspace_node()
+    @_admitted()
+    def suspend_container(self, workspace, action='pause'):
+        """Pause (keeps memory, instant resume) or stop (frees memory) an idle workspace container"""
+        try:
+            if action == 'pause':
+                self.runtime.pause(workspace.container_id)
+                workspace.container_status = 'paused'
+            else:
+                self.runtime.stop(workspace.container_id)
+                workspace.container_status = 'stopped'
+            self._forget_status(workspace.container_id)
+            workspace.is_running = False
+            workspace.save(update_fields=['is_running', 'container_status', 'updated_at'])
+            return True
+        except ContainerNotFound:
+            return False
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error suspending container: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Error suspending container: {str(e)}")
+            return False
+
+    @_on_workspace_node(place=True)
     def create_container(self, workspace):
         """Create a new container for a workspace"""
         try:
-            workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(workspace.id))
-            container_name = f"workspace_{workspace.id}"
-
-            # Get next available port starting from base port
-            base_port = 8000
-            used_ports = set(
-                int(c.ports.get('8080/tcp', [{'HostPort': '0'}])[0]['HostPort'])
-                for c in self.client.containers.list(all=True)
-                if c.ports and '8080/tcp' in c.ports
-            )
-            port = base_port
-            while port in used_ports:
-                port += 1
-
-            # Save the port to workspace
-            workspace.container_port = port
-            workspace.save()
-
-            # Create container
+            # Create container; _create_container leases the host port
             container = self._create_container(workspace, self._get_image_for_workspace(workspace))
             if not container:
                 raise Exception("Failed to create container")
             
             return container
 
-        except DockerException as e:
-            logger.error(f"Docker error creating container: {str(e)}")
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error creating container: {str(e)}")
             return None
         except Exception as e:
             logger.error(f"Error creating container: {str(e)}")
             return None
 
+    @_on_workspace_node()
+    @_admitted()
     def delete_container(self, workspace):
         """Delete a container for a workspace"""
         try:
             if workspace.container_id:
                 try:
-                    container = self.client.containers.get(workspace.container_id)
-                    container.stop()
-                    container.remove()
-                except docker.errors.NotFound:
+                    container = self.runtime.inspect(workspace.container_id)
+                    self.runtime.stop(workspace.container_id)
+                    self.runtime.remove(workspace.container_id)
+                    self.warm_pool.forget(container)
+                except ContainerNotFound:
                     # Container already gone
                     pass
+                self._forget_status(workspace.container_id)
+            self.ports.release(workspace=workspace)
+            # Nothing is left on the node; a later start places the workspace again
+            self.scheduler.release(workspace)
+            self._release_project(workspace)
             return True
 
-        except DockerException as e:
-            logger.error(f"Docker error deleting container: {str(e)}")
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error deleting container: {str(e)}")
             return False
         except Exception as e:
             logger.error(f"Error deleting container: {str(e)}")
             return False
 
+    def _release_project(self, workspace):
+        """Unmount the project directory of a deleted workspace if it was materialized as an overlay"""
+        from workspaces.services.materialize import Materializer
+
+        try:
+            Materializer().release(os.path.join(self.workspace_root, str(workspace.id)))
+        except Exception as e:
+            logger.warning(f"Failed to release project directory of workspace {workspace.id}: {str(e)}")
+
+    @_on_workspace_node()
+    @_admitted()
+    def recreate_container(self, workspace, image):
+        """
+        Replace a workspace's container with one running ``image``, keeping
+        its bind-mounted project directory, password and port, without
+        seeding files again. The old container is set aside until the new
+        one exists and is restored if creating it fails. Returns True on
+        success.
+        """
+        try:
+            old = self.runtime.inspect(workspace.container_id)
+        except ContainerNotFound:
+            logger.error(f"Workspace {workspace.id} has no container to recreate")
+            return False
+        was_running = old.status == 'running'
+        container_name = f"workspace_{workspace.id}"
+        try:
+            # Frees the name and the published port for the replacement
+            self.runtime.stop(old.id)
+            self.runtime.rename(old.id, f"{container_name}_replaced")
+            self._forget_status(old.id)
+        except ContainerRuntimeError as e:
+            logger.error(f"Could not set aside container of workspace {workspace.id}: {str(e)}")
+            return False
+
+        # The previous container keeps the port lease in case it has to come back
+        container = self._create_container(workspace, image, start=was_running, release_port=False)
+        if container is None:
+            try:
+                self.runtime.rename(old.id, container_name)
+                if was_running:
+                    self.runtime.start(old.id)
+                logger.info(f"Restored previous container of workspace {workspace.id}")
+            except ContainerRuntimeError as e:
+                logger.error(f"Could not restore container of workspace {workspace.id}: {str(e)}")
+            return False
+
+        try:
+            self.runtime.remove(old.id, force=True)
+            self.warm_pool.forget(old)
+        except ContainerRuntimeError as e:
+            logger.warning(f"Could not remove replaced container {old.id}: {str(e)}")
+        workspace.container_id = container.id
+        workspace.container_port = self._get_container_port(container) or workspace.container_port
+        workspace.container_url = self._get_container_url(workspace)
+        workspace.is_running = was_running
+        workspace.container_status = 'running' if was_running else 'stopped'
+        workspace.save()
+        logger.info(f"Recreated container of workspace {workspace.id} from {image}")
+        return True
+
+    @_on_workspace_node()
     def get_container_status(self, workspace):
         """Get the current status of a container"""
         try:
             if not workspace.container_id:
                 return False
-
-            try:
-                container = self.client.containers.get(workspace.container_id)
-                return container.status == 'running'
-            except docker.errors.NotFound:
-                # Container doesn't exist, update workspace status
-                self._update_workspace_status(workspace, False)
-                return False
-
+            return self.get_container_statuses([workspace]).get(workspace.id) == 'running'
         except Exception as e:
             logger.error(f"Error checking container status for workspace {workspace.id}: {str(e)}")
             return False
 
+    def get_container_statuses(self, workspaces):
+        """
+        Get the Docker status of many workspaces' containers with at most one
+        daemon call. Returns {workspace id: status}, where status is None for
+        workspaces without a container. Results are cached for
+        CONTAINER_STATUS_CACHE_TTL seconds across requests.
+        """
+        workspaces = [workspace for workspace in workspaces if workspace.container_id]
+        if self.node is None and any(workspace.node_id for workspace in workspaces):
+            # One call per node the workspaces are spread over
+            by_node = defaultdict(list)
+            for workspace in workspaces:
+                by_node[workspace.node_id].append(workspace)
+            statuses = self._get_container_statuses(by_node.pop(None, []))
+            for node_id, placed in by_node.items():
+                statuses.update(self.for_node(node_id).get_container_statuses(placed))
+            return statuses
+        return self._get_container_statuses(workspaces)
+
+    def _get_container_statuses(self, workspaces):
+        container_ids = {workspace.container_id for workspace in workspaces}
+        now = time.monotonic()
+        with self._status_lock:
+            statuses = {
+                container_id: self._status_cache[container_id][0]
+                for container_id in container_ids
+                if container_id in self._status_cache and self._status_cache[container_id][1] > now
+            }
+
+        stale = container_ids - set(statuses)
+        if stale:
+            found = self.runtime.statuses(stale)
+            expiry = time.monotonic() + settings.CONTAINER_STATUS_CACHE_TTL
+            with self._status_lock:
+                for container_id in stale:
+                    statuses[container_id] = found.get(container_id)
+                    self._status_cache[container_id] = (statuses[container_id], expiry)
+                # Drop expired entries so the cache does not grow with every container ever seen
+                for container_id, (_, entry_expiry) in list(self._status_cache.items()):
+                    if entry_expiry <= now:
+                        del self._status_cache[container_id]
+
+            gone = [workspace for workspace in workspaces if workspace.container_id in stale and statuses[workspace.container_id] is None]
+            if gone:
+                # Containers removed behind our back; clear the rows in one update
+                self._clear_missing_containers(gone)
+
+        return {workspace.id: statuses.get(workspace.container_id) for workspace in workspaces}
+
+    def _clear_missing_containers(self, workspaces):
+        """Reset workspaces whose containers no longer exist"""
+        from workspaces.models import Workspace
+
+        for workspace in workspaces:
+            self.ports.release(workspace=workspace)
+            workspace.is_running = False
+            workspace.container_status = 'stopped'
+            workspace.container_id = None
+            workspace.container_url = None
+            workspace.container_port = None
+            workspace.container_password = None
+        Workspace.objects.filter(id__in=[workspace.id for workspace in workspaces]).update(
+            is_running=False,
+            container_status='stopped',
+            container_id=None,
+            container_url=None,
+            container_port=None,
+            container_password=None,
+        )
+
+    def _forget_status(self, container_id):
+        """Drop a cached status after this process changed the container"""
+        with self._status_lock:
+            self._status_cache.pop(container_id, None)
+
+    @_on_workspace_node()
+    def get_container_logs(self, workspace, tail=100):
+        """Get the last lines of a workspace container's logs"""
+        try:
+            if not workspace.container_id:
+                return []
+            return self.runtime.logs(workspace.container_id, tail=tail)
+        except ContainerNotFound:
+            return []
+        except Exception as e:
+            logger.error(f"Error getting logs for workspace {workspace.id}: {str(e)}")
+            return []
+
+    @_on_workspace_node()
+    def stream_logs(self, workspace, since=None, asynchronous=False):
+        """Server-sent events with new log lines of a workspace container, shared between viewers"""
+        if asynchronous:
+            return aiter_log_events(self.log_streams, workspace.container_id, since)
+        return iter_log_events(self.log_streams, workspace.container_id, since)
+
+    @_on_workspace_node()
     def restart_container(self, workspace):
         """Restart a workspace container"""
         self.stop_container(workspace)
@@ -491,6 +667,7 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
         """Update workspace status and clear container info if stopped"""
         workspace.is_running = is_running
         if not is_running:
+            self.ports.release(workspace=workspace)
             workspace.container_id = None
             workspace.container_url = None
             workspace.container_port = None
@@ -504,17 +681,17 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             # Stop and remove container if it exists
             if container_id:
                 try:
-                    container = self.client.containers.get(container_id)
-                    container.stop()
-                    container.remove()
+                    self.runtime.stop(container_id)
+                    self.runtime.remove(container_id)
                     logger.info(f"Cleaned up container {container_id}")
-                except docker.errors.NotFound:
+                except ContainerNotFound:
                     logger.info(f"Container {container_id} already removed")
                 except Exception as e:
                     logger.error(f"Error cleaning up container: {str(e)}")
 
             # Update workspace status
             try:
+                self.ports.release(workspace=workspace)
                 workspace.container_id = None
                 workspace.container_status = 'failed'
                 workspace.container_port = None
@@ -530,7 +707,64 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             logger.error(f"Error during cleanup: {str(e)}")
             # Don't re-raise the exception since this is cleanup code
 
-    def _create_container(self, workspace, image):
+    def _container_config(self, image, resource_class, password):
+        """
+        Build the container config shared by workspace and warm pool containers.
+
+        The environment holds nothing specific to a workspace: a warm
+        container is started before it is claimed, and Docker cannot change
+        a running container's environment, so cold-created and claimed
+        containers only stay alike if neither gets per-workspace variables.
+        """
+        # Get user's SSH directory path and ensure it exists
+        ssh_dir = os.path.expanduser('~/.ssh')
+        if not os.path.exists(ssh_dir):
+            raise Exception("SSH directory not found. Please ensure SSH keys are set up.")
+
+        config = {
+            'image': image,
+            'volumes': {
+                ssh_dir: {
+                    'bind': '/home/coder/.ssh',
+                    'mode': 'ro'
+                }
+            },
+            'working_dir': '/home/coder/project',
+            'environment': {
+                'PASSWORD': password,
+                'DEFAULT_WORKSPACE': '/home/coder/project',
+                'PATH': '/usr/local/go/bin:/home/coder/go/bin:/home/coder/.local/bin:/home/coder/.cargo/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin',
+                'GIT_SSH_COMMAND': 'ssh -o StrictHostKeyChecking=no',
+                'GOROOT': '/usr/local/go',
+                'GOPATH': '/home/coder/go',
+                'GOBIN': '/home/coder/go/bin',
+                'SHELL': '/bin/bash',
+                'DJANGO_SESSION_COOKIE_NAME': 'sessionid',  # Match Django session cookie
+                'DJANGO_SESSION_COOKIE_DOMAIN': 'localhost',  # Match Django cookie domain
+                'DJANGO_SESSION_COOKIE_PATH': '/',  # Match Django cookie path
+                'DJANGO_SESSION_COOKIE_SAMESITE': 'None',  # Allow cross-origin
+                'DJANGO_SESSION_COOKIE_SECURE': 'false',  # Match Django setting
+                'DJANGO_SECRET_KEY': settings.SECRET_KEY,  # Share Django secret key
+            },
+            'cpu_count': resource_class.cpu_count,
+            'mem_limit': f"{resource_class.ram_gb}g",
+            'detach': True,
+            'tty': True,
+        }
+        if settings.WORKSPACE_GATEWAY_ENABLED:
+            # Reached by the gateway over the internal network; no host port is published
+            self._ensure_network()
+            config['network'] = settings.WORKSPACE_NETWORK
+        return config
+
+    def _ensure_network(self):
+        """Create the internal network workspace containers are attached to"""
+        if self._network_ready:
+            return
+        self.runtime.ensure_network(settings.WORKSPACE_NETWORK)
+        self._network_ready = True
+
+    def _create_container(self, workspace, image, start=True, release_port=True):
         """Create a new container for a workspace"""
         try:
             container_name = f"workspace_{workspace.id}"
@@ -540,85 +774,126 @@ RUN bash -c 'source /etc/profile && source ~/.bashrc && \\
             workspace.container_password = password  # Save password for later use
             workspace.save()
 
-            # Get user's SSH directory path and ensure it exists
-            ssh_dir = os.path.expanduser('~/.ssh')
-            if not os.path.exists(ssh_dir):
-                raise Exception("SSH directory not found. Please ensure SSH keys are set up.")
-
-            # Calculate port based on workspace ID to ensure consistency
-            container_port = 8000 + workspace.id
             workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(workspace.id))
 
             # Create container config with appropriate paths
-            container_config = {
-                'name': container_name,
-                'image': image,
-                'volumes': {
-                    workspace_path: {
-                        'bind': '/home/coder/project',
-                        'mode': 'rw'
-                    },
-                    ssh_dir: {
-                        'bind': '/home/coder/.ssh',
-                        'mode': 'ro'
-                    }
-                },
-                'working_dir': '/home/coder/project',
-                'environment': {
-                    'WORKSPACE_ID': str(workspace.id),
-                    'PASSWORD': password,  # Use the same password
-                    'DEFAULT_WORKSPACE': '/home/coder/project',
-                    'PATH': '/usr/local/go/bin:/home/coder/go/bin:/home/coder/.local/bin:/home/coder/.cargo/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin',
-                    'GIT_SSH_COMMAND': 'ssh -o StrictHostKeyChecking=no',
-                    'GOROOT': '/usr/local/go',
-                    'GOPATH': '/home/coder/go',
-                    'GOBIN': '/home/coder/go/bin',
-                    'SHELL': '/bin/bash',
-                    'DOCKER_USER': workspace.owner,  # Pass owner username to container
-                    'DJANGO_SESSION_COOKIE_NAME': 'sessionid',  # Match Django session cookie
-                    'DJANGO_SESSION_COOKIE_DOMAIN': 'localhost',  # Match Django cookie domain
-                    'DJANGO_SESSION_COOKIE_PATH': '/',  # Match Django cookie path
-                    'DJANGO_SESSION_COOKIE_SAMESITE': 'None',  # Allow cross-origin
-                    'DJANGO_SESSION_COOKIE_SECURE': 'false',  # Match Django setting
-                    'DJANGO_SECRET_KEY': settings.SECRET_KEY,  # Share Django secret key
-                },
-                'cpu_count': workspace.resource_class.cpu_count,
-                'mem_limit': f"{workspace.resource_class.ram_gb}g",
-                'detach': True,
-                'tty': True,
-                'ports': {
+            container_config = self._container_config(image, workspace.resource_class, password)
+            container_config['name'] = container_name
+            container_config['volumes'][workspace_path] = {
+                'bind': '/home/coder/project',
+                'mode': 'rw'
+            }
+            container_port = None
+            if self._publishes_ports():
+                # Lease a host port; the workspace keeps its port across container recreation
+                container_port = self.allocate_port(container_name, workspace)
+                container_config['ports'] = {
                     '8080/tcp': container_port,  # Map container's 8080 to host's dynamic port
                 }
-            }
 
             # Create and start the container
-            container = self.client.containers.run(**container_config)
+            with stage('container_run'):
+                container = self.runtime.create(container_config, start=start)
             workspace.container_port = container_port  # Save the mapped port
             workspace.save()
             return container
 
-        except docker.errors.APIError as e:
-            logger.error(f"Docker API error creating container: {str(e)}")
+        except ContainerRuntimeError as e:
+            logger.error(f"Runtime error creating container: {str(e)}")
+            if release_port:
+                self.ports.release(workspace=workspace)
             return None
         except Exception as e:
             logger.error(f"Error creating container: {str(e)}")
+            if release_port:
+                self.ports.release(workspace=workspace)
+            return None
+
+    def allocate_port(self, container_name, workspace=None):
+        """Lease a host port for a container's code-server binding"""
+        self._reclaim_port_leases()
+        return self.ports.allocate(container_name, workspace)
+
+    def _reclaim_port_leases(self):
+        """Once per process, free leases left behind by containers removed while we were down"""
+        if self._ports_reclaimed:
+            return
+        self._ports_reclaimed = True
+        try:
+            names = [c.name for c in self.runtime.list()]
+            self.ports.reclaim_orphans(names)
+        except Exception as e:
+            logger.error(f"Error reclaiming port leases: {str(e)}")
+
+    def _claim_warm_container(self, workspace, image):
+        """Hand a pre-started container from the warm pool to a workspace"""
+        warm = self.warm_pool.acquire(image, workspace.resource_class)
+        if not warm:
+            logger.info(f"Warm pool miss for {image} / {workspace.resource_class.name}")
+            return None
+
+        try:
+            workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(workspace.id))
+            self.warm_pool.attach(warm, workspace_path)
+            self.runtime.rename(warm.container_id, f"workspace_{workspace.id}")
+            container = self.runtime.inspect(warm.container_id)
+            self.ports.transfer(warm.name, container.name, workspace)
+
+            workspace.container_password = warm.password
+            workspace.container_port = self._get_container_port(container)
+            workspace.save()
+            logger.info(f"Warm pool hit: container {warm.name} claimed by workspace {workspace.id}")
+            return container
+        except Exception as e:
+            logger.error(f"Error claiming warm container {warm.name}: {str(e)}")
+            self.warm_pool.release(warm)
             return None
 
     def _get_container_port(self, container):
         """Get the port for a container"""
         try:
-            ports = container.ports.get('8080/tcp')
-            if ports:
-                return int(ports[0]['HostPort'])
-            return None
+            return container.ports.get('8080/tcp')
         except Exception as e:
             logger.error(f"Error getting container port: {str(e)}")
             return None
 
     def _get_container_url(self, workspace):
         """Get the URL for a workspace"""
+        if settings.WORKSPACE_GATEWAY_ENABLED:
+            return f"{settings.WORKSPACE_GATEWAY_URL}/w/{workspace.id}/"
         # Use the mapped port from the container config
-        return f"http://localhost:{workspace.container_port}"
+        return f"http://{self._public_host()}:{workspace.container_port}"
+
+    def _public_host(self):
+        return self.node.public_host if self.node else 'localhost'
+
+    def _publishes_ports(self):
+        """
+        Whether containers get a published host port. The gateway reaches
+        containers of the default runtime over the internal network, but
+        that network does not span hosts, so registered nodes always publish.
+        """
+        return not settings.WORKSPACE_GATEWAY_ENABLED or self.node is not None
+
+    def upstream_address(self, container):
+        """host:port this process reaches a container's code-server on, or None"""
+        if self._publishes_ports():
+            port = container.ports.get('8080/tcp')
+            return f"{self._public_host()}:{port}" if port else None
+        ip_address = container.networks.get(settings.WORKSPACE_NETWORK)
+        return f"{ip_address}:8080" if ip_address else None
+
+    @_on_workspace_node()
+    def code_server_url(self, workspace):
+        """Address this process can reach the workspace's code-server on, or None"""
+        if self._publishes_ports():
+            return f"http://{self._public_host()}:{workspace.container_port}" if workspace.container_port else None
+        try:
+            container = self.runtime.inspect(workspace.container_id)
+        except ContainerNotFound:
+            return None
+        address = self.upstream_address(container)
+        return f"http://{address}" if address else None
 
     def _generate_password(self):
         """Generate a random password for the container"""
@@ -0,0 +1,246 @@
+import re
+import time
+import logging
+import threading
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from workspaces.models import Workspace
+from ..models import DockerNode, PortLease
+from ..runtime import ContainerNotFound, get_runtime
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_CONTAINER_NAME = re.compile(r'^/?workspace_(\d+)$')
+
+# Docker container event -> state recorded on the workspace
+EVENT_STATES = {
+    'start': 'running',
+    'unpause': 'running',
+    'rename': None,  # resolved from the container's current state
+    'pause': 'paused',
+    'die': 'stopped',
+    'stop': 'stopped',
+    'destroy': 'removed',
+}
+
+STATE_FIELDS = {
+    'running': {'is_running': True, 'container_status': 'running'},
+    'paused': {'is_running': False, 'container_status': 'paused'},
+    'stopped': {'is_running': False, 'container_status': 'stopped'},
+    'removed': {
+        'is_running': False,
+        'container_status': 'stopped',
+        'container_id': None,
+        'container_url': None,
+        'container_port': None,
+    },
+}
+
+DOCKER_STATUS_STATES = {
+    'running': 'running',
+    'paused': 'paused',
+    'restarting': 'running',
+    'created': 'stopped',
+    'exited': 'stopped',
+    'dead': 'stopped',
+}
+
+
+def state_from_events():
+    """Whether workspace status fields are kept current by a container event watcher"""
+    if settings.CONTAINER_EVENTS_WATCHER == 'in_process':
+        ContainerEventWatcher.in_process()
+    return settings.CONTAINER_EVENTS_WATCHER != 'off'
+
+
+def workspace_id_for(container_name):
+    """Workspace id encoded in a container name, or None for other containers"""
+    match = WORKSPACE_CONTAINER_NAME.match(container_name or '')
+    return int(match.group(1)) if match else None
+
+
+class ContainerEventWatcher:
+    """
+    Keeps Workspace status fields in sync with the container runtime.
+
+    Subscribes to the runtime driver's container event stream and maps
+    ``workspace_<id>`` containers back to their rows. Events are collected
+    and written every ``batch_interval`` seconds with one UPDATE per state,
+    so a burst of events costs a handful of queries. Whenever the stream
+    (re)connects, all workspace containers are reconciled with a single list
+    call so events missed while disconnected are not lost. Port leases of
+    destroyed containers are released.
+
+    One watcher follows one runtime: the default one, or a registered
+    DockerNode's, and only touches the workspaces placed there.
+    """
+    _in_process = None
+    _in_process_lock = threading.Lock()
+
+    def __init__(self, runtime=None, batch_interval=None, node=None):
+        self._runtime = runtime
+        self.node = node
+        self.batch_interval = batch_interval or settings.CONTAINER_EVENTS_BATCH_INTERVAL
+        self._pending = {}
+        self._removed_names = set()
+        self._pending_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stream = None
+        self._threads = []
+
+    @classmethod
+    def for_all_runtimes(cls, batch_interval=None):
+        """A watcher for the default runtime and one for each registered DockerNode"""
+        # Imported here: docker_service imports this module through metrics
+        from .docker_service import DockerService
+        watchers = [cls(batch_interval=batch_interval)]
+        for node in DockerNode.objects.all():
+            watchers.append(cls(DockerService.for_node(node).runtime, batch_interval, node))
+        return watchers
+
+    @classmethod
+    def in_process(cls):
+        """Get the watchers running inside the web process, starting them on first use"""
+        with cls._in_process_lock:
+            if cls._in_process is None:
+                cls._in_process = cls.for_all_runtimes()
+                for watcher in cls._in_process:
+                    watcher.start()
+            return cls._in_process
+
+    @property
+    def runtime(self):
+        return self._runtime or get_runtime()
+
+    def start(self):
+        suffix = f"-{self.node.name}" if self.node else ''
+        for target, name in ((self._watch, 'container-events'), (self._flush_loop, 'container-events-flush')):
+            thread = threading.Thread(target=target, name=name + suffix, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started container event watcher{f' for node {self.node.name}' if self.node else ''}")
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        stream = self._stream
+        if stream is not None:
+            stream.close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _watch(self):
+        backoff = 1
+        try:
+            while not self._stopping.is_set():
+                try:
+                    since = int(time.time())
+                    self.reconcile()
+                    self._stream = self.runtime.events(since=since, actions=list(EVENT_STATES))
+                    backoff = 1
+                    for event in self._stream:
+                        self.handle_event(event)
+                except Exception as e:
+                    if self._stopping.is_set():
+                        break
+                    logger.error(f"Container event stream failed, reconnecting in {backoff}s: {str(e)}")
+                    self._stopping.wait(backoff)
+                    backoff = min(backoff * 2, 60)
+                finally:
+                    self._stream = None
+        finally:
+            connection.close()
+
+    def handle_event(self, event):
+        """Queue the state change described by one Docker event"""
+        action = event.get('Action') or event.get('status')
+        actor = event.get('Actor') or {}
+        name = (actor.get('Attributes') or {}).get('name')
+        container_id = actor.get('ID') or event.get('id')
+        if action not in EVENT_STATES:
+            return
+
+        if action == 'destroy':
+            with self._pending_lock:
+                self._removed_names.add(name)
+
+        workspace_id = workspace_id_for(name)
+        if workspace_id is None:
+            return
+
+        state = EVENT_STATES[action]
+        if state is None:
+            try:
+                state = DOCKER_STATUS_STATES.get(self.runtime.inspect(container_id).status, 'stopped')
+            except ContainerNotFound:
+                return
+        with self._pending_lock:
+            self._pending[workspace_id] = (state, container_id)
+
+    def reconcile(self):
+        """Bring every workspace in line with the containers the runtime has"""
+        containers = self.runtime.list(name='workspace_')
+        seen = {}
+        for container in containers:
+            workspace_id = workspace_id_for(container.name)
+            if workspace_id is not None:
+                seen[workspace_id] = (DOCKER_STATUS_STATES.get(container.status, 'stopped'), container.id)
+
+        close_old_connections()
+        # Rows placed on this runtime that still point at a container it no longer has
+        missing = Workspace.objects.filter(container_id__isnull=False, node=self.node).exclude(id__in=list(seen))
+        with self._pending_lock:
+            for workspace_id, container_id in missing.values_list('id', 'container_id'):
+                self._pending[workspace_id] = ('removed', container_id)
+            self._pending.update(seen)
+        self.flush()
+
+    def _flush_loop(self):
+        try:
+            while not self._stopping.wait(self.batch_interval):
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Error writing container states: {str(e)}")
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Write queued state changes with one UPDATE per state"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            removed_names, self._removed_names = self._removed_names, set()
+        if not pending and not removed_names:
+            return
+
+        by_state = {}
+        for workspace_id, (state, container_id) in pending.items():
+            by_state.setdefault(state, []).append((workspace_id, container_id))
+
+        now = timezone.now()
+        removed_ids = []
+        for state, entries in by_state.items():
+            if state == 'removed':
+                # Only clear rows still pointing at the destroyed container; the
+                # workspace may already have a new one
+                match = reduce(or_, (Q(id=workspace_id, container_id=container_id) for workspace_id, container_id in entries))
+                removed_ids = list(Workspace.objects.filter(match).values_list('id', flat=True))
+                match = Q(id__in=removed_ids)
+            else:
+                match = Q(id__in=[workspace_id for workspace_id, _ in entries])
+            updated = Workspace.objects.filter(match).update(updated_at=now, **STATE_FIELDS[state])
+            logger.debug(f"Marked {updated} workspace(s) {state}")
+
+        # Workspace containers keep their name when recreated, so their leases
+        # are matched by workspace; other containers (warm pool) by name
+        other_names = [name for name in removed_names if name and workspace_id_for(name) is None]
+        released = PortLease.objects.filter(
+            Q(container_name__in=other_names, node=self.node) | Q(workspace_id__in=removed_ids),
+            leased_at__isnull=False,
+        ).update(workspace=None, container_name='', leased_at=None)
+        if released:
+            logger.info(f"Released {released} port lease(s) of destroyed containers")
@@ -0,0 +1,151 @@
+import os
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DOCKERFILE_HASH_LABEL = 'ide.dockerfile_hash'
+
+# One lock per content hash, shared by every DockerService in the process
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def _lock_for(content_hash):
+    with _build_locks_guard:
+        return _build_locks.setdefault(content_hash, threading.Lock())
+
+
+class ImageBuildError(Exception):
+    """Raised when a docker build reports an error"""
+
+
+class ImageNotBuilt(Exception):
+    """Raised instead of building or pulling when a lookup may not change local images"""
+
+    def __init__(self, tag):
+        super().__init__(f"Image {tag} is not available locally")
+        self.tag = tag
+
+
+class ImageCache:
+    """
+    Content-addressed cache of generated IDE images.
+
+    Images are tagged ``<name>:<hash>`` where the hash covers the generated
+    Dockerfile and the id of the base image it was built from, so changing
+    either produces a new tag instead of silently reusing a stale one.
+    Concurrent requests for the same hash wait for a single build: threads
+    through an in-process lock, other processes on the host through a
+    ``<hash>.lock`` file next to the per-hash build directory.
+    """
+
+    def __init__(self, docker_service):
+        self.docker_service = docker_service
+        self.build_root = settings.IMAGE_BUILD_ROOT
+
+    @property
+    def runtime(self):
+        return self.docker_service.runtime
+
+    def base_image_id(self, base_image, pull=True):
+        """Get the local id of the base image, pulling it if needed"""
+        image = self.runtime.image(base_image)
+        if image is None:
+            if not pull:
+                raise ImageNotBuilt(base_image)
+            logger.info(f"Pulling base image {base_image}")
+            image = self.runtime.pull(base_image)
+        return image.id
+
+    def content_hash(self, dockerfile_content, base_image_id, context_files=None):
+        digest = hashlib.sha256()
+        digest.update(base_image_id.encode())
+        digest.update(b'\0')
+        digest.update(dockerfile_content.encode())
+        for name, content in sorted((context_files or {}).items()):
+            digest.update(b'\0')
+            digest.update(name.encode())
+            digest.update(b'\0')
+            digest.update(hashlib.sha256(content).digest())
+        return digest.hexdigest()[:16]
+
+    def tag_for(self, name, dockerfile_content, base_image, context_files=None, pull=True):
+        base_image_id = self.base_image_id(base_image, pull)
+        return f"{name}:{self.content_hash(dockerfile_content, base_image_id, context_files)}"
+
+    def _image_exists(self, tag):
+        return self.runtime.image(tag) is not None
+
+    @contextmanager
+    def _single_flight(self, content_hash):
+        with _lock_for(content_hash):
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.build_root, f"{content_hash}.lock"), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def ensure(self, name, dockerfile_content, base_image, context_files=None, build=True):
+        """
+        Return the tag for this Dockerfile, building the image only if it is missing.
+        ``context_files`` maps build context paths to their bytes. With
+        ``build=False`` nothing is built or pulled; a missing image raises
+        ImageNotBuilt instead.
+        """
+        tag = self.tag_for(name, dockerfile_content, base_image, context_files, pull=build)
+        content_hash = tag.rsplit(':', 1)[1]
+        if self._image_exists(tag):
+            logger.info(f"Found cached image: {tag}")
+            return tag
+        if not build:
+            raise ImageNotBuilt(tag)
+
+        build_dir = os.path.join(self.build_root, content_hash)
+        os.makedirs(build_dir, exist_ok=True)
+        with self._single_flight(content_hash):
+            # Another request may have finished the build while we waited
+            if self._image_exists(tag):
+                logger.info(f"Image {tag} was built by a concurrent request")
+                return tag
+
+            with open(os.path.join(build_dir, 'Dockerfile'), 'w') as f:
+                f.write(dockerfile_content)
+            for path, content in (context_files or {}).items():
+                with open(os.path.join(build_dir, path), 'wb') as f:
+                    f.write(content)
+            self._build(build_dir, tag, content_hash)
+        return tag
+
+    def _build(self, build_dir, tag, content_hash):
+        logger.info(f"Building image {tag} in {build_dir}")
+        response = self.runtime.build(build_dir, tag, labels={DOCKERFILE_HASH_LABEL: content_hash})
+
+        # Log all build output
+        for chunk in response:
+            if 'stream' in chunk:
+                log_line = chunk['stream'].strip()
+                if log_line:
+                    logger.info(f"Build: {log_line}")
+            elif 'error' in chunk:
+                error_msg = chunk['error']
+                logger.error(f"Build error: {error_msg}")
+                raise ImageBuildError(f"Docker build failed: {error_msg}")
+
+        # Verify image was built
+        built_image = self.runtime.image(tag)
+        if built_image is None:
+            raise ImageBuildError(f"Image {tag} is missing after the build")
+        logger.info(f"Successfully built image: {built_image.tags}")
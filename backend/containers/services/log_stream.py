@@ -0,0 +1,285 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+END = object()
+
+
+class LogLine:
+    """One container log line, split into Docker's timestamp and the message"""
+
+    def __init__(self, raw):
+        timestamp, _, message = raw.partition(' ')
+        self.timestamp = timestamp
+        self.message = message
+
+
+class LogSubscription:
+    """
+    A viewer's bounded queue of log lines.
+
+    When the viewer falls behind and the queue is full the oldest line is
+    dropped and counted, so a slow client never stalls the shared stream.
+    """
+
+    def __init__(self, max_lines):
+        self.lines = queue.Queue(maxsize=max_lines)
+        self.dropped = 0
+        self.broadcaster = None
+        self.since = None
+        self._lock = threading.Lock()
+
+    def put(self, line):
+        with self._lock:
+            while True:
+                try:
+                    self.lines.put_nowait(line)
+                    return
+                except queue.Full:
+                    try:
+                        self.lines.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def wants(self, line):
+        return self.since is None or line.timestamp > self.since
+
+    def close(self):
+        self.put(END)
+
+    def get(self, timeout):
+        """Next line, END when the stream finished, or None on timeout"""
+        try:
+            return self.lines.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def take_dropped(self):
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+            return dropped
+
+
+class AsyncLogSubscription(LogSubscription):
+    """Subscription consumed from an event loop (ASGI) without holding a thread per viewer"""
+
+    def __init__(self, max_lines):
+        super().__init__(max_lines)
+        self.loop = asyncio.get_running_loop()
+        self.lines = asyncio.Queue(maxsize=max_lines)
+
+    def put(self, line):
+        # Called from the broadcaster thread
+        try:
+            self.loop.call_soon_threadsafe(self._put, line)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _put(self, line):
+        while True:
+            try:
+                self.lines.put_nowait(line)
+                return
+            except asyncio.QueueFull:
+                self.lines.get_nowait()
+                self.dropped += 1
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.lines.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+class LogBroadcaster:
+    """Follows one container's logs once and fans the lines out to every subscriber"""
+
+    def __init__(self, hub, container_id):
+        self.hub = hub
+        self.container_id = container_id
+        self.backlog = deque(maxlen=settings.LOG_STREAM_BACKLOG_LINES)
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._stream = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"log-stream-{container_id[:12]}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, subscription):
+        """Replay buffered lines newer than the subscription's ``since`` and subscribe to new ones"""
+        with self._lock:
+            if self._closed:
+                return False
+            for line in self.backlog:
+                if subscription.wants(line):
+                    subscription.put(line)
+            self.subscribers.add(subscription)
+            return True
+
+    def remove(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+            if self.subscribers or self._closed:
+                return
+            # Last viewer left; stop following the container
+            self._closed = True
+            stream = self._stream
+        self.hub._forget(self)
+        if stream is not None:
+            stream.close()
+
+    def _run(self):
+        pending = b''
+        try:
+            stream = self.hub.runtime.follow_logs(self.container_id, tail=settings.LOG_STREAM_BACKLOG_LINES)
+            with self._lock:
+                if self._closed:
+                    stream.close()
+                    return
+                self._stream = stream
+            for chunk in stream:
+                pending += chunk
+                *complete, pending = pending.split(b'\n')
+                for raw in complete:
+                    self._publish(LogLine(raw.decode('utf-8', errors='replace').rstrip('\r')))
+            if pending:
+                self._publish(LogLine(pending.decode('utf-8', errors='replace')))
+        except Exception as e:
+            if not self._closed:
+                logger.error(f"Log stream for container {self.container_id} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._closed = True
+                subscribers = list(self.subscribers)
+            self.hub._forget(self)
+            for subscription in subscribers:
+                subscription.close()
+
+    def _publish(self, line):
+        with self._lock:
+            self.backlog.append(line)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            # The daemon replays its tail when a stream starts; skip what a
+            # reconnecting viewer already has
+            if subscription.wants(line):
+                subscription.put(line)
+
+
+class LogStreamHub:
+    """
+    Shares one Docker log stream per container between all viewers in this
+    process. Streams start with the first subscriber and stop with the last.
+    """
+
+    def __init__(self, docker_service):
+        self.docker_service = docker_service
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def runtime(self):
+        return self.docker_service.runtime
+
+    def subscribe(self, container_id, since=None, asynchronous=False):
+        """Start receiving a container's log lines; pass the result to unsubscribe when done"""
+        subscription_class = AsyncLogSubscription if asynchronous else LogSubscription
+        subscription = subscription_class(settings.LOG_STREAM_SUBSCRIBER_LINES)
+        subscription.since = since
+        while True:
+            with self._lock:
+                broadcaster = self._broadcasters.get(container_id)
+                created = broadcaster is None
+                if created:
+                    broadcaster = LogBroadcaster(self, container_id)
+                    self._broadcasters[container_id] = broadcaster
+            if created:
+                broadcaster.start()
+            # A broadcaster that finished in between is replaced on the next pass
+            if broadcaster.add(subscription):
+                subscription.broadcaster = broadcaster
+                return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.broadcaster.remove(subscription)
+
+    def _forget(self, broadcaster):
+        with self._lock:
+            if self._broadcasters.get(broadcaster.container_id) is broadcaster:
+                del self._broadcasters[broadcaster.container_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                container_id: len(broadcaster.subscribers)
+                for container_id, broadcaster in self._broadcasters.items()
+            }
+
+
+def _event(line):
+    return f"id: {line.timestamp}\ndata: {line.message}\n\n"
+
+
+def _dropped_event(count):
+    return f"event: dropped\ndata: {count}\n\n"
+
+
+# Streams end after LOG_STREAM_MAX_SECONDS with this event; clients reconnect
+# with the last event id. This bounds how long a stream whose client went away
+# unnoticed can hold a subscription.
+RECONNECT_EVENT = 'event: reconnect\ndata: \n\n'
+END_EVENT = 'event: end\ndata: \n\n'
+HEARTBEAT = ': keep-alive\n\n'
+
+
+def iter_log_events(hub, container_id, since=None):
+    """Server-sent events for a container's log lines (WSGI)"""
+    subscription = hub.subscribe(container_id, since)
+    deadline = time.monotonic() + settings.LOG_STREAM_MAX_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            line = subscription.get(settings.LOG_STREAM_HEARTBEAT_SECONDS)
+            dropped = subscription.take_dropped()
+            if dropped:
+                yield _dropped_event(dropped)
+            if line is END:
+                yield END_EVENT
+                return
+            yield HEARTBEAT if line is None else _event(line)
+        yield RECONNECT_EVENT
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def aiter_log_events(hub, container_id, since=None):
+    """Server-sent events for a container's log lines (ASGI), without a thread per viewer"""
+    subscription = hub.subscribe(container_id, since, asynchronous=True)
+    deadline = time.monotonic() + settings.LOG_STREAM_MAX_SECONDS
+    try:
+        while time.monotonic() < deadline:
+            line = await subscription.get(settings.LOG_STREAM_HEARTBEAT_SECONDS)
+            dropped = subscription.take_dropped()
+            if dropped:
+                yield _dropped_event(dropped)
+            if line is END:
+                yield END_EVENT
+                return
+            yield HEARTBEAT if line is None else _event(line)
+        yield RECONNECT_EVENT
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,224 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from ..runtime import ContainerNotFound, get_runtime
+from .events import workspace_id_for
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_time(value):
+    # Docker reports nanoseconds; datetime handles microseconds
+    value = value.rstrip('Z')
+    if '.' in value:
+        seconds, fraction = value.split('.', 1)
+        value = f"{seconds}.{fraction[:6]}"
+    return datetime.fromisoformat(value)
+
+
+def _block_io(stats):
+    read = write = 0
+    for entry in (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            read += entry.get('value', 0)
+        elif op == 'write':
+            write += entry.get('value', 0)
+    return read, write
+
+
+def _network_io(stats):
+    networks = (stats.get('networks') or {}).values()
+    return sum(n.get('rx_bytes', 0) for n in networks), sum(n.get('tx_bytes', 0) for n in networks)
+
+
+def compute_sample(stats, previous=None):
+    """Turn one Docker stats document (and the one before it) into rates and percentages"""
+    cpu = stats.get('cpu_stats') or {}
+    precpu = stats.get('precpu_stats') or {}
+    cpu_delta = (cpu.get('cpu_usage') or {}).get('total_usage', 0) - (precpu.get('cpu_usage') or {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    online_cpus = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+    cpu_percent = 0.0
+    # The first document of a stream has no previous CPU reading to diff against
+    if precpu.get('system_cpu_usage') and cpu_delta > 0 and system_delta > 0:
+        cpu_percent = cpu_delta / system_delta * online_cpus * 100
+
+    memory = stats.get('memory_stats') or {}
+    memory_details = memory.get('stats') or {}
+    # Page cache is reclaimable; exclude it like `docker stats` does (cgroup v1: cache, v2: inactive_file)
+    memory_bytes = memory.get('usage', 0) - memory_details.get('inactive_file', memory_details.get('cache', 0))
+    memory_limit = memory.get('limit', 0)
+
+    net_rx, net_tx = _network_io(stats)
+    block_read, block_write = _block_io(stats)
+    sample = {
+        'time': stats.get('read'),
+        'cpu_percent': round(cpu_percent, 2),
+        'memory_bytes': max(memory_bytes, 0),
+        'memory_limit': memory_limit,
+        'memory_percent': round(memory_bytes / memory_limit * 100, 2) if memory_limit else 0.0,
+        'net_rx_bps': 0.0,
+        'net_tx_bps': 0.0,
+        'block_read_bps': 0.0,
+        'block_write_bps': 0.0,
+        # Cumulative counters, kept to compute the next sample's rates
+        '_totals': (net_rx, net_tx, block_read, block_write),
+    }
+    if previous:
+        elapsed = (_parse_time(sample['time']) - _parse_time(previous['time'])).total_seconds()
+        if elapsed > 0:
+            for key, now, before in zip(
+                ('net_rx_bps', 'net_tx_bps', 'block_read_bps', 'block_write_bps'),
+                sample['_totals'],
+                previous['_totals'],
+            ):
+                sample[key] = round(max(now - before, 0) / elapsed, 1)
+    return sample
+
+
+class MetricsSampler:
+    """
+    Keeps a rolling time series of resource usage for every running workspace
+    container.
+
+    A discovery loop lists running workspace containers every
+    METRICS_DISCOVERY_INTERVAL seconds (one daemon call) and keeps one
+    streaming stats subscription per container, so reading metrics never
+    waits for Docker's CPU sampling. Each workspace keeps the last
+    METRICS_HISTORY_SIZE samples (about one per second).
+
+    METRICS_SAMPLER decides where that runs: with 'in_process' the first
+    read starts sampling in the reading process; with 'external' only the
+    sample_container_metrics command samples and publish() shares the
+    history through the cache, which reads then come from.
+    """
+
+    CACHE_KEY = 'container-metrics:{}'
+
+    def __init__(self, runtime=None):
+        self._runtime = runtime
+        self._history = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def runtime(self):
+        return self._runtime or get_runtime()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._discover_loop, name='metrics-discovery', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Followers exit on their next sample (about a second)
+        self._stopping.set()
+
+    def history(self, workspace_id):
+        """Samples for a workspace, oldest first"""
+        if settings.METRICS_SAMPLER == 'external':
+            return cache.get(self.CACHE_KEY.format(workspace_id)) or []
+        if settings.METRICS_SAMPLER == 'in_process':
+            self.ensure_started()
+        with self._lock:
+            samples = list(self._history.get(workspace_id, ()))
+        return [self._public(sample) for sample in samples]
+
+    def latest(self, workspace_id):
+        """Most recent sample for a workspace, or None"""
+        if settings.METRICS_SAMPLER == 'external':
+            history = self.history(workspace_id)
+            return history[-1] if history else None
+        if settings.METRICS_SAMPLER == 'in_process':
+            self.ensure_started()
+        with self._lock:
+            samples = self._history.get(workspace_id)
+            sample = samples[-1] if samples else None
+        return self._public(sample) if sample else None
+
+    def publish(self):
+        """Write every followed workspace's history to the cache; returns how many were written"""
+        with self._lock:
+            snapshot = {workspace_id: list(samples) for workspace_id, samples in self._history.items() if samples}
+        # Entries of workspaces that stop (or of a sampler that dies) expire on their own
+        cache.set_many(
+            {
+                self.CACHE_KEY.format(workspace_id): [self._public(sample) for sample in samples]
+                for workspace_id, samples in snapshot.items()
+            },
+            timeout=max(settings.METRICS_PUBLISH_INTERVAL * 3, settings.METRICS_DISCOVERY_INTERVAL * 2),
+        )
+        return len(snapshot)
+
+    def _public(self, sample):
+        return {key: value for key, value in sample.items() if not key.startswith('_')}
+
+    def _discover_loop(self):
+        while not self._stopping.is_set():
+            try:
+                self.discover()
+            except Exception as e:
+                logger.error(f"Error discovering containers for metrics: {str(e)}")
+            self._stopping.wait(settings.METRICS_DISCOVERY_INTERVAL)
+
+    def discover(self):
+        """Follow newly started workspace containers and forget removed ones"""
+        containers = self.runtime.list(name='workspace_', status='running')
+        running = {}
+        for container in containers:
+            workspace_id = workspace_id_for(container.name)
+            if workspace_id is not None:
+                running[workspace_id] = container.id
+
+        with self._lock:
+            for workspace_id in list(self._history):
+                if workspace_id not in running and workspace_id not in self._streams:
+                    del self._history[workspace_id]
+            to_start = [
+                (workspace_id, container_id) for workspace_id, container_id in running.items()
+                if workspace_id not in self._streams
+            ]
+            for workspace_id, container_id in to_start[:max(settings.METRICS_MAX_CONTAINERS - len(self._streams), 0)]:
+                self._streams[workspace_id] = container_id
+                threading.Thread(
+                    target=self._follow, args=(workspace_id, container_id),
+                    name=f"metrics-{workspace_id}", daemon=True,
+                ).start()
+
+    def _follow(self, workspace_id, container_id):
+        try:
+            # One long-lived connection per followed container
+            stream = self.runtime.follow_stats(container_id)
+            with self._lock:
+                samples = self._history.get(workspace_id)
+                if samples is None or samples.maxlen != settings.METRICS_HISTORY_SIZE:
+                    samples = self._history[workspace_id] = deque(samples or (), maxlen=settings.METRICS_HISTORY_SIZE)
+            previous = samples[-1] if samples else None
+            for stats in stream:
+                if self._stopping.is_set():
+                    break
+                # Stopped containers report empty stats until the stream ends
+                if not stats.get('read') or stats['read'].startswith('0001-'):
+                    continue
+                sample = compute_sample(stats, previous)
+                with self._lock:
+                    samples.append(sample)
+                previous = sample
+        except ContainerNotFound:
+            pass
+        except Exception as e:
+            if not self._stopping.is_set():
+                logger.warning(f"Stats stream for workspace {workspace_id} ended: {str(e)}")
+        finally:
+            with self._lock:
+                if self._streams.get(workspace_id) == container_id:
+                    del self._streams[workspace_id]
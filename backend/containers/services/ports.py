@@ -0,0 +1,132 @@
+import logging
+import threading
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from ..models import PortLease
+
+logger = logging.getLogger(__name__)
+
+
+class PortRangeExhausted(Exception):
+    """Raised when every host port in the configured range is leased"""
+
+
+class PortAllocator:
+    """
+    Hands out host ports for container 8080 bindings from a reserved range.
+
+    Every port in WORKSPACE_PORT_RANGE_START..WORKSPACE_PORT_RANGE_END has a
+    PortLease row. Allocating claims the lowest free row with a conditional
+    UPDATE (rows locked by another allocator are skipped where the database
+    supports SKIP LOCKED), so the cost is one indexed lookup regardless of how
+    many containers exist on the host. Leases are returned when the container
+    is removed. Every node has its own range of rows (``node`` None for the
+    default runtime), since each daemon publishes ports on its own host.
+    """
+
+    def __init__(self, start=None, end=None, node=None):
+        self.start = start or settings.WORKSPACE_PORT_RANGE_START
+        self.end = end or settings.WORKSPACE_PORT_RANGE_END
+        self.node = node
+        self._range_ready = False
+        self._lock = threading.Lock()
+
+    def ensure_range(self):
+        """Create lease rows for any port of the range that has none yet"""
+        with self._lock:
+            if self._range_ready:
+                return
+            PortLease.objects.bulk_create(
+                [PortLease(port=port, node=self.node) for port in range(self.start, self.end + 1)],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            self._range_ready = True
+
+    def allocate(self, container_name, workspace=None):
+        """Lease a free port for a container; a workspace keeps the port it already holds"""
+        self.ensure_range()
+        if workspace is not None:
+            held = PortLease.objects.filter(workspace=workspace, node=self.node).update(container_name=container_name)
+            if held:
+                return PortLease.objects.get(workspace=workspace).port
+            # A port on another node is no use here
+            PortLease.objects.filter(workspace=workspace).update(workspace=None, container_name='', leased_at=None)
+
+        while True:
+            with self._claim_transaction():
+                free = PortLease.objects.filter(
+                    node=self.node, leased_at__isnull=True, port__gte=self.start, port__lte=self.end
+                ).order_by('port')
+                if connection.features.has_select_for_update_skip_locked:
+                    free = free.select_for_update(skip_locked=True)
+                lease = free.first()
+                if lease is None:
+                    raise PortRangeExhausted(f"No free ports left in {self.start}-{self.end}{self._on_node()}")
+                # Without row locks two callers can pick the same row; only the
+                # one whose UPDATE still matches the free row wins, the other retries.
+                claimed = PortLease.objects.filter(pk=lease.pk, leased_at__isnull=True).update(
+                    container_name=container_name,
+                    workspace=workspace,
+                    leased_at=timezone.now(),
+                )
+            if claimed:
+                logger.info(f"Leased port {lease.port} to {container_name}")
+                return lease.port
+
+    def _claim_transaction(self):
+        # SELECT ... FOR UPDATE needs a transaction; on SQLite a read-then-write
+        # transaction would fail with "database is locked" under contention instead
+        if connection.features.has_select_for_update_skip_locked:
+            return transaction.atomic()
+        return nullcontext()
+
+    def transfer(self, from_container_name, container_name, workspace):
+        """Move the lease of a renamed container (e.g. a claimed warm container) to a workspace"""
+        with transaction.atomic():
+            # A workspace holds at most one lease
+            PortLease.objects.filter(workspace=workspace).exclude(
+                container_name=from_container_name, node=self.node
+            ).update(workspace=None, container_name='', leased_at=None)
+            PortLease.objects.filter(container_name=from_container_name, node=self.node).update(
+                container_name=container_name, workspace=workspace
+            )
+
+    def release(self, container_name=None, workspace=None):
+        """Return the leases of a removed container or workspace to the free pool"""
+        if container_name is None and workspace is None:
+            return 0
+        leases = PortLease.objects.filter(leased_at__isnull=False)
+        if container_name is not None:
+            leases = leases.filter(container_name=container_name, node=self.node)
+        if workspace is not None:
+            leases = leases.filter(workspace=workspace)
+        released = leases.update(workspace=None, container_name='', leased_at=None)
+        if released:
+            logger.info(f"Released {released} port lease(s) of {container_name or f'workspace {workspace.id}'}")
+        return released
+
+    def reclaim_orphans(self, existing_container_names):
+        """Release this allocator's node's leases whose container no longer exists there"""
+        orphans = PortLease.objects.filter(leased_at__isnull=False, node=self.node).exclude(
+            container_name__in=list(existing_container_names)
+        )
+        released = orphans.update(workspace=None, container_name='', leased_at=None)
+        if released:
+            logger.info(f"Reclaimed {released} port lease(s) of removed containers")
+        return released
+
+    def _on_node(self):
+        return f" on {self.node.name}" if self.node is not None else ''
+
+    def stats(self):
+        """Get the number of leased and free ports in the range"""
+        leases = PortLease.objects.filter(node=self.node, port__gte=self.start, port__lte=self.end)
+        leased = leases.filter(leased_at__isnull=False).count()
+        return {
+            'range': [self.start, self.end],
+            'leased': leased,
+            'free': self.end - self.start + 1 - leased,
+        }
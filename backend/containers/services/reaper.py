@@ -0,0 +1,152 @@
+import os
+import sys
+import logging
+import threading
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from workspaces.models import Workspace
+
+logger = logging.getLogger(__name__)
+
+# last_accessed only needs minute resolution against a timeout of many minutes
+ACCESS_WRITE_INTERVAL = 60
+
+
+def mark_accessed(workspace_id):
+    """Record that a workspace is in use, writing at most once per ACCESS_WRITE_INTERVAL"""
+    now = timezone.now()
+    stale = now - timedelta(seconds=ACCESS_WRITE_INTERVAL)
+    Workspace.objects.filter(
+        Q(last_accessed__lt=stale) | Q(last_accessed__isnull=True), pk=workspace_id
+    ).update(last_accessed=now)
+
+
+class IdleReaper:
+    """
+    Suspends workspace containers nobody is using.
+
+    A running workspace is idle when all available signals agree for
+    IDLE_TIMEOUT_SECONDS: no owner access (``last_accessed``, set by the
+    workspace API's start, open and logs actions and by the owner's gateway
+    traffic), no code-server activity (its /healthz ``lastHeartbeat``), and average CPU
+    from the metrics sampler below IDLE_CPU_THRESHOLD percent. Idle
+    containers are paused (instant resume, memory stays resident) or stopped
+    (frees memory, resume waits for code-server to boot), per IDLE_ACTION.
+    DockerService.start_container and the gateway (for the owner) resume
+    them on next access.
+    """
+    _in_process = None
+    _in_process_lock = threading.Lock()
+
+    def __init__(self, docker_service, idle_seconds=None, cpu_threshold=None, action=None, interval=None):
+        self.docker_service = docker_service
+        self.idle_seconds = idle_seconds or settings.IDLE_TIMEOUT_SECONDS
+        self.cpu_threshold = cpu_threshold if cpu_threshold is not None else settings.IDLE_CPU_THRESHOLD
+        self.action = action or settings.IDLE_ACTION
+        self.interval = interval or settings.IDLE_REAPER_INTERVAL
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def in_process(cls, docker_service):
+        """Start the reaper inside the web process (once)"""
+        with cls._in_process_lock:
+            if cls._in_process is None:
+                cls._in_process = cls(docker_service)
+                cls._in_process.start()
+            return cls._in_process
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='idle-reaper', daemon=True)
+        self._thread.start()
+        logger.info(f"Started idle reaper ({self.action} after {self.idle_seconds}s)")
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        try:
+            while not self._stopping.wait(self.interval):
+                close_old_connections()
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Error reaping idle workspaces: {str(e)}")
+        finally:
+            connection.close()
+
+    def candidates(self):
+        """Workspaces with a container that have not been accessed within the idle timeout"""
+        cutoff = timezone.now() - timedelta(seconds=self.idle_seconds)
+        return list(
+            Workspace.objects.filter(container_id__isnull=False)
+            .filter(Q(last_accessed__lt=cutoff) | Q(last_accessed__isnull=True, updated_at__lt=cutoff))
+        )
+
+    def find_idle(self):
+        workspaces = self.candidates()
+        if not workspaces:
+            return []
+        statuses = self.docker_service.get_container_statuses(workspaces)
+        return [
+            workspace for workspace in workspaces
+            if statuses.get(workspace.id) == 'running' and not self._recently_active(workspace)
+        ]
+
+    def _recently_active(self, workspace):
+        history = self.docker_service.for_workspace(workspace).metrics.history(workspace.id)
+        # Average over the last minute so a single quiet sample doesn't count as idle
+        recent = history[-60:]
+        if recent and sum(sample['cpu_percent'] for sample in recent) / len(recent) >= self.cpu_threshold:
+            return True
+
+        last_heartbeat = self._code_server_heartbeat(workspace)
+        if last_heartbeat is not None:
+            return timezone.now().timestamp() - last_heartbeat / 1000 < self.idle_seconds
+        return False
+
+    def _code_server_heartbeat(self, workspace):
+        """Epoch milliseconds of the last code-server activity, or None if unknown"""
+        url = self.docker_service.code_server_url(workspace)
+        if not url:
+            return None
+        try:
+            response = requests.get(f"{url}/healthz", timeout=2)
+            response.raise_for_status()
+            return response.json().get('lastHeartbeat')
+        except (requests.RequestException, ValueError):
+            return None
+
+    def run_once(self, dry_run=False):
+        """Suspend every idle workspace; returns the workspaces that were (or would be) suspended"""
+        idle = self.find_idle()
+        suspended = []
+        for workspace in idle:
+            if dry_run:
+                suspended.append(workspace)
+                continue
+            if self.docker_service.suspend_container(workspace, self.action):
+                logger.info(f"Suspended idle workspace {workspace.id} ({self.action})")
+                suspended.append(workspace)
+        return suspended
+
+
+def start_reaper_on_startup(docker_service_factory):
+    """Run the idle reaper in a background thread of the web process"""
+    # Management commands such as migrate should not start it
+    if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1] != 'runserver':
+        return
+
+    def start():
+        try:
+            IdleReaper.in_process(docker_service_factory())
+        except Exception as e:
+            logger.error(f"Could not start idle reaper: {str(e)}")
+
+    threading.Thread(target=start, name='idle-reaper-start', daemon=True).start()
@@ -0,0 +1,222 @@
+import os
+import shlex
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_IMAGE = 'codercom/code-server:latest'
+
+# Installed once in the shared ide-base layer that every language image builds on
+COMMON_APT_PACKAGES = [
+    'build-essential',
+    'ca-certificates',
+    'curl',
+    'git',
+    'unzip',
+    'wget',
+]
+
+# Where template dependency manifests are installed at image build time
+TEMPLATE_CACHE_DIR = '/home/coder/.template-cache'
+PROJECT_DIR = '/home/coder/project'
+
+
+def base_dockerfile(base_image=BASE_IMAGE):
+    """Generate the Dockerfile for the shared apt layer"""
+    return f"""
+FROM {base_image}
+
+USER root
+
+# Package lists are kept so language layers can install without another update
+RUN set -ex && \\
+    apt-get update && \\
+    apt-get install -y --no-install-recommends {' '.join(COMMON_APT_PACKAGES)}
+
+USER coder
+"""
+
+
+class ImageRecipe:
+    """
+    How to build the toolchain image for one GitTemplate language.
+
+    ``dependency_files`` are the manifests copied from the template into the
+    template layer, and ``build_time_commands`` are the prefixes of template
+    setup commands that only need those manifests, so they can run once at
+    image build time instead of in every new workspace. Most toolchains
+    install into global caches; ``linked_paths`` are what they install next
+    to the manifests instead (node_modules, a venv), which each new project
+    directory gets a symlink to.
+    """
+
+    def __init__(self, language, root_commands=(), user_commands=(), env=None,
+                 verify='', dependency_files=(), build_time_commands=(), prepare_commands=(),
+                 linked_paths=()):
+        self.language = language
+        self.root_commands = list(root_commands)
+        self.user_commands = list(user_commands)
+        self.env = env or {}
+        self.verify = verify
+        self.dependency_files = list(dependency_files)
+        self.build_time_commands = list(build_time_commands)
+        self.prepare_commands = list(prepare_commands)
+        self.linked_paths = list(linked_paths)
+
+    @property
+    def image_name(self):
+        return f"ide-{self.language}"
+
+    def toolchain_dockerfile(self, base_tag):
+        """Generate the Dockerfile for the language toolchain layer"""
+        lines = [f"FROM {base_tag}", '', 'USER root']
+        for key, value in self.env.items():
+            lines.append(f"ENV {key}={value}")
+        if self.root_commands:
+            lines.append(f"RUN {' && '.join(['set -ex'] + self.root_commands)}")
+        if self.env:
+            # Login shells in the IDE terminal do not inherit the image ENV
+            exports = [f"export {key}={value}" for key, value in self.env.items()]
+            lines.append(
+                'RUN ' + ' && '.join(
+                    f"echo {shlex.quote(export)} >> {profile}"
+                    for profile in ('/etc/profile', '/home/coder/.bashrc')
+                    for export in exports
+                ) + ' && chown coder:coder /home/coder/.bashrc'
+            )
+        lines.append('USER coder')
+        if self.user_commands:
+            lines.append(f"RUN {' && '.join(['set -ex'] + self.user_commands)}")
+        if self.verify:
+            lines.append(f"RUN bash -lc {shlex.quote(self.verify)}")
+        return '\n'.join(lines) + '\n'
+
+    def template_files(self, source_dir):
+        """Read the dependency manifests present in a template checkout"""
+        files = {}
+        if not source_dir:
+            return files
+        for name in self.dependency_files:
+            path = os.path.join(source_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    files[name] = f.read()
+        return files
+
+    def template_commands(self, setup_commands):
+        """Pick the template setup commands that can run at image build time"""
+        return [
+            command for command in setup_commands or []
+            if any(command.strip().startswith(prefix) for prefix in self.build_time_commands)
+        ]
+
+    def template_dockerfile(self, toolchain_tag, files, commands):
+        """Generate the Dockerfile that pre-installs a template's dependencies"""
+        lines = [f"FROM {toolchain_tag}", '', 'USER coder', f"WORKDIR {TEMPLATE_CACHE_DIR}"]
+        for name in sorted(files):
+            lines.append(f"COPY --chown=coder:coder {name} {TEMPLATE_CACHE_DIR}/{name}")
+        # A single shell so commands like `source venv/bin/activate` carry over
+        script = ' && '.join(['set -e'] + self.prepare_commands + commands)
+        lines.append(f"RUN bash -lc {shlex.quote(script)}")
+        lines.append(f"WORKDIR {PROJECT_DIR}")
+        return '\n'.join(lines) + '\n'
+
+    def link_command(self):
+        """Shell command linking build-time artifacts into the project, or None if there are none"""
+        if not self.linked_paths:
+            return None
+        links = []
+        for name in self.linked_paths:
+            cached, linked = f"{TEMPLATE_CACHE_DIR}/{name}", f"{PROJECT_DIR}/{name}"
+            # Only when the image has it and the project does not bring its own
+            links.append(f"if [ -e {cached} ] && [ ! -e {linked} ] && [ ! -L {linked} ]; then ln -s {cached} {linked}; fi")
+        return '; '.join(links)
+
+
+NODE_SETUP = [
+    'curl -fsSL https://deb.nodesource.com/setup_20.x | bash -',
+    'apt-get install -y --no-install-recommends nodejs',
+]
+NODE_FILES = ['package.json', 'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock']
+NODE_COMMANDS = ['npm install', 'npm ci', 'yarn install']
+
+RECIPES = {
+    recipe.language: recipe for recipe in [
+        ImageRecipe(
+            'python',
+            root_commands=['apt-get install -y --no-install-recommends python3 python3-pip python3-venv python-is-python3'],
+            verify='python --version && pip --version',
+            dependency_files=['requirements.txt', 'requirements-dev.txt'],
+            build_time_commands=['python -m venv', 'source venv/bin/activate', 'pip install'],
+            linked_paths=['venv'],
+        ),
+        ImageRecipe(
+            'javascript',
+            root_commands=NODE_SETUP,
+            verify='node --version && npm --version',
+            dependency_files=NODE_FILES,
+            build_time_commands=NODE_COMMANDS,
+            linked_paths=['node_modules'],
+        ),
+        ImageRecipe(
+            'typescript',
+            root_commands=NODE_SETUP + ['npm install -g typescript'],
+            verify='node --version && tsc --version',
+            dependency_files=NODE_FILES,
+            build_time_commands=NODE_COMMANDS,
+            linked_paths=['node_modules'],
+        ),
+        ImageRecipe(
+            'java',
+            root_commands=[
+                'apt-get install -y --no-install-recommends openjdk-17-jdk-headless maven',
+                # The JDK directory is named after the architecture
+                'ln -sfn /usr/lib/jvm/java-17-openjdk-$(dpkg --print-architecture) /usr/lib/jvm/java-17-openjdk',
+            ],
+            env={'JAVA_HOME': '/usr/lib/jvm/java-17-openjdk'},
+            verify='java -version && mvn --version',
+            dependency_files=['pom.xml'],
+            # ./mvnw needs the wrapper and sources; resolving the pom fills ~/.m2
+            build_time_commands=['mvn dependency:go-offline'],
+            prepare_commands=['mvn -q dependency:go-offline'],
+        ),
+        ImageRecipe(
+            'go',
+            root_commands=[
+                'GO_TARBALL=go1.21.0.linux-$(dpkg --print-architecture).tar.gz',
+                'wget -q https://golang.org/dl/$GO_TARBALL',
+                'rm -rf /usr/local/go && tar -C /usr/local -xzf $GO_TARBALL',
+                'rm $GO_TARBALL',
+                'mkdir -p /home/coder/go/bin /home/coder/go/pkg /home/coder/go/src',
+                'chown -R coder:coder /home/coder/go',
+            ],
+            env={
+                'PATH': '/usr/local/go/bin:/home/coder/go/bin:$PATH',
+                'GOROOT': '/usr/local/go',
+                'GOPATH': '/home/coder/go',
+                'GOBIN': '/home/coder/go/bin',
+            },
+            verify='which go && go version',
+            dependency_files=['go.mod', 'go.sum'],
+            build_time_commands=['go mod download'],
+        ),
+        ImageRecipe(
+            'rust',
+            user_commands=['curl -fsSL https://sh.rustup.rs | sh -s -- -y --profile minimal'],
+            env={
+                'PATH': '/home/coder/.cargo/bin:$PATH',
+                # Compiled dependencies from the template layer are reused by workspace builds
+                'CARGO_TARGET_DIR': '/home/coder/.cargo-target',
+            },
+            verify='cargo --version && rustc --version',
+            dependency_files=['Cargo.toml', 'Cargo.lock'],
+            build_time_commands=['cargo build', 'cargo fetch'],
+            # Cargo needs a target to build the dependency graph
+            prepare_commands=['mkdir -p src', 'test -f src/main.rs || echo "fn main() {}" > src/main.rs'],
+        ),
+    ]
+}
+
+
+def get_recipe(language):
+    return RECIPES.get((language or '').lower())
@@ -0,0 +1,183 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from workspaces.models import Workspace
+from ..models import DockerNode
+from ..runtime import ContainerNotFound, ContainerRuntimeError
+from .metrics import compute_sample
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('cpu', 'ram_gb', 'disk_gb')
+
+
+class NoCapacity(Exception):
+    """Raised when no schedulable node has room for a workspace"""
+
+
+def requirements(resource_class):
+    """What a workspace of a resource class reserves on its node"""
+    return {
+        'cpu': resource_class.cpu_count,
+        'ram_gb': resource_class.ram_gb,
+        'disk_gb': resource_class.disk_space_gb,
+    }
+
+
+def committed_usage():
+    """{node id: resources reserved by the workspaces placed on it, plus their count}"""
+    rows = (
+        Workspace.objects.filter(node__isnull=False)
+        .values('node_id')
+        .annotate(
+            cpu=Sum('resource_class__cpu_count'),
+            ram_gb=Sum('resource_class__ram_gb'),
+            disk_gb=Sum('resource_class__disk_space_gb'),
+            workspaces=Count('id'),
+        )
+    )
+    return {row.pop('node_id'): row for row in rows}
+
+
+class NodeScheduler:
+    """
+    Places workspaces on registered Docker nodes.
+
+    A workspace reserves its resource class's CPUs, RAM and disk on the node
+    it is placed on for as long as it lives there; stopped and paused
+    containers keep theirs, since starting them again must not fail for lack
+    of room. CPU and RAM may be committed beyond a node's capacity by
+    NODE_CPU_OVERCOMMIT / NODE_RAM_OVERCOMMIT (most workspaces idle), but a
+    node whose measured RAM use (see ``refresh``) leaves no room for the
+    workspace is skipped either way.
+
+    Placement is best fit: of the healthy, schedulable nodes with room, the
+    one that is fullest afterwards wins, so nodes fill up one after another
+    and empty ones can be drained and removed. With no node registered,
+    workspaces stay on the default runtime.
+    """
+
+    def __init__(self, cpu_overcommit=None, ram_overcommit=None):
+        self.cpu_overcommit = cpu_overcommit or settings.NODE_CPU_OVERCOMMIT
+        self.ram_overcommit = ram_overcommit or settings.NODE_RAM_OVERCOMMIT
+
+    @staticmethod
+    def enabled():
+        return DockerNode.objects.exists()
+
+    def capacity(self, node):
+        """Resources that may be committed on a node"""
+        return {
+            'cpu': node.cpu_capacity * self.cpu_overcommit,
+            'ram_gb': node.ram_gb_capacity * self.ram_overcommit,
+            'disk_gb': node.disk_gb_capacity,
+        }
+
+    def fits(self, node, need, committed):
+        capacity = self.capacity(node)
+        if any((committed.get(key) or 0) + need[key] > capacity[key] for key in RESOURCES):
+            return False
+        # Reservations can be overcommitted, physical memory cannot
+        return node.used_ram_gb + need['ram_gb'] <= node.ram_gb_capacity
+
+    def score(self, node, need, committed):
+        """Average utilization of the node once the workspace is placed; higher is a tighter fit"""
+        capacity = self.capacity(node)
+        return sum(
+            ((committed.get(key) or 0) + need[key]) / capacity[key]
+            for key in RESOURCES if capacity[key]
+        ) / len(RESOURCES)
+
+    def choose(self, resource_class, nodes, usage=None):
+        """The best fitting node for a resource class, or None"""
+        need = requirements(resource_class)
+        usage = committed_usage() if usage is None else usage
+        candidates = [node for node in nodes if self.fits(node, need, usage.get(node.id, {}))]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda node: (self.score(node, need, usage.get(node.id, {})), node.name))
+
+    def place(self, workspace):
+        """
+        Assign a workspace to a node unless it already has one. Returns the
+        node, or None when no nodes are registered; raises NoCapacity when
+        none has room.
+        """
+        if workspace.node_id or not self.enabled():
+            return workspace.node if workspace.node_id else None
+
+        with transaction.atomic():
+            # Locking the candidate nodes serializes placements, so two
+            # workspaces cannot both take the last room on a node
+            nodes = list(
+                DockerNode.objects.select_for_update()
+                .filter(is_schedulable=True, is_healthy=True)
+                .order_by('name')
+            )
+            node = self.choose(workspace.resource_class, nodes)
+            if node is None:
+                raise NoCapacity(
+                    f"No node has room for {workspace.resource_class.name} "
+                    f"({workspace.resource_class.cpu_count} CPU, {workspace.resource_class.ram_gb} GB RAM, "
+                    f"{workspace.resource_class.disk_space_gb} GB disk)"
+                )
+            Workspace.objects.filter(pk=workspace.pk).update(node=node)
+        workspace.node = node
+        logger.info(f"Placed workspace {workspace.id} on node {node.name}")
+        return node
+
+    def release(self, workspace):
+        """Give up a workspace's reservation (it has no container left on its node)"""
+        if workspace.node_id:
+            Workspace.objects.filter(pk=workspace.pk).update(node=None)
+            workspace.node = None
+
+    def refresh(self, node, runtime):
+        """Check a node's daemon and record what its running workspace containers actually use"""
+        try:
+            runtime.ping()
+            containers = runtime.list(name='workspace_', status='running')
+        except ContainerRuntimeError as e:
+            logger.warning(f"Node {node.name} is unreachable: {str(e)}")
+            node.is_healthy = False
+            node.save(update_fields=['is_healthy'])
+            return node
+
+        def sample(container):
+            try:
+                return compute_sample(runtime.stats(container.id))
+            except ContainerNotFound:
+                return None
+
+        # docker stats without streaming waits for a CPU reading per container
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            samples = [s for s in executor.map(sample, containers) if s]
+        node.used_cpu = round(sum(s['cpu_percent'] for s in samples) / 100, 2)
+        node.used_ram_gb = round(sum(s['memory_bytes'] for s in samples) / 1024 ** 3, 2)
+        node.running_containers = len(containers)
+        node.is_healthy = True
+        node.last_seen = timezone.now()
+        node.save(update_fields=['used_cpu', 'used_ram_gb', 'running_containers', 'is_healthy', 'last_seen'])
+        return node
+
+    def report(self, nodes=None):
+        """Capacity, committed and measured usage of every node"""
+        usage = committed_usage()
+        nodes = nodes if nodes is not None else DockerNode.objects.all()
+        return [
+            {
+                'name': node.name,
+                'schedulable': node.is_schedulable,
+                'healthy': node.is_healthy,
+                'workspaces': usage.get(node.id, {}).get('workspaces', 0),
+                'capacity': self.capacity(node),
+                'committed': {key: usage.get(node.id, {}).get(key) or 0 for key in RESOURCES},
+                'used': {'cpu': node.used_cpu, 'ram_gb': node.used_ram_gb},
+                'running_containers': node.running_containers,
+                'last_seen': node.last_seen.isoformat() if node.last_seen else None,
+            }
+            for node in nodes
+        ]
@@ -0,0 +1,47 @@
+import time
+import threading
+from contextlib import contextmanager
+
+_recorders = []
+_recorders_lock = threading.Lock()
+
+
+class StageRecorder:
+    """
+    Collects how long each named provisioning stage takes while active.
+
+    Used as a context manager by the workspace benchmark; outside of one,
+    ``stage`` blocks cost a single list check.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with _recorders_lock:
+            _recorders.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _recorders_lock:
+            _recorders.remove(self)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as ``name`` for any active StageRecorder"""
+    if not _recorders:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for recorder in list(_recorders):
+            recorder.record(name, elapsed)
@@ -0,0 +1,140 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from workspaces.models import Workspace
+from ..runtime import ContainerNotFound
+from .docker_service import DockerService
+from .image_cache import ImageNotBuilt
+
+logger = logging.getLogger(__name__)
+
+
+class UpgradeResult:
+    """Outcome of recreating one workspace's container on its current image"""
+
+    def __init__(self, workspace, from_image, to_image, seconds=0.0, error=None):
+        self.workspace = workspace
+        self.from_image = from_image
+        self.to_image = to_image
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {
+            'id': self.workspace.id,
+            'name': self.workspace.name,
+            'from_image': self.from_image,
+            'to_image': self.to_image,
+            'ok': self.ok,
+            'error': self.error,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+class RollingUpgrader:
+    """
+    Moves workspace containers onto the images they would get today.
+
+    A container is stale when its image id differs from the id of the image
+    resolve_image returns for its workspace now, which covers rebuilt
+    recipe layers as well as a newly pulled code-server base. Stale
+    containers are recreated through DockerService.recreate_container
+    against the same bind-mounted project directory, without seeding files
+    again, ``batch_size`` at a time with ``pause`` seconds between batches.
+    Every workspace being recreated or left broken by a failed recreation
+    counts against ``max_unavailable``; batches shrink to the remaining
+    budget and the rollout halts once it is used up.
+    """
+
+    def __init__(self, docker_service=None, batch_size=None, max_unavailable=None, pause=None):
+        self.docker_service = docker_service or DockerService.in_process()
+        self.batch_size = batch_size or settings.UPGRADE_BATCH_SIZE
+        self.max_unavailable = max_unavailable or settings.UPGRADE_MAX_UNAVAILABLE
+        self.pause = pause if pause is not None else settings.UPGRADE_BATCH_PAUSE
+
+    def candidates(self):
+        return Workspace.objects.filter(container_id__isnull=False).select_related(
+            'git_template', 'resource_class', 'owner'
+        ).order_by('id')
+
+    def find_stale(self, workspaces=None, build=True):
+        """
+        (workspace, image it runs, image it should run) for every outdated
+        container. Missing image layers are built (and the base pulled) so
+        the target can be compared; with ``build=False`` nothing is built
+        and a container whose target still needs a build is reported as
+        stale with that image's tag, marked as not built, as its target.
+        Only the ``build=True`` result can be passed to run().
+        """
+        stale = []
+        for workspace in (workspaces if workspaces is not None else self.candidates()):
+            service = self.docker_service.for_workspace(workspace)
+            try:
+                container = service.runtime.inspect(workspace.container_id)
+                image = service._get_image_for_workspace(workspace, build)
+                target = service.runtime.image(image)
+            except ContainerNotFound:
+                continue
+            except ImageNotBuilt as e:
+                # The container cannot run an image that does not exist yet
+                stale.append((workspace, container.image or container.image_id, f"{e.tag} (not built)"))
+                continue
+            except Exception as e:
+                logger.error(f"Could not resolve the image of workspace {workspace.id}: {str(e)}")
+                continue
+            if target is not None and container.image_id != target.id:
+                stale.append((workspace, container.image or container.image_id, image))
+        return stale
+
+    def _upgrade(self, item):
+        close_old_connections()
+        workspace, from_image, to_image = item
+        started = time.monotonic()
+        try:
+            if self.docker_service.recreate_container(workspace, to_image):
+                return UpgradeResult(workspace, from_image, to_image, time.monotonic() - started)
+            error = 'Failed to recreate container'
+        except Exception as e:
+            error = str(e)
+        logger.error(f"Upgrade of workspace {workspace.id} to {to_image} failed: {error}")
+        return UpgradeResult(workspace, from_image, to_image, time.monotonic() - started, error)
+
+    def run(self, stale):
+        """Recreate the stale containers in batches; returns (results, halted)"""
+        results = []
+        unavailable = 0
+        index = 0
+        while index < len(stale):
+            budget = self.max_unavailable - unavailable
+            if budget <= 0:
+                logger.error(f"Halting upgrade: {unavailable} workspace(s) failed, {len(stale) - index} left as they are")
+                return results, True
+            batch = stale[index:index + min(self.batch_size, budget)]
+            index += len(batch)
+            with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix='upgrade') as executor:
+                batch_results = list(executor.map(self._upgrade, batch))
+            results.extend(batch_results)
+            unavailable += sum(1 for result in batch_results if not result.ok)
+            logger.info(f"Upgraded {index} of {len(stale)} stale workspace(s)")
+            if index < len(stale) and self.pause:
+                time.sleep(self.pause)
+        return results, False
+
+
+def upgrade_report(stale, results, halted, seconds):
+    failed = sum(1 for result in results if not result.ok)
+    return {
+        'stale': len(stale),
+        'upgraded': len(results) - failed,
+        'failed': failed,
+        'skipped': len(stale) - len(results),
+        'halted': halted,
+        'seconds': round(seconds, 3),
+        'results': [result.as_dict() for result in results],
+    }
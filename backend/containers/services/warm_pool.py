@@ -0,0 +1,296 @@
+import os
+import queue
+import shutil
+import logging
+import secrets
+import threading
+from collections import defaultdict, deque
+from django.conf import settings
+from ..runtime import ContainerNotFound
+
+logger = logging.getLogger(__name__)
+
+WARM_POOL_LABEL = 'ide.warm_pool'
+WARM_POOL_KEY_LABEL = 'ide.warm_pool.key'
+PROJECT_PATH = '/home/coder/project'
+
+
+class WarmContainer:
+    """An idle, already started code-server container waiting for a workspace"""
+
+    def __init__(self, container_id, name, password, host_dir):
+        self.container_id = container_id
+        self.name = name
+        self.password = password
+        self.host_dir = host_dir
+
+
+class WarmPool:
+    """
+    Keeps a number of pre-started code-server containers per
+    (image, ResourceClass) pair so workspace creation does not wait for a
+    cold container boot.
+
+    Each warm container bind-mounts an empty directory under
+    WORKSPACE_ROOT/.warm at the project path. Claiming a container moves the
+    workspace files into that directory and renames it to the workspace
+    directory; the running container keeps the mounted directory, so it sees
+    the project without a restart or a copy through the Docker API. Docker
+    resolves a bind mount's source by path each time the container starts,
+    so the old path is left behind as a symlink to the workspace directory
+    for later stops and starts. Only daemons sharing this host's filesystem
+    get a pool.
+    """
+
+    def __init__(self, docker_service):
+        self.docker_service = docker_service
+        self.warm_root = os.path.join(settings.WORKSPACE_ROOT, '.warm')
+        self._lock = threading.Lock()
+        self._available = defaultdict(deque)
+        self._pending = defaultdict(int)
+        self._resource_classes = {}
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self._refill_queue = queue.Queue()
+        self._refill_thread = None
+        self._reclaimed = False
+
+    @property
+    def runtime(self):
+        return self.docker_service.runtime
+
+    def _key(self, image, resource_class):
+        return (image, resource_class.id)
+
+    def size_for(self, resource_class):
+        """Get the configured pool size for a resource class"""
+        return int(settings.WARM_POOL_SIZES.get(resource_class.name, settings.WARM_POOL_DEFAULT_SIZE))
+
+    def _enabled_for(self, resource_class):
+        # Warm directories are moved on this host, which a remote daemon would not see
+        return self.size_for(resource_class) > 0 and self.docker_service._daemon_is_local()
+
+    def _ensure_refill_thread(self):
+        with self._lock:
+            if self._refill_thread is not None and self._refill_thread.is_alive():
+                return
+            self._refill_thread = threading.Thread(
+                target=self._refill_loop, name='warm-pool-refill', daemon=True
+            )
+            self._refill_thread.start()
+
+    def _refill_loop(self):
+        while True:
+            key = self._refill_queue.get()
+            try:
+                self._refill(key)
+            except Exception as e:
+                logger.error(f"Error refilling warm pool for {key}: {str(e)}")
+
+    def _refill(self, key):
+        image, _ = key
+        resource_class = self._resource_classes[key]
+        target = self.size_for(resource_class)
+        while True:
+            with self._lock:
+                if len(self._available[key]) + self._pending[key] >= target:
+                    return
+                self._pending[key] += 1
+            try:
+                warm = self._start_warm_container(image, resource_class)
+            finally:
+                with self._lock:
+                    self._pending[key] -= 1
+            if warm is None:
+                return
+            with self._lock:
+                self._available[key].append(warm)
+            logger.info(f"Added warm container {warm.name} to pool for {image} / {resource_class.name}")
+
+    def _start_warm_container(self, image, resource_class):
+        """Create and start one idle container for the pool"""
+        token = secrets.token_hex(6)
+        name = f"warm_{token}"
+        host_dir = os.path.join(self.warm_root, token)
+        password = self.docker_service._generate_password()
+        try:
+            os.makedirs(host_dir, exist_ok=True)
+            os.chmod(host_dir, 0o777)
+
+            container_config = self.docker_service._container_config(image, resource_class, password)
+            container_config['name'] = name
+            container_config['volumes'][host_dir] = {'bind': PROJECT_PATH, 'mode': 'rw'}
+            if self.docker_service._publishes_ports():
+                # Leased up front so the port stays with the container once it is claimed
+                container_config['ports'] = {'8080/tcp': self.docker_service.allocate_port(name)}
+            container_config['labels'] = {
+                WARM_POOL_LABEL: '1',
+                WARM_POOL_KEY_LABEL: f"{image}|{resource_class.id}",
+            }
+
+            container = self.runtime.create(container_config)
+            return WarmContainer(container.id, name, password, host_dir)
+        except Exception as e:
+            logger.error(f"Failed to start warm container for {image}: {str(e)}")
+            self.docker_service.ports.release(container_name=name)
+            self._remove_dir(host_dir)
+            return None
+
+    def reclaim(self):
+        """Adopt warm containers left running by a previous process"""
+        with self._lock:
+            if self._reclaimed:
+                return
+            self._reclaimed = True
+
+        try:
+            containers = self.runtime.list(label=WARM_POOL_LABEL, details=True)
+        except Exception as e:
+            logger.error(f"Failed to list warm containers: {str(e)}")
+            return
+
+        # Links left by claimed containers whose workspace directory is gone
+        if os.path.isdir(self.warm_root):
+            for entry in os.listdir(self.warm_root):
+                path = os.path.join(self.warm_root, entry)
+                if os.path.islink(path) and not os.path.exists(path):
+                    os.unlink(path)
+
+        for container in containers:
+            # Claimed containers keep their label but have been renamed
+            if not container.name.startswith('warm_'):
+                continue
+            image, _, resource_class_id = container.labels.get(WARM_POOL_KEY_LABEL, '').rpartition('|')
+            env = container.env
+            host_dir = os.path.join(self.warm_root, container.name[len('warm_'):])
+            if container.status != 'running' or not image or 'PASSWORD' not in env or not os.path.isdir(host_dir):
+                self._discard(container.id, container.name, host_dir)
+                continue
+            with self._lock:
+                self._available[(image, int(resource_class_id))].append(
+                    WarmContainer(container.id, container.name, env['PASSWORD'], host_dir)
+                )
+            logger.info(f"Reclaimed warm container {container.name}")
+
+    def _discard(self, container_id, name, host_dir):
+        try:
+            self.runtime.remove(container_id, force=True)
+        except ContainerNotFound:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to remove warm container {container_id}: {str(e)}")
+            return
+        self.docker_service.ports.release(container_name=name)
+        self._remove_dir(host_dir)
+
+    def _remove_dir(self, host_dir):
+        """Remove a warm directory, or the link a claimed one left behind; never the workspace it points to"""
+        if host_dir is None:
+            return
+        if os.path.islink(host_dir):
+            os.unlink(host_dir)
+        else:
+            shutil.rmtree(host_dir, ignore_errors=True)
+
+    def forget(self, container):
+        """Drop the link a claimed container's project mount goes through, once the container is removed"""
+        for source, destination in container.mounts:
+            if destination == PROJECT_PATH and os.path.dirname(source) == self.warm_root and os.path.islink(source):
+                os.unlink(source)
+
+    def schedule_refill(self, image, resource_class):
+        """Ask the background thread to top up the pool for this key"""
+        if not self._enabled_for(resource_class):
+            return
+        key = self._key(image, resource_class)
+        with self._lock:
+            self._resource_classes[key] = resource_class
+        self._ensure_refill_thread()
+        self._refill_queue.put(key)
+
+    def acquire(self, image, resource_class):
+        """Take a running warm container for this key, or None on a miss"""
+        if not self._enabled_for(resource_class):
+            return None
+
+        self.reclaim()
+        key = self._key(image, resource_class)
+        warm = None
+        while True:
+            with self._lock:
+                if not self._available[key]:
+                    break
+                candidate = self._available[key].popleft()
+            try:
+                container = self.runtime.inspect(candidate.container_id)
+                if container.status == 'running':
+                    warm = candidate
+                    break
+            except Exception as e:
+                logger.warning(f"Warm container {candidate.name} is unusable: {str(e)}")
+            self._discard(candidate.container_id, candidate.name, candidate.host_dir)
+
+        with self._lock:
+            if warm:
+                self._hits[key] += 1
+            else:
+                self._misses[key] += 1
+        self.schedule_refill(image, resource_class)
+        return warm
+
+    def attach(self, warm, workspace_path):
+        """Hand the workspace directory to a warm container"""
+        # Move the template files into the directory the container already has
+        # mounted, then give that directory the workspace's name.
+        if os.path.ismount(workspace_path):
+            raise OSError(f"{workspace_path} is a mount point and cannot be moved into a warm container")
+        moved = []
+        try:
+            if os.path.isdir(workspace_path):
+                for entry in os.listdir(workspace_path):
+                    os.rename(os.path.join(workspace_path, entry), os.path.join(warm.host_dir, entry))
+                    moved.append(entry)
+                os.rmdir(workspace_path)
+            os.rename(warm.host_dir, workspace_path)
+        except OSError:
+            self._restore(warm, workspace_path, moved)
+            raise
+        os.symlink(workspace_path, warm.host_dir)
+
+    def _restore(self, warm, workspace_path, moved):
+        """Put files moved by a failed attach back into the workspace directory"""
+        try:
+            os.makedirs(workspace_path, exist_ok=True)
+            for entry in moved:
+                os.rename(os.path.join(warm.host_dir, entry), os.path.join(workspace_path, entry))
+        except OSError as e:
+            logger.error(f"Could not move workspace files back from {warm.host_dir}: {str(e)}")
+            # Keep the directory; it holds workspace files
+            warm.host_dir = None
+
+    def release(self, warm):
+        """Return a warm container that could not be attached"""
+        self._discard(warm.container_id, warm.name, warm.host_dir)
+
+    def stats(self):
+        """Get hit/miss counters and current availability per pool key"""
+        with self._lock:
+            keys = set(self._available) | set(self._hits) | set(self._misses)
+            pools = []
+            for image, resource_class_id in sorted(keys, key=str):
+                key = (image, resource_class_id)
+                resource_class = self._resource_classes.get(key)
+                pools.append({
+                    'image': image,
+                    'resource_class': resource_class_id,
+                    'target_size': self.size_for(resource_class) if resource_class else None,
+                    'available': len(self._available[key]),
+                    'pending': self._pending[key],
+                    'hits': self._hits[key],
+                    'misses': self._misses[key],
+                })
+            return {
+                'hits': sum(self._hits.values()),
+                'misses': sum(self._misses.values()),
+                'pools': pools,
+            }
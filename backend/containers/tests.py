@@ -1,3 +1,1247 @@
-from django.test import TestCase
+import io
+import os
+import json
+import tarfile
+import shutil
+import tempfile
+import threading
+import time
+import asyncio
+import httpx
+import requests
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from docker.errors import DockerException
+from websockets.asyncio.server import serve as websocket_serve
+from workspaces.models import GitTemplate, ResourceClass, Workspace
+from .gateway import UpstreamResolver, UpstreamUnavailable, WorkspaceGateway, issue_ticket, ticket_user
+from .benchmark import OPERATIONS, WorkspaceBenchmark, compare, percentile, summarize
+from .models import DockerNode, PortLease
+from .runtime import ContainerNotFound, ContainerRuntimeError, FakeRuntime, set_runtime
+from .services import DockerService
+from .services.events import EVENT_STATES, ContainerEventWatcher
+from .services.archive import ArchiveTooLarge, stream_tar
+from .services.client import DockerClientProvider
+from .services.image_cache import ImageCache
+from .services.log_stream import END, LogStreamHub
+from .services.metrics import MetricsSampler, compute_sample
+from .services.admission import AdmissionController, AdmissionTimeout, QuotaExceeded
+from .services.recipes import BASE_IMAGE, TEMPLATE_CACHE_DIR, get_recipe
+from .services.ports import PortAllocator, PortRangeExhausted
+from .services.reaper import IdleReaper
+from .services.scheduler import NoCapacity, NodeScheduler
+from .services.upgrade import RollingUpgrader
 
-# Create your tests here.
+
+class BenchmarkStatisticsTests(TestCase):
+    def test_percentile_interpolates(self):
+        values = [1, 2, 3, 4]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 2.5)
+        self.assertEqual(percentile(values, 100), 4)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize_reports_milliseconds(self):
+        summary = summarize([0.001, 0.002, 0.003], errors=1)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['p50_ms'], 2.0)
+        self.assertEqual(summary['max_ms'], 3.0)
+
+    def test_compare_flags_slower_percentiles(self):
+        baseline = {'operations': {'start': {'p50_ms': 10.0, 'p95_ms': 20.0}}, 'stages': {}}
+        current = {'operations': {'start': {'p50_ms': 10.5, 'p95_ms': 30.0}}, 'stages': {}}
+        regressions = compare(baseline, current, threshold=0.1)
+        self.assertEqual([(r['name'], r['metric']) for r in regressions], [('start', 'p95_ms')])
+
+
+class FakeRuntimeTests(TestCase):
+    def setUp(self):
+        self.runtime = FakeRuntime(seed=1)
+
+    def test_lifecycle_follows_docker_semantics(self):
+        container = self.runtime.create({'name': 'workspace_1', 'ports': {'8080/tcp': 20001}, 'network': 'ide'})
+        self.assertEqual(container.status, 'running')
+        self.assertEqual(container.ports, {'8080/tcp': 20001})
+        self.assertIn('ide', container.networks)
+
+        with self.assertRaises(ContainerRuntimeError):
+            self.runtime.create({'name': 'workspace_1'})
+
+        self.runtime.pause(container.id)
+        with self.assertRaises(ContainerRuntimeError):
+            self.runtime.start(container.id)
+        self.runtime.unpause(container.id)
+        with self.assertRaises(ContainerRuntimeError):
+            self.runtime.remove(container.id)
+
+        self.runtime.stop(container.id)
+        self.assertEqual(self.runtime.statuses([container.id, 'missing']), {container.id: 'exited'})
+        self.runtime.remove(container.id)
+        with self.assertRaises(ContainerNotFound):
+            self.runtime.inspect(container.id)
+
+    def test_failure_rate_applies_to_state_changes(self):
+        runtime = FakeRuntime(failure_rate=1.0)
+        with self.assertRaises(ContainerRuntimeError):
+            runtime.create({'name': 'workspace_1'})
+        # Reads never fail
+        self.assertEqual(runtime.list(), [])
+
+
+class WorkspaceLifecycleBenchmarkTests(TestCase):
+    """Runs the lifecycle benchmark against the in-memory runtime"""
+
+    def setUp(self):
+        # Workspace containers mount ~/.ssh read-only, so give them one
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        self.addCleanup(set_runtime, None)
+
+    def test_reports_every_operation_and_stage(self):
+        set_runtime(FakeRuntime(seed=1))
+        report = WorkspaceBenchmark(iterations=3, template_files=5, seed_mode='copy').run()
+
+        for operation in OPERATIONS:
+            self.assertEqual(report['operations'][operation]['count'], 3, operation)
+            self.assertEqual(report['operations'][operation]['errors'], 0, operation)
+        for stage in ('template_fetch', 'image_resolve', 'container_run', 'seed_copy', 'db_save'):
+            self.assertEqual(report['stages'][stage]['count'], 3, stage)
+        self.assertEqual(report['meta']['runtime'], 'fake')
+        self.assertFalse(Workspace.objects.exists())
+        json.dumps(report)
+
+    def test_runtime_failures_are_counted(self):
+        set_runtime(FakeRuntime(seed=1, failure_rate=1.0))
+        report = WorkspaceBenchmark(iterations=2, template_files=5).run()
+
+        self.assertEqual(report['operations']['create']['count'], 2)
+        self.assertEqual(report['operations']['provision']['errors'], 2)
+        self.assertEqual(report['operations']['start']['count'], 0)
+        self.assertEqual(report['operations']['delete']['count'], 2)
+        self.assertTrue(report['errors'])
+
+
+class NodeSchedulerTests(TestCase):
+    """Bin-packs workspaces onto fake nodes standing in for remote Docker hosts"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        # The default runtime must not be used once nodes are registered
+        set_runtime(FakeRuntime())
+        self.addCleanup(set_runtime, None)
+        self.addCleanup(DockerService._nodes.clear)
+
+        self.user = get_user_model().objects.create_user(username='scheduler', password='secret')
+        self.resource_class = ResourceClass.objects.create(
+            name='Small', cpu_count=2, ram_gb=4, disk_space_gb=20, price_per_hour=0.5
+        )
+        self.small = DockerNode.objects.create(
+            name='small', driver='fake', public_host='small.example.com',
+            cpu_capacity=4, ram_gb_capacity=8, disk_gb_capacity=100,
+        )
+        self.large = DockerNode.objects.create(
+            name='large', driver='fake', public_host='large.example.com',
+            cpu_capacity=8, ram_gb_capacity=16, disk_gb_capacity=200,
+        )
+        self.scheduler = NodeScheduler()
+
+    def _workspace(self):
+        return Workspace.objects.create(name='ws', owner=self.user, resource_class=self.resource_class)
+
+    def test_fills_the_fullest_node_first(self):
+        placements = [self.scheduler.place(self._workspace()).name for _ in range(6)]
+        self.assertEqual(placements, ['small', 'small', 'large', 'large', 'large', 'large'])
+        with self.assertRaises(NoCapacity):
+            self.scheduler.place(self._workspace())
+
+    def test_skips_drained_unhealthy_and_memory_bound_nodes(self):
+        self.small.is_schedulable = False
+        self.small.save()
+        self.assertEqual(self.scheduler.place(self._workspace()), self.large)
+
+        self.large.used_ram_gb = 14
+        self.large.save()
+        with self.assertRaises(NoCapacity):
+            self.scheduler.place(self._workspace())
+
+    def test_overcommit_allows_more_reservations(self):
+        scheduler = NodeScheduler(cpu_overcommit=2, ram_overcommit=2)
+        self.large.delete()
+        placements = [scheduler.place(self._workspace()) for _ in range(4)]
+        self.assertEqual(set(placements), {self.small})
+
+    def test_lifecycle_runs_on_the_owning_node(self):
+        docker_service = DockerService()
+        workspace = self._workspace()
+
+        self.assertTrue(docker_service.start_container(workspace))
+        workspace.refresh_from_db()
+        self.assertEqual(workspace.node, self.small)
+        node_runtime = DockerService.for_node(self.small).runtime
+        self.assertEqual(node_runtime.inspect(workspace.container_id).status, 'running')
+        self.assertEqual(docker_service.runtime.list(), [])
+        self.assertTrue(workspace.container_url.startswith('http://small.example.com:'))
+
+        self.assertTrue(docker_service.stop_container(workspace))
+        self.assertEqual(docker_service.get_container_statuses([workspace]), {workspace.id: 'exited'})
+
+        self.assertTrue(docker_service.delete_container(workspace))
+        workspace.refresh_from_db()
+        self.assertIsNone(workspace.node)
+        self.assertEqual(node_runtime.list(), [])
+
+    def test_default_runtime_leaves_other_nodes_alone(self):
+        docker_service = DockerService()
+        node_service = DockerService.for_node(self.small)
+        workspace = self._workspace()
+        self.assertTrue(docker_service.start_container(workspace))
+        node_service.ports.allocate('warm_abc')
+
+        # Neither the default runtime's watcher nor its port reclaim knows these containers
+        ContainerEventWatcher().reconcile()
+        docker_service.ports.reclaim_orphans([])
+        workspace.refresh_from_db()
+        self.assertIsNotNone(workspace.container_id)
+        self.assertEqual(PortLease.objects.filter(node=self.small, leased_at__isnull=False).count(), 2)
+
+        ContainerEventWatcher(node_service.runtime, node=self.small).reconcile()
+        node_service.ports.reclaim_orphans([container.name for container in node_service.runtime.list()])
+        workspace.refresh_from_db()
+        self.assertTrue(workspace.is_running)
+        self.assertEqual(list(PortLease.objects.filter(leased_at__isnull=False).values_list('workspace', flat=True)), [workspace.id])
+
+    def test_each_node_has_its_own_port_range(self):
+        ports = [
+            service.ports.allocate(f"warm_{index}")
+            for index, service in enumerate((DockerService(), DockerService.for_node(self.small), DockerService.for_node(self.large)))
+        ]
+        self.assertEqual(ports, [settings.WORKSPACE_PORT_RANGE_START] * 3)
+        self.assertEqual(DockerService.for_node(self.small).ports.stats()['leased'], 1)
+
+    @override_settings(WORKSPACE_GATEWAY_ENABLED=True)
+    def test_gateway_reaches_nodes_on_published_ports(self):
+        workspace = self._workspace()
+        self.assertTrue(DockerService().start_container(workspace))
+        workspace.refresh_from_db()
+        self.assertEqual(workspace.node, self.small)
+        self.assertIsNotNone(workspace.container_port)
+        address = async_to_sync(UpstreamResolver(ttl=0).resolve)(workspace.id)
+        self.assertEqual(address, f"small.example.com:{workspace.container_port}")
+
+    def test_refresh_records_measured_usage(self):
+        runtime = DockerService.for_node(self.small).runtime
+        runtime.create({'name': 'workspace_1'})
+        self.scheduler.refresh(self.small, runtime)
+        self.small.refresh_from_db()
+        self.assertTrue(self.small.is_healthy)
+        self.assertEqual(self.small.running_containers, 1)
+        self.assertGreater(self.small.used_ram_gb, 0)
+        self.assertIsNotNone(self.small.last_seen)
+
+
+class AdmissionControllerTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='admission', password='secret')
+        self.other = get_user_model().objects.create_user(username='admission-other', password='secret')
+
+    def _workspace(self, owner, container_status='stopped'):
+        return Workspace.objects.create(name='ws', owner=owner, container_status=container_status)
+
+    def _queue(self, controller, workspace, order):
+        """Start an operation that waits in the queue and appends its workspace id once admitted"""
+        depth = controller.stats()['queue_depth']
+
+        def operation():
+            with controller.admit(workspace, 'start'):
+                order.append(workspace.id)
+        thread = threading.Thread(target=operation)
+        thread.start()
+        while controller.stats()['queue_depth'] == depth:
+            time.sleep(0.001)
+        return thread
+
+    def test_waiting_users_are_served_in_turn(self):
+        controller = AdmissionController(max_in_flight=1, max_running_per_user=0, queue_timeout=5)
+        first, second, third = (self._workspace(self.user) for _ in range(3))
+        other = self._workspace(self.other)
+        order = []
+        with controller.admit(first, 'start'):
+            threads = [self._queue(controller, workspace, order) for workspace in (second, third, other)]
+            self.assertEqual(controller.stats()['queued_users'], 2)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [second.id, other.id, third.id])
+        stats = controller.stats()
+        self.assertEqual((stats['admitted'], stats['queued'], stats['in_flight']), (4, 3, 0))
+
+    def test_times_out_when_no_slot_frees(self):
+        controller = AdmissionController(max_in_flight=1, max_running_per_user=0, queue_timeout=0.05)
+        workspace = self._workspace(self.user)
+        with controller.admit(workspace, 'start'):
+            with self.assertRaises(AdmissionTimeout):
+                with controller.admit(workspace, 'stop'):
+                    pass
+        self.assertEqual(controller.stats()['timed_out'], 1)
+        self.assertEqual(controller.stats()['queue_depth'], 0)
+
+    def test_running_workspace_quota(self):
+        controller = AdmissionController(max_in_flight=0, max_running_per_user=2)
+        running = self._workspace(self.user, 'running')
+        stopped = self._workspace(self.user)
+
+        # Starting an already counted workspace again is fine
+        with controller.admit(running, 'start', starts=True):
+            pass
+        with controller.admit(stopped, 'start', starts=True):
+            # The start in flight takes the second slot
+            with self.assertRaises(QuotaExceeded):
+                controller.check_quota(self.user.id)
+        controller.check_quota(self.user.id)
+        self._workspace(self.user, 'provisioning')
+        with self.assertRaises(QuotaExceeded):
+            with controller.admit(stopped, 'start', starts=True):
+                pass
+        # Stopping never counts against the quota
+        with controller.admit(stopped, 'stop'):
+            pass
+        controller.check_quota(self.other.id)
+        self.assertEqual(controller.stats()['quota_rejected'], 2)
+
+
+class RollingUpgradeTests(TransactionTestCase):
+    """Batches run in threads with their own connections; one at a time, since SQLite locks across threads"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        self.runtime = FakeRuntime()
+        self.runtime.pull(BASE_IMAGE)
+        self.docker_service = DockerService(runtime=self.runtime)
+
+        user = get_user_model().objects.create_user(username='upgrade', password='secret')
+        self.workspaces = []
+        for i in range(3):
+            workspace = Workspace.objects.create(name=f"ws-{i}", owner=user)
+            self.assertTrue(self.docker_service.start_container(workspace))
+            self.workspaces.append(workspace)
+        self.docker_service.stop_container(self.workspaces[2])
+
+    def test_recreates_stale_containers_in_place(self):
+        upgrader = RollingUpgrader(self.docker_service, batch_size=1, max_unavailable=1, pause=0)
+        self.assertEqual(upgrader.find_stale(), [])
+
+        new_image = self.runtime.replace_image(BASE_IMAGE)
+        stale = upgrader.find_stale()
+        self.assertEqual([workspace for workspace, _, _ in stale], self.workspaces)
+        old = {w.id: (w.container_id, w.container_port) for w in self.workspaces}
+
+        results, halted = upgrader.run(stale)
+        self.assertFalse(halted)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(upgrader.find_stale(), [])
+        self.assertEqual(self.runtime.calls.get('put_archive', 0), 0)
+        for workspace in Workspace.objects.order_by('id'):
+            container = self.runtime.inspect(workspace.container_id)
+            self.assertNotEqual(workspace.container_id, old[workspace.id][0])
+            self.assertEqual(workspace.container_port, old[workspace.id][1])
+            self.assertEqual(container.image_id, new_image.id)
+            self.assertEqual(container.name, f"workspace_{workspace.id}")
+            self.assertIn((os.path.join(settings.WORKSPACE_ROOT, str(workspace.id)), '/home/coder/project'), container.mounts)
+        self.assertEqual(
+            [self.runtime.inspect(w.container_id).status for w in Workspace.objects.order_by('id')],
+            ['running', 'running', 'created'],
+        )
+        self.assertEqual(len(self.runtime.list()), 3)
+
+    def test_failures_restore_the_old_container_and_halt(self):
+        self.runtime.replace_image(BASE_IMAGE)
+        upgrader = RollingUpgrader(self.docker_service, batch_size=2, max_unavailable=1, pause=0)
+        stale = upgrader.find_stale()
+        with mock.patch.object(self.runtime, 'create', side_effect=ContainerRuntimeError('no space left')):
+            results, halted = upgrader.run(stale)
+
+        self.assertTrue(halted)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0].ok)
+        workspace = Workspace.objects.get(id=self.workspaces[0].id)
+        container = self.runtime.inspect(workspace.container_id)
+        self.assertEqual((container.name, container.status), (f"workspace_{workspace.id}", 'running'))
+        self.assertEqual(len(upgrader.find_stale()), 3)
+
+    def test_dry_run_does_not_build(self):
+        template = GitTemplate.objects.create(
+            name='Python', repository_url='https://example.com/python.git', language='python'
+        )
+        workspace = self.workspaces[0]
+        workspace.git_template = template
+        workspace.save()
+        upgrader = RollingUpgrader(self.docker_service, batch_size=1, max_unavailable=1, pause=0)
+        # The template's image has never been built
+        self.assertRegex(upgrader.find_stale(build=False)[0][2], r'^ide-base:\w+ \(not built\)$')
+        self.assertEqual(self.runtime.calls.get('build', 0), 0)
+
+        stale = upgrader.find_stale()
+        self.assertTrue(stale[0][2].startswith('ide-python:'))
+        self.assertEqual(upgrader.find_stale(build=False), stale)
+        upgrader.run(stale)
+        self.assertEqual(upgrader.find_stale(build=False), [])
+        builds = self.runtime.calls['build']
+
+        self.runtime.replace_image(BASE_IMAGE)
+        dry_run = upgrader.find_stale(build=False)
+        self.assertEqual([item[0] for item in dry_run], self.workspaces)
+        self.assertRegex(dry_run[0][2], r'^ide-base:\w+ \(not built\)$')
+        self.assertEqual(self.runtime.calls['build'], builds)
+
+
+class WarmPoolTests(TestCase):
+    """Claims pre-started containers on the in-memory runtime, with real directories on disk"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        overrides = override_settings(WORKSPACE_ROOT=os.path.join(self.home, 'workspaces'), WARM_POOL_DEFAULT_SIZE=1)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.runtime = FakeRuntime()
+        self.docker_service = DockerService(runtime=self.runtime)
+        self.pool = self.docker_service.warm_pool
+        # Refills run on a background thread; tests add warm containers themselves
+        patcher = mock.patch.object(self.pool, 'schedule_refill')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.resource_class = ResourceClass.objects.create(
+            name='Small', cpu_count=2, ram_gb=4, disk_space_gb=20, price_per_hour=0.5
+        )
+        self.workspace = Workspace.objects.create(
+            name='ws', owner=get_user_model().objects.create_user(username='warm', password='secret'),
+            resource_class=self.resource_class,
+        )
+        self.workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(self.workspace.id))
+        os.makedirs(self.workspace_path)
+        for name in ('README.md', 'main.py'):
+            with open(os.path.join(self.workspace_path, name), 'w') as f:
+                f.write(name)
+
+    def _fill(self):
+        warm = self.pool._start_warm_container(BASE_IMAGE, self.resource_class)
+        self.pool._available[self.pool._key(BASE_IMAGE, self.resource_class)].append(warm)
+        return warm
+
+    def _project_source(self, container_id):
+        return dict((destination, source) for source, destination in self.runtime.inspect(container_id).mounts)['/home/coder/project']
+
+    def test_claimed_container_keeps_the_project_across_restarts(self):
+        self._fill()
+        container = self.docker_service._claim_warm_container(self.workspace, BASE_IMAGE)
+        self.assertEqual(container.name, f"workspace_{self.workspace.id}")
+        self.workspace.container_id = container.id
+        self.workspace.save()
+
+        self.assertTrue(self.docker_service.stop_container(self.workspace))
+        self.assertTrue(self.docker_service.start_container(self.workspace))
+        source = self._project_source(container.id)
+        self.assertEqual(os.path.realpath(source), os.path.realpath(self.workspace_path))
+        self.assertEqual(sorted(os.listdir(source)), ['README.md', 'main.py'])
+
+        self.assertTrue(self.docker_service.delete_container(self.workspace))
+        self.assertFalse(os.path.lexists(source))
+        self.assertEqual(sorted(os.listdir(self.workspace_path)), ['README.md', 'main.py'])
+
+    def test_failed_attach_keeps_the_workspace_files(self):
+        warm = self._fill()
+        rename = os.rename
+        calls = []
+
+        def fail_second_move(source, destination):
+            calls.append(source)
+            if len(calls) == 2:
+                raise OSError('Invalid cross-device link')
+            rename(source, destination)
+
+        with mock.patch('os.rename', side_effect=fail_second_move):
+            self.assertIsNone(self.docker_service._claim_warm_container(self.workspace, BASE_IMAGE))
+        self.assertEqual(sorted(os.listdir(self.workspace_path)), ['README.md', 'main.py'])
+        self.assertFalse(os.path.lexists(warm.host_dir))
+        self.assertEqual(self.runtime.list(), [])
+
+    def test_claimed_and_cold_containers_get_the_same_environment(self):
+        self._fill()
+        claimed = self.docker_service._claim_warm_container(self.workspace, BASE_IMAGE)
+        other = Workspace.objects.create(name='cold', owner=self.workspace.owner, resource_class=self.resource_class)
+        cold = self.docker_service._create_container(other, BASE_IMAGE)
+
+        claimed_env = self.runtime.inspect(claimed.id).env
+        cold_env = self.runtime.inspect(cold.id).env
+        # Only the generated code-server password differs
+        self.assertEqual(claimed_env.pop('PASSWORD'), Workspace.objects.get(pk=self.workspace.pk).container_password)
+        self.assertEqual(cold_env.pop('PASSWORD'), Workspace.objects.get(pk=other.pk).container_password)
+        self.assertEqual(claimed_env, cold_env)
+
+    def test_remote_daemons_get_no_pool(self):
+        self._fill()
+        with mock.patch.object(FakeRuntime, 'shares_host_filesystem', False):
+            self.assertIsNone(self.pool.acquire(BASE_IMAGE, self.resource_class))
+
+
+class TemplateImageTests(TestCase):
+    """Template layers pre-install dependencies the project directory can then use"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        overrides = override_settings(WORKSPACE_ROOT=os.path.join(self.home, 'workspaces'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.runtime = FakeRuntime()
+        self.runtime.pull(BASE_IMAGE)
+        self.docker_service = DockerService(runtime=self.runtime)
+
+        user = get_user_model().objects.create_user(username='recipes', password='secret')
+        template = GitTemplate.objects.create(
+            name='Python Basic', repository_url='https://example.com/python.git', language='python',
+            setup_commands=['python -m venv venv', 'source venv/bin/activate', 'pip install -r requirements.txt'],
+        )
+        self.workspace = Workspace.objects.create(name='ws', owner=user, git_template=template)
+        workspace_path = os.path.join(settings.WORKSPACE_ROOT, str(self.workspace.id))
+        os.makedirs(workspace_path)
+        with open(os.path.join(workspace_path, 'requirements.txt'), 'w') as f:
+            f.write('requests\n')
+
+    def test_dockerfile_installs_into_the_cache(self):
+        recipe = get_recipe('python')
+        dockerfile = recipe.template_dockerfile('ide-python:1', {'requirements.txt': b''}, ['pip install -r requirements.txt'])
+        self.assertIn(f"WORKDIR {TEMPLATE_CACHE_DIR}", dockerfile)
+        self.assertIn(f"COPY --chown=coder:coder requirements.txt {TEMPLATE_CACHE_DIR}/requirements.txt", dockerfile)
+        self.assertIsNone(get_recipe('go').link_command())
+
+    def test_new_workspaces_link_the_cached_venv(self):
+        with mock.patch.object(self.runtime, 'exec', return_value=(0, b'')) as exec_:
+            self.assertTrue(self.docker_service.initialize_container(self.workspace))
+        self.workspace.refresh_from_db()
+        self.assertIn('-template-', self.runtime.inspect(self.workspace.container_id).image)
+        (container_id, command), kwargs = exec_.call_args
+        self.assertEqual(container_id, self.workspace.container_id)
+        self.assertIn(f"ln -s {TEMPLATE_CACHE_DIR}/venv /home/coder/project/venv", command[-1])
+        self.assertEqual(kwargs, {'user': 'coder'})
+
+    def _failing_build(self, fragment):
+        build = self.runtime.build
+
+        def fake_build(path, tag, labels=None):
+            if fragment in tag:
+                yield {'error': f"failed to build {tag}"}
+                return
+            yield from build(path, tag, labels)
+        return fake_build
+
+    def test_failed_template_layer_falls_back_to_toolchain(self):
+        with mock.patch.object(self.runtime, 'build', self._failing_build('-template-')):
+            image = self.docker_service._get_image_for_workspace(self.workspace)
+        self.assertTrue(image.startswith('ide-python:'))
+        self.assertIsNotNone(self.runtime.image(image))
+
+    def test_failed_toolchain_layer_is_raised(self):
+        with mock.patch.object(self.runtime, 'build', self._failing_build('ide-python:')):
+            with self.assertRaises(Exception):
+                self.docker_service._get_image_for_workspace(self.workspace)
+
+    def test_toolchains_follow_the_host_architecture(self):
+        for language in ('java', 'go'):
+            dockerfile = get_recipe(language).toolchain_dockerfile('ide-base:1')
+            self.assertNotIn('amd64', dockerfile)
+            self.assertIn('$(dpkg --print-architecture)', dockerfile)
+
+
+class ContainerEventWatcherTests(TestCase):
+    """Follows the in-memory runtime's event stream; no Docker daemon involved"""
+
+    def setUp(self):
+        self.runtime = FakeRuntime()
+        self.watcher = ContainerEventWatcher(runtime=self.runtime)
+        user = get_user_model().objects.create_user(username='events', password='secret')
+        self.workspace = Workspace.objects.create(name='ws', owner=user)
+        self.container = self.runtime.create({'name': f"workspace_{self.workspace.id}"})
+        Workspace.objects.filter(id=self.workspace.id).update(container_id=self.container.id)
+
+    def _replay(self, stream):
+        stream.close()
+        for event in stream:
+            self.watcher.handle_event(event)
+        self.watcher.flush()
+        self.workspace.refresh_from_db()
+
+    def test_events_update_workspace_state(self):
+        stream = self.runtime.events(since=0, actions=list(EVENT_STATES))
+        self.runtime.pause(self.container.id)
+        self._replay(stream)
+        self.assertEqual((self.workspace.container_status, self.workspace.is_running), ('paused', False))
+
+        stream = self.runtime.events(actions=list(EVENT_STATES))
+        self.runtime.unpause(self.container.id)
+        self.runtime.stop(self.container.id)
+        self.runtime.remove(self.container.id)
+        self._replay(stream)
+        self.assertEqual(self.workspace.container_status, 'stopped')
+        self.assertIsNone(self.workspace.container_id)
+
+    def test_reconcile_marks_missing_containers_removed(self):
+        self.watcher.reconcile()
+        self.workspace.refresh_from_db()
+        self.assertTrue(self.workspace.is_running)
+
+        self.runtime.remove(self.container.id, force=True)
+        self.watcher.reconcile()
+        self.workspace.refresh_from_db()
+        self.assertIsNone(self.workspace.container_id)
+
+
+class GatewayResumeTests(TransactionTestCase):
+    """Only the owner's traffic keeps a workspace awake or resumes it, and resuming goes through admission"""
+
+    def setUp(self):
+        self.runtime = FakeRuntime()
+        set_runtime(self.runtime)
+        self.addCleanup(set_runtime, None)
+        self.docker_service = DockerService(runtime=self.runtime)
+        self.admission = AdmissionController(max_in_flight=0, max_running_per_user=1)
+        for target, value in ((DockerService, self.docker_service), (AdmissionController, self.admission)):
+            patcher = mock.patch.object(target, 'in_process', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.owner = get_user_model().objects.create_user(username='gateway', password='secret')
+        self.workspace = Workspace.objects.create(name='ws', owner=self.owner, container_status='paused')
+        container = self.runtime.create({'name': f"workspace_{self.workspace.id}", 'network': settings.WORKSPACE_NETWORK})
+        self.runtime.pause(container.id)
+        self.container_id = container.id
+        Workspace.objects.filter(id=self.workspace.id).update(container_id=container.id)
+        self.resolver = UpstreamResolver(ttl=0)
+
+    def _resolve(self, user_id=None):
+        return async_to_sync(self.resolver.resolve)(self.workspace.id, user_id)
+
+    def test_tickets_are_bound_to_their_workspace(self):
+        ticket = issue_ticket(self.workspace)
+        self.assertEqual(ticket_user(ticket, self.workspace.id), self.owner.id)
+        self.assertIsNone(ticket_user(ticket, self.workspace.id + 1))
+        self.assertIsNone(ticket_user(ticket + 'x', self.workspace.id))
+
+    def test_anonymous_traffic_neither_resumes_nor_counts_as_access(self):
+        with self.assertRaises(UpstreamUnavailable):
+            self._resolve()
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.runtime.inspect(self.container_id).status, 'paused')
+        self.assertIsNone(self.workspace.last_accessed)
+
+    def test_owner_resumes_through_start_container(self):
+        self.assertTrue(self._resolve(self.owner.id).endswith(':8080'))
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.runtime.inspect(self.container_id).status, 'running')
+        self.assertEqual(self.workspace.container_status, 'running')
+        self.assertIsNotNone(self.workspace.last_accessed)
+        self.assertEqual(self.admission.stats()['admitted'], 1)
+
+    def test_resume_respects_running_quota(self):
+        Workspace.objects.create(name='other', owner=self.owner, container_status='running')
+        with self.assertRaises(UpstreamUnavailable):
+            self._resolve(self.owner.id)
+        self.assertEqual(self.runtime.inspect(self.container_id).status, 'paused')
+
+
+class ImageCacheTests(TestCase):
+    """Content-addressed images on the in-memory runtime"""
+
+    def setUp(self):
+        build_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_root, ignore_errors=True)
+        overrides = override_settings(IMAGE_BUILD_ROOT=build_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Builds take long enough for every thread to ask for the image while one runs
+        self.runtime = FakeRuntime(latencies={'build': 0.2})
+        self.cache = ImageCache(DockerService(runtime=self.runtime))
+
+    def test_concurrent_requests_share_one_build(self):
+        tags = []
+        threads = [
+            threading.Thread(target=lambda: tags.append(self.cache.ensure('ide', 'FROM base\n', 'base:latest')))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(tags)), 1)
+        self.assertEqual(len(tags), 8)
+        self.assertEqual(self.runtime.calls['build'], 1)
+        self.assertIsNotNone(self.runtime.image(tags[0]))
+
+    def test_tag_follows_dockerfile_and_base_image(self):
+        tag = self.cache.ensure('ide', 'FROM base\n', 'base:latest')
+        self.assertEqual(self.cache.ensure('ide', 'FROM base\n', 'base:latest'), tag)
+        self.assertNotEqual(self.cache.ensure('ide', 'FROM base\nRUN true\n', 'base:latest'), tag)
+        self.runtime.replace_image('base:latest')
+        self.assertNotEqual(self.cache.ensure('ide', 'FROM base\n', 'base:latest'), tag)
+        self.assertEqual(self.runtime.calls['build'], 3)
+
+
+class ArchiveTests(TestCase):
+    """Seed archives stream a directory lazily, minus excluded paths"""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        for path, size in (('app.py', 10), ('src/lib.py', 20), ('node_modules/pkg/index.js', 1000),
+                           ('src/__pycache__/lib.cpython-311.pyc', 500), ('debug.log', 30)):
+            path = os.path.join(self.source, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+
+    def _names(self, chunks, mode='r|'):
+        with tarfile.open(fileobj=io.BytesIO(b''.join(chunks)), mode=mode) as tar:
+            return sorted(member.name for member in tar)
+
+    def test_excludes_directories_and_patterns(self):
+        names = self._names(stream_tar(self.source, excludes=['node_modules', '__pycache__', '*.log']))
+        self.assertEqual(names, ['app.py', 'src', 'src/lib.py'])
+
+    def test_gzip_round_trips(self):
+        names = self._names(stream_tar(self.source, excludes=['node_modules'], gzip=True), mode='r|gz')
+        self.assertIn('src/__pycache__/lib.cpython-311.pyc', names)
+        self.assertNotIn('node_modules', names)
+
+    def test_max_bytes_counts_only_included_files(self):
+        with self.assertRaises(ArchiveTooLarge):
+            stream_tar(self.source, max_bytes=100)
+        # 60 bytes remain once the large directories are excluded
+        chunks = stream_tar(self.source, excludes=['node_modules', '__pycache__'], max_bytes=60)
+        self.assertIn('debug.log', self._names(chunks))
+
+    def test_files_growing_past_max_bytes_abort_the_stream(self):
+        chunks = stream_tar(self.source, excludes=['node_modules', '__pycache__'], max_bytes=60)
+        with open(os.path.join(self.source, 'app.py'), 'ab') as f:
+            f.write(b'x' * 100)
+        with self.assertRaises(ArchiveTooLarge):
+            b''.join(chunks)
+
+
+class PortAllocatorTests(TransactionTestCase):
+    """Leases from a small range; threads use their own connections, so rows are committed"""
+
+    def setUp(self):
+        self.allocator = PortAllocator(start=30000, end=30019)
+
+    def test_concurrent_allocations_never_share_a_port(self):
+        ports, errors = [], []
+
+        def allocate(index):
+            try:
+                while True:
+                    try:
+                        ports.append(PortAllocator(start=30000, end=30019).allocate(f"warm_{index}"))
+                        return
+                    except OperationalError:
+                        # SQLite test databases lock whole tables instead of waiting
+                        if connection.vendor != 'sqlite':
+                            raise
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate, args=(index,)) for index in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(ports), list(range(30000, 30020)))
+
+    def test_exhausted_range_raises(self):
+        for index in range(20):
+            self.allocator.allocate(f"warm_{index}")
+        with self.assertRaises(PortRangeExhausted):
+            self.allocator.allocate('warm_extra')
+        self.allocator.release(container_name='warm_3')
+        self.assertEqual(self.allocator.allocate('warm_extra'), 30003)
+        self.assertEqual(self.allocator.stats(), {'range': [30000, 30019], 'leased': 20, 'free': 0})
+
+    def test_deleting_a_workspace_releases_its_port(self):
+        user = get_user_model().objects.create_user(username='ports', password='secret')
+        workspace = Workspace.objects.create(name='ws', owner=user)
+        port = self.allocator.allocate('workspace_1', workspace)
+        # A recreated container keeps the workspace's port
+        self.assertEqual(self.allocator.allocate('workspace_1', workspace), port)
+        docker_service = DockerService(runtime=FakeRuntime())
+        docker_service.ports = self.allocator
+        self.assertTrue(docker_service.delete_container(workspace))
+        self.assertFalse(PortLease.objects.filter(leased_at__isnull=False).exists())
+
+    def test_reclaim_orphans_keeps_existing_containers(self):
+        for name in ('workspace_1', 'workspace_2', 'warm_a'):
+            self.allocator.allocate(name)
+        self.assertEqual(self.allocator.reclaim_orphans(['workspace_1', 'warm_a']), 1)
+        self.assertEqual(
+            sorted(PortLease.objects.filter(leased_at__isnull=False).values_list('container_name', flat=True)),
+            ['warm_a', 'workspace_1'],
+        )
+
+
+def _stats(read, total_usage, system_usage, previous_total=0, previous_system=0, rx=0, block_read=0):
+    """A Docker stats document with the fields compute_sample reads"""
+    return {
+        'read': read,
+        'cpu_stats': {'cpu_usage': {'total_usage': total_usage}, 'system_cpu_usage': system_usage, 'online_cpus': 2},
+        'precpu_stats': {'cpu_usage': {'total_usage': previous_total}, 'system_cpu_usage': previous_system},
+        'memory_stats': {'usage': 300, 'limit': 1000, 'stats': {'inactive_file': 100}},
+        'networks': {'eth0': {'rx_bytes': rx, 'tx_bytes': 0}},
+        'blkio_stats': {'io_service_bytes_recursive': [{'op': 'Read', 'value': block_read}]},
+    }
+
+
+@override_settings(METRICS_SAMPLER='off', METRICS_HISTORY_SIZE=3)
+class MetricsSamplerTests(TestCase):
+    """Samples computed from stats documents, the rolling window and the cache handoff"""
+
+    def test_compute_sample(self):
+        sample = compute_sample(_stats('2024-01-01T00:00:00.123456789Z', 150, 1000, 100, 800))
+        # 50 of 200 system ticks on 2 CPUs
+        self.assertEqual(sample['cpu_percent'], 50.0)
+        # inactive_file is reclaimable page cache
+        self.assertEqual(sample['memory_bytes'], 200)
+        self.assertEqual(sample['memory_percent'], 20.0)
+        self.assertEqual(sample['net_rx_bps'], 0.0)
+
+        later = compute_sample(_stats('2024-01-01T00:00:02.123456789Z', 150, 1200, 150, 1000, rx=4000, block_read=1000), sample)
+        self.assertEqual(later['cpu_percent'], 0.0)
+        self.assertEqual(later['net_rx_bps'], 2000.0)
+        self.assertEqual(later['block_read_bps'], 500.0)
+
+    def test_first_document_has_no_cpu_percent(self):
+        stats = _stats('2024-01-01T00:00:00Z', 150, 1000)
+        stats['precpu_stats'] = {}
+        self.assertEqual(compute_sample(stats)['cpu_percent'], 0.0)
+
+    def test_history_keeps_the_last_samples(self):
+        documents = [_stats(f"2024-01-01T00:00:0{second}Z", second, 1000 + second) for second in range(6)]
+        # Stopped containers report empty stats before the stream ends
+        documents.insert(2, {'read': '0001-01-01T00:00:00Z'})
+        runtime = mock.Mock()
+        runtime.follow_stats.return_value = iter(documents)
+        sampler = MetricsSampler(runtime)
+        sampler._follow(7, 'container')
+
+        history = sampler.history(7)
+        self.assertEqual([sample['time'] for sample in history], [d['read'] for d in documents[-3:]])
+        self.assertNotIn('_totals', history[-1])
+        self.assertEqual(sampler.latest(7), history[-1])
+        # 'off' reads what is there without starting discovery
+        self.assertIsNone(sampler._thread)
+
+    def test_external_mode_reads_published_samples(self):
+        runtime = mock.Mock()
+        runtime.follow_stats.return_value = iter([_stats('2024-01-01T00:00:00Z', 1, 1000)])
+        sampler = MetricsSampler(runtime)
+        sampler._follow(8, 'container')
+        self.assertEqual(sampler.publish(), 1)
+        published = sampler.history(8)
+
+        with override_settings(METRICS_SAMPLER='external'):
+            reader = MetricsSampler(mock.Mock())
+            self.assertEqual(reader.history(8), published)
+            self.assertEqual(reader.latest(8)['time'], '2024-01-01T00:00:00Z')
+            self.assertEqual(reader.history(9), [])
+            self.assertIsNone(reader._thread)
+
+
+class LogStreamHubTests(TestCase):
+    """One followed log stream per container, shared by its viewers"""
+
+    def setUp(self):
+        self.runtime = FakeRuntime()
+        self.hub = LogStreamHub(DockerService(runtime=self.runtime))
+        self.container = self.runtime.create({'name': 'workspace_1'})
+
+    def _messages(self, subscription, count):
+        messages = []
+        while len(messages) < count:
+            line = subscription.get(timeout=2)
+            self.assertNotIn(line, (None, END))
+            messages.append(line.message)
+        return messages
+
+    def _write(self, *messages):
+        for message in messages:
+            self.runtime.write_log(self.container.id, message)
+            # Lines are ordered by microsecond timestamps
+            time.sleep(0.002)
+
+    def test_lines_fan_out_to_every_subscriber(self):
+        first = self.hub.subscribe(self.container.id)
+        second = self.hub.subscribe(self.container.id)
+        # Both replay the container's start line
+        self.assertEqual(len(self._messages(first, 1)), 1)
+        self.assertEqual(len(self._messages(second, 1)), 1)
+
+        self._write('one', 'two')
+        self.assertEqual(self._messages(first, 2), ['one', 'two'])
+        self.assertEqual(self._messages(second, 2), ['one', 'two'])
+        self.assertEqual(self.runtime.calls['follow_logs'], 1)
+        self.assertEqual(self.hub.stats(), {self.container.id: 2})
+        self.hub.unsubscribe(first)
+        self.hub.unsubscribe(second)
+
+    def test_since_resumes_after_the_last_seen_line(self):
+        self._write('one', 'two', 'three')
+        seen = self.runtime.logs(self.container.id)[-2].split(' ', 1)[0]
+
+        # A fresh stream replays the daemon's tail; a second viewer the hub's backlog
+        resumed = self.hub.subscribe(self.container.id, since=seen)
+        self.assertEqual(self._messages(resumed, 1), ['three'])
+        late = self.hub.subscribe(self.container.id, since=seen)
+        self.assertEqual(self._messages(late, 1), ['three'])
+
+        self._write('four')
+        self.assertEqual(self._messages(resumed, 1), ['four'])
+        self.assertIsNone(resumed.get(timeout=0.1))
+        self.hub.unsubscribe(resumed)
+        self.hub.unsubscribe(late)
+
+    def test_last_unsubscribe_closes_the_upstream_stream(self):
+        first = self.hub.subscribe(self.container.id)
+        second = self.hub.subscribe(self.container.id)
+        broadcaster = first.broadcaster
+        self._messages(first, 1)
+
+        self.hub.unsubscribe(first)
+        self.assertEqual(self.hub.stats(), {self.container.id: 1})
+        self.assertFalse(broadcaster._stream.closed)
+
+        self.hub.unsubscribe(second)
+        self.assertEqual(self.hub.stats(), {})
+        self.assertTrue(broadcaster._stream.closed)
+        broadcaster._thread.join(timeout=2)
+        self.assertFalse(broadcaster._thread.is_alive())
+
+        # The next viewer starts a new stream
+        third = self.hub.subscribe(self.container.id)
+        self.assertIsNot(third.broadcaster, broadcaster)
+        self.assertEqual(self.runtime.calls['follow_logs'], 2)
+        self.hub.unsubscribe(third)
+
+
+class _StaticResolver:
+    """Routes every workspace to one upstream address"""
+
+    def __init__(self, address):
+        self.address = address
+        self.resolved = []
+
+    async def resolve(self, workspace_id, user_id=None):
+        self.resolved.append(workspace_id)
+        return self.address
+
+    def invalidate(self, workspace_id):
+        pass
+
+
+class GatewayProxyTests(SimpleTestCase):
+    """The ASGI gateway against a mocked HTTP upstream and a local websocket server"""
+
+    def setUp(self):
+        self.received_messages = 0
+
+    def _http(self, transport, path, method='GET', headers=(), body=()):
+        """Run one HTTP request through the gateway; returns (status, headers, body, resolver)"""
+        resolver = _StaticResolver('upstream:8080')
+        gateway = WorkspaceGateway(None, resolver)
+        if not isinstance(transport, httpx.AsyncBaseTransport):
+            transport = httpx.MockTransport(transport)
+        gateway._http = httpx.AsyncClient(transport=transport)
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(b'host', b'ide.example.com'), *headers], 'client': ('10.0.0.9', 5000), 'scheme': 'http',
+        }
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': index < len(body) - 1}
+            for index, chunk in enumerate(body)
+        ]
+        sent = []
+
+        async def receive():
+            self.received_messages += 1
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            await gateway(scope, receive, send)
+            await gateway._http.aclose()
+
+        async_to_sync(run)()
+        start = sent[0]
+        return start['status'], start['headers'], b''.join(m.get('body', b'') for m in sent[1:]), resolver
+
+    def test_request_body_is_streamed(self):
+        received = []
+        test = self
+
+        class StreamingTransport(httpx.AsyncBaseTransport):
+            # MockTransport reads the whole body before calling its handler
+            async def handle_async_request(self, request):
+                async for chunk in request.stream:
+                    received.append((chunk, test.received_messages))
+                return httpx.Response(201, stream=httpx.ByteStream(b'created'))
+
+        status, _, body, _ = self._http(
+            StreamingTransport(), '/w/5/upload', 'POST', [(b'content-length', b'9')], [b'abc', b'def', b'ghi']
+        )
+        self.assertEqual((status, body), (201, b'created'))
+        # Each chunk reaches the upstream before the next one is received from the client
+        self.assertEqual(received, [(b'abc', 1), (b'def', 2), (b'ghi', 3)])
+
+    def test_hop_by_hop_headers_are_stripped(self):
+        forwarded = {}
+
+        def handler(request):
+            forwarded.update(request.headers)
+            # An unread stream, as a real transport returns; aiter_raw() refuses preloaded content
+            return httpx.Response(200, headers={'keep-alive': 'timeout=5', 'x-upstream': '1'}, stream=httpx.ByteStream(b'ok'))
+
+        status, headers, _, _ = self._http(handler, '/w/5/static/app.js', headers=[
+            (b'connection', b'keep-alive'), (b'te', b'trailers'), (b'proxy-authorization', b'Basic x'),
+            (b'upgrade', b'h2c'), (b'accept', b'*/*'),
+        ])
+        self.assertEqual(status, 200)
+        for name in ('te', 'proxy-authorization', 'upgrade'):
+            self.assertNotIn(name, forwarded)
+        self.assertEqual(forwarded['accept'], '*/*')
+        self.assertEqual(forwarded['x-forwarded-prefix'], '/w/5')
+        self.assertEqual(forwarded['x-forwarded-for'], '10.0.0.9')
+        names = [name for name, _ in headers]
+        self.assertNotIn(b'keep-alive', names)
+        self.assertIn(b'x-upstream', names)
+
+    def test_workspace_root_redirects_to_trailing_slash(self):
+        def handler(request):
+            raise AssertionError('the upstream must not be called')
+
+        status, headers, _, resolver = self._http(handler, '/w/5')
+        self.assertEqual(status, 308)
+        self.assertIn((b'location', b'/w/5/'), headers)
+        self.assertEqual(resolver.resolved, [])
+
+    def test_websocket_frames_are_relayed(self):
+        upstream_paths = []
+
+        async def echo(connection):
+            upstream_paths.append(connection.request.path)
+            async for message in connection:
+                await connection.send(message)
+
+        async def run():
+            sent = []
+            inbound = asyncio.Queue()
+            for message in ({'type': 'websocket.connect'}, {'type': 'websocket.receive', 'text': 'hello'},
+                            {'type': 'websocket.receive', 'bytes': b'\x00\x01'}):
+                inbound.put_nowait(message)
+
+            async def send(message):
+                sent.append(message)
+                if sum(m['type'] == 'websocket.send' for m in sent) == 2:
+                    inbound.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+
+            async with websocket_serve(echo, '127.0.0.1', 0) as server:
+                port = server.sockets[0].getsockname()[1]
+                gateway = WorkspaceGateway(None, _StaticResolver(f"127.0.0.1:{port}"))
+                scope = {
+                    'type': 'websocket', 'path': '/w/5/socket', 'query_string': b'reconnect=1',
+                    'headers': [(b'host', b'ide.example.com')], 'subprotocols': [],
+                }
+                await asyncio.wait_for(gateway(scope, inbound.get, send), timeout=5)
+            return sent
+
+        sent = async_to_sync(run)()
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        relayed = [m for m in sent if m['type'] == 'websocket.send']
+        self.assertEqual([m.get('text') or m.get('bytes') for m in relayed], ['hello', b'\x00\x01'])
+        self.assertEqual(upstream_paths, ['/socket?reconnect=1'])
+
+
+class _StubDockerClient:
+    def __init__(self):
+        self.healthy = True
+        self.pings = 0
+        self.closed = False
+
+    def ping(self):
+        self.pings += 1
+        if not self.healthy:
+            raise ConnectionError('daemon restarted')
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+class DockerClientProviderTests(TestCase):
+    """Shared clients are re-checked once stale and rebuilt when the daemon stops answering"""
+
+    def setUp(self):
+        self.provider = DockerClientProvider()
+        self.connected = []
+
+        def connect(streaming):
+            client = _StubDockerClient()
+            self.connected.append(client)
+            return client
+
+        patcher = mock.patch.object(self.provider, '_connect', side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_client_is_not_pinged(self):
+        with override_settings(DOCKER_HEALTH_CHECK_INTERVAL=60):
+            client = self.provider.get()
+            self.assertIs(self.provider.get(), client)
+        self.assertEqual(client.pings, 0)
+        self.assertEqual(len(self.connected), 1)
+
+    @override_settings(DOCKER_HEALTH_CHECK_INTERVAL=0)
+    def test_failed_ping_reconnects(self):
+        client = self.provider.get()
+        self.assertIs(self.provider.get(), client)
+        self.assertEqual(client.pings, 1)
+
+        client.healthy = False
+        replacement = self.provider.get()
+        self.assertIsNot(replacement, client)
+        self.assertTrue(client.closed)
+        self.assertEqual(len(self.connected), 2)
+        self.assertIs(self.provider.get(), replacement)
+
+    @override_settings(DOCKER_HEALTH_CHECK_INTERVAL=0)
+    def test_streaming_client_is_checked_separately(self):
+        api, stream = self.provider.get(), self.provider.get(streaming=True)
+        self.assertIsNot(api, stream)
+        stream.healthy = False
+        self.assertIs(self.provider.get(), api)
+        self.assertIsNot(self.provider.get(streaming=True), stream)
+
+    def test_unreachable_daemon_is_unavailable(self):
+        self.provider._connect.side_effect = DockerException('connection refused')
+        self.assertFalse(self.provider.is_available())
+
+
+class IdleReaperTests(TestCase):
+    """A running workspace is only suspended when access, code-server heartbeat and CPU all look idle"""
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        self.runtime = FakeRuntime()
+        self.runtime.pull(BASE_IMAGE)
+        self.docker_service = DockerService(runtime=self.runtime)
+
+        user = get_user_model().objects.create_user(username='idle', password='secret')
+        self.workspace = Workspace.objects.create(name='ws', owner=user)
+        self.assertTrue(self.docker_service.start_container(self.workspace))
+        # Last used two hours ago
+        self._accessed(timezone.now() - timedelta(hours=2))
+
+        self.heartbeat = None
+        patcher = mock.patch('containers.services.reaper.requests.get', side_effect=self._healthz)
+        self.healthz = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cpu_percent = 0.0
+        patcher = mock.patch.object(
+            self.docker_service.metrics, 'history',
+            side_effect=lambda workspace_id: [{'cpu_percent': self.cpu_percent}] * 60,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _accessed(self, when):
+        Workspace.objects.filter(pk=self.workspace.pk).update(last_accessed=when)
+
+    def _healthz(self, url, timeout=None):
+        if self.heartbeat is None:
+            raise requests.ConnectionError('code-server is not answering')
+        response = mock.Mock()
+        response.json.return_value = {'lastHeartbeat': self.heartbeat.timestamp() * 1000}
+        return response
+
+    def _reap(self, action=None):
+        return IdleReaper(self.docker_service, idle_seconds=1800, cpu_threshold=5.0, action=action).run_once()
+
+    def _status(self):
+        return self.runtime.inspect(self.workspace.container_id).status
+
+    def test_recent_access_is_not_suspended(self):
+        self._accessed(timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self._reap(), [])
+        self.assertEqual(self._status(), 'running')
+
+    def test_recent_heartbeat_is_not_suspended(self):
+        self.heartbeat = timezone.now() - timedelta(minutes=5)
+        self.assertEqual(self._reap(), [])
+        self.assertEqual(self._status(), 'running')
+        self.assertEqual(self.healthz.call_args[0][0], f"{self.docker_service.code_server_url(self.workspace)}/healthz")
+
+    def test_recent_cpu_activity_is_not_suspended(self):
+        self.cpu_percent = 40.0
+        self.assertEqual(self._reap(), [])
+        self.assertEqual(self._status(), 'running')
+
+    @override_settings(IDLE_ACTION='pause')
+    def test_idle_workspace_is_paused(self):
+        self.heartbeat = timezone.now() - timedelta(hours=1)
+        self.assertEqual(self._reap(), [self.workspace])
+        self.assertEqual(self._status(), 'paused')
+        self.workspace.refresh_from_db()
+        self.assertEqual((self.workspace.is_running, self.workspace.container_status), (False, 'paused'))
+
+    @override_settings(IDLE_ACTION='stop')
+    def test_idle_workspace_is_stopped(self):
+        self.assertEqual(self._reap(), [self.workspace])
+        self.assertEqual(self._status(), 'exited')
+        self.workspace.refresh_from_db()
+        self.assertEqual((self.workspace.is_running, self.workspace.container_status), (False, 'stopped'))
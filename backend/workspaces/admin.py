@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import GitTemplate, ResourceClass, Workspace
+from .models import GitTemplate, ResourceClass, Workspace, ProvisioningJob
 
 # Register your models here.
 
@@ -19,7 +19,21 @@ class ResourceClassAdmin(admin.ModelAdmin):
 
 @admin.register(Workspace)
 class WorkspaceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'owner', 'git_template', 'resource_class', 'container_status', 'is_running', 'created_at')
+    list_display = ('name', 'owner', 'git_template', 'resource_class', 'node', 'container_status', 'is_running', 'created_at')
     search_fields = ('name', 'owner__username')
-    list_filter = ('is_running', 'container_status', 'git_template', 'resource_class')
+    list_filter = ('is_running', 'container_status', 'git_template', 'resource_class', 'node')
     readonly_fields = ('container_id', 'container_port', 'last_accessed', 'created_at', 'updated_at')
+    list_select_related = ('owner', 'git_template', 'resource_class', 'node')
+    list_per_page = 50
+    # Skip the unfiltered COUNT(*) over every workspace on each page load
+    show_full_result_count = False
+
+@admin.register(ProvisioningJob)
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'workspace', 'status', 'stage', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'stage')
+    search_fields = ('workspace__name', 'workspace__owner__username')
+    readonly_fields = ('stage_timings', 'error', 'worker', 'created_at', 'started_at', 'finished_at')
+    list_select_related = ('workspace__owner',)
+    list_per_page = 50
+    show_full_result_count = False
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class WorkspacesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workspaces'
+
+    def ready(self):
+        # Overlay-materialized workspaces lose their mounts on reboot
+        from .services.materialize import Materializer
+        Materializer().restore()
+        if settings.PREBUILD_IMAGES_ON_STARTUP:
+            from .services.prebuild import start_prebuild_on_startup
+            start_prebuild_on_startup()
@@ -0,0 +1,62 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from containers.benchmark import WorkspaceBenchmark, compare, dump_report
+from containers.runtime import FakeRuntime, get_runtime, set_runtime
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the workspace lifecycle (create/provision/start/status/logs/stop/delete) through the API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Workspaces to take through the lifecycle')
+        parser.add_argument('--concurrency', type=int, default=1, help='Workspaces in flight at once')
+        parser.add_argument('--runtime', choices=['fake', 'docker', 'configured'], default='fake',
+                            help='Container runtime to measure (default: in-memory fake)')
+        parser.add_argument('--latency', type=float, default=0.0, help='Fake runtime: seconds per call')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fake runtime: share of failing calls')
+        parser.add_argument('--language', default='python', help='Template language (selects the image recipe)')
+        parser.add_argument('--template-dir', help='Local directory to use as the template (default: generated)')
+        parser.add_argument('--template-files', type=int, default=200, help='Files in the generated template')
+        parser.add_argument('--seed-mode', choices=['auto', 'copy'], help='Override WORKSPACE_SEED_MODE')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', help='JSON report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='Relative slowdown that counts as a regression and fails the command')
+
+    def handle(self, *args, **options):
+        if options['runtime'] == 'fake':
+            set_runtime(FakeRuntime(latency=options['latency'], failure_rate=options['failure_rate']))
+        elif options['runtime'] == 'docker':
+            from containers.runtime.docker_driver import DockerRuntime
+            set_runtime(DockerRuntime())
+        self.stderr.write(f"Benchmarking {options['iterations']} workspaces on the {get_runtime().name} runtime...")
+
+        try:
+            report = WorkspaceBenchmark(
+                iterations=options['iterations'],
+                concurrency=options['concurrency'],
+                template_dir=options['template_dir'],
+                template_files=options['template_files'],
+                language=options['language'],
+                seed_mode=options['seed_mode'],
+            ).run()
+        finally:
+            set_runtime(None)
+
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {str(e)}")
+            report['regressions'] = compare(baseline, report, options['threshold'])
+
+        self.stdout.write(dump_report(report, options['output']))
+        for regression in report.get('regressions', []):
+            self.stderr.write(self.style.WARNING(
+                f"Regression: {regression['section']}.{regression['name']} {regression['metric']} "
+                f"{regression['baseline']} -> {regression['current']} ms (+{regression['change']:.0%})"
+            ))
+        if report.get('regressions'):
+            # The report is written first so the failing run can still be inspected
+            raise CommandError(f"{len(report['regressions'])} regression(s) against {options['baseline']}")
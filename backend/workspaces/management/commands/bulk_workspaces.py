@@ -0,0 +1,55 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from workspaces.services.bulk import BULK_ACTIONS, BulkLifecycle, filter_workspaces, summarize_results
+
+
+class Command(BaseCommand):
+    help = 'Start, stop, restart or suspend many workspaces in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=BULK_ACTIONS)
+        parser.add_argument('--id', type=int, action='append', dest='ids', help='Only this workspace (repeatable)')
+        parser.add_argument('--owner', help='Only workspaces of this username')
+        parser.add_argument('--template', type=int, help='Only workspaces created from this template id')
+        parser.add_argument('--resource-class', help='Only workspaces of this resource class (id or name)')
+        parser.add_argument('--idle-minutes', type=float, help='Only workspaces not accessed for this long')
+        parser.add_argument('--all', action='store_true', help='Every workspace with a container')
+        parser.add_argument('--workers', type=int, default=None, help='Workspaces processed in parallel')
+        parser.add_argument('--dry-run', action='store_true', help='List the matching workspaces only')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        filters = {
+            'ids': options['ids'],
+            'owner': options['owner'],
+            'template': options['template'],
+            'resource_class': options['resource_class'],
+            'idle_seconds': (options['idle_minutes'] or 0) * 60,
+        }
+        if not any(filters.values()) and not options['all']:
+            raise CommandError('Pass at least one filter, or --all')
+
+        workspaces = list(filter_workspaces(**filters))
+        action = options['action']
+        if options['dry_run']:
+            for workspace in workspaces:
+                self.stdout.write(f"Would {action}: workspace {workspace.id} ({workspace.name}, {workspace.owner.username})")
+            self.stdout.write(self.style.SUCCESS(f"{len(workspaces)} workspace(s) match"))
+            return
+
+        started = time.monotonic()
+        results = BulkLifecycle(workers=options['workers']).run(workspaces, action)
+        report = summarize_results(action, results, time.monotonic() - started)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for result in results:
+            if not result.ok:
+                self.stdout.write(self.style.ERROR(
+                    f"workspace {result.workspace.id} ({result.workspace.name}): {result.error}"
+                ))
+        style = self.style.ERROR if report['failed'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{action}: {report['succeeded']} succeeded, {report['failed']} failed in {report['seconds']:.1f}s"
+        ))
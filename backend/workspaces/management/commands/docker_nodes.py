@@ -0,0 +1,110 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import ProtectedError
+from containers.models import DockerNode
+from containers.services import DockerService
+from containers.services.scheduler import NodeScheduler
+
+
+class Command(BaseCommand):
+    help = 'Register, drain and inspect the Docker nodes workspaces are scheduled on'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=['list', 'add', 'drain', 'enable', 'refresh', 'remove'],
+            help='list nodes, add one, stop (drain) or resume scheduling on one, measure usage, or remove one'
+        )
+        parser.add_argument('name', nargs='?', help='Node name (refresh: all nodes when omitted)')
+        parser.add_argument('--url', default='', help='Docker endpoint, e.g. tcp://10.0.0.5:2375 (default: local daemon)')
+        parser.add_argument('--driver', choices=[choice for choice, _ in DockerNode.DRIVER_CHOICES], default='docker')
+        parser.add_argument('--public-host', default='localhost', help='Host name browsers reach workspace ports on')
+        parser.add_argument('--cpus', type=int, help='CPUs available to workspaces')
+        parser.add_argument('--ram', type=int, help='GB of RAM available to workspaces')
+        parser.add_argument('--disk', type=int, help='GB of disk available to workspaces')
+        parser.add_argument('--json', action='store_true', help='Print the node report as JSON')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action != 'list' and action != 'refresh' and not options['name']:
+            raise CommandError(f"{action} needs a node name")
+        getattr(self, f"_{action}")(options)
+
+    def _node(self, name):
+        try:
+            return DockerNode.objects.get(name=name)
+        except DockerNode.DoesNotExist:
+            raise CommandError(f"No node named {name}")
+
+    def _list(self, options):
+        report = NodeScheduler().report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for node in report:
+            capacity, committed, used = node['capacity'], node['committed'], node['used']
+            state = 'ok' if node['healthy'] else 'unreachable'
+            if not node['schedulable']:
+                state += ', draining'
+            self.stdout.write(
+                f"{node['name']} ({state}): {node['workspaces']} workspace(s), "
+                f"CPU {committed['cpu']}/{capacity['cpu']:g} committed, {used['cpu']} used; "
+                f"RAM {committed['ram_gb']}/{capacity['ram_gb']:g} GB committed, {used['ram_gb']} GB used; "
+                f"disk {committed['disk_gb']}/{capacity['disk_gb']} GB committed"
+            )
+        if not report:
+            self.stdout.write('No nodes registered; workspaces run on the default runtime')
+
+    def _add(self, options):
+        if None in (options['cpus'], options['ram'], options['disk']):
+            raise CommandError('add needs --cpus, --ram and --disk')
+        node, created = DockerNode.objects.update_or_create(
+            name=options['name'],
+            defaults={
+                'base_url': options['url'],
+                'driver': options['driver'],
+                'public_host': options['public_host'],
+                'cpu_capacity': options['cpus'],
+                'ram_gb_capacity': options['ram'],
+                'disk_gb_capacity': options['disk'],
+            },
+        )
+        NodeScheduler().refresh(node, DockerService.for_node(node).runtime)
+        verb = 'Added' if created else 'Updated'
+        state = '' if node.is_healthy else ' (daemon not reachable yet)'
+        self.stdout.write(self.style.SUCCESS(f"{verb} node {node.name}{state}"))
+
+    def _drain(self, options):
+        node = self._node(options['name'])
+        node.is_schedulable = False
+        node.save(update_fields=['is_schedulable'])
+        remaining = node.workspaces.count()
+        self.stdout.write(self.style.SUCCESS(
+            f"No new workspaces will be placed on {node.name}; {remaining} workspace(s) still live there"
+        ))
+
+    def _enable(self, options):
+        node = self._node(options['name'])
+        node.is_schedulable = True
+        node.save(update_fields=['is_schedulable'])
+        self.stdout.write(self.style.SUCCESS(f"Scheduling workspaces on {node.name} again"))
+
+    def _refresh(self, options):
+        nodes = [self._node(options['name'])] if options['name'] else DockerNode.objects.all()
+        scheduler = NodeScheduler()
+        for node in nodes:
+            scheduler.refresh(node, DockerService.for_node(node).runtime)
+            if node.is_healthy:
+                self.stdout.write(
+                    f"{node.name}: {node.running_containers} running, "
+                    f"{node.used_cpu} CPU and {node.used_ram_gb} GB RAM in use"
+                )
+            else:
+                self.stdout.write(self.style.ERROR(f"{node.name}: unreachable"))
+
+    def _remove(self, options):
+        node = self._node(options['name'])
+        try:
+            node.delete()
+        except ProtectedError:
+            raise CommandError(f"{node.name} still has workspaces; drain it and delete them first")
+        self.stdout.write(self.style.SUCCESS(f"Removed node {options['name']}"))
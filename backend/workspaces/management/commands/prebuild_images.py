@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from containers.services.recipes import BASE_IMAGE
+from workspaces.models import GitTemplate
+from workspaces.services.prebuild import ImagePrebuilder
+
+
+class Command(BaseCommand):
+    help = 'Pull and build the container images for all Git templates ahead of time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of images to build in parallel')
+        parser.add_argument('--language', action='append', help='Only prebuild templates for this language')
+        parser.add_argument('--pull', action='store_true', help=f'Pull the latest {BASE_IMAGE} first')
+        parser.add_argument(
+            '--skip-dependencies', action='store_true',
+            help='Do not download templates to pre-install their dependencies'
+        )
+
+    def handle(self, *args, **options):
+        templates = GitTemplate.objects.all()
+        if options['language']:
+            templates = templates.filter(language__in=options['language'])
+
+        prebuilder = ImagePrebuilder(
+            workers=options['workers'],
+            with_dependencies=not options['skip_dependencies'],
+        )
+        if options['pull']:
+            self.stdout.write(f'Pulling {BASE_IMAGE}...')
+            prebuilder.docker_service.runtime.pull(BASE_IMAGE)
+
+        results = prebuilder.run(templates)
+        for result in results:
+            if result.ok:
+                size_mb = (result.size_bytes or 0) / (1024 * 1024)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{result.template.name}: {result.image} in {result.seconds:.1f}s ({size_mb:.0f} MB)'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'{result.template.name}: failed after {result.seconds:.1f}s: {result.error}'
+                ))
+
+        failed = [result.template.name for result in results if not result.ok]
+        if failed:
+            # Non-zero exit, so deploy pipelines notice
+            raise CommandError(f"{len(failed)} of {len(results)} images failed to build: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f'Prebuilt images for {len(results)} templates'))
@@ -0,0 +1,39 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from containers.services import DockerService
+from containers.services.reaper import IdleReaper
+
+
+class Command(BaseCommand):
+    help = 'Pause or stop workspace containers that have been idle for IDLE_TIMEOUT_SECONDS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+        parser.add_argument('--dry-run', action='store_true', help='List idle workspaces without suspending them')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between passes')
+        parser.add_argument('--action', choices=['pause', 'stop'], default=None, help='How to suspend idle containers')
+
+    def handle(self, *args, **options):
+        reaper = IdleReaper(
+            DockerService.in_process(), action=options['action'], interval=options['interval']
+        )
+        if options['once'] or options['dry_run']:
+            suspended = reaper.run_once(dry_run=options['dry_run'])
+            verb = 'Idle' if options['dry_run'] else 'Suspended'
+            for workspace in suspended:
+                self.stdout.write(f"{verb}: workspace {workspace.id} ({workspace.name})")
+            self.stdout.write(self.style.SUCCESS(f"{verb} {len(suspended)} workspace(s)"))
+            return
+
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+
+        reaper.start()
+        self.stdout.write(self.style.SUCCESS(f"Reaping idle workspaces every {reaper.interval}s"))
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Stopping idle reaper...')
+        reaper.stop(timeout=5)
@@ -0,0 +1,29 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from workspaces.services import ProvisioningWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that provision queued workspaces'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        pool = ProvisioningWorkerPool(
+            num_workers=options['workers'],
+            poll_interval=options['poll_interval'],
+        )
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {options['workers']} provisioning workers"))
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Stopping provisioning workers...')
+        pool.stop()
@@ -0,0 +1,39 @@
+import signal
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from containers.models import DockerNode
+from containers.services import DockerService
+
+
+class Command(BaseCommand):
+    help = 'Sample workspace container metrics and publish them to the cache (METRICS_SAMPLER=external)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between cache publishes')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.METRICS_PUBLISH_INTERVAL
+        # The default runtime and every registered node; restart to pick up new nodes
+        samplers = [DockerService.in_process().metrics]
+        samplers += [DockerService.for_node(node).metrics for node in DockerNode.objects.all()]
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+
+        for sampler in samplers:
+            sampler.ensure_started()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sampling container metrics on {len(samplers)} runtime(s), publishing every {interval}s"
+        ))
+        try:
+            while not stopped.wait(interval):
+                for sampler in samplers:
+                    try:
+                        sampler.publish()
+                    except Exception as e:
+                        self.stderr.write(f"Error publishing container metrics: {str(e)}")
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Stopping metrics samplers...')
+        for sampler in samplers:
+            sampler.stop()
@@ -0,0 +1,56 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from containers.services.upgrade import RollingUpgrader, upgrade_report
+
+
+class Command(BaseCommand):
+    help = 'Recreate workspace containers that run outdated images, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Containers recreated at the same time')
+        parser.add_argument('--max-unavailable', type=int, default=None, help='Stop once this many workspaces are down or failed')
+        parser.add_argument('--pause', type=float, default=None, help='Seconds to wait between batches')
+        parser.add_argument('--language', action='append', help='Only workspaces of templates in this language')
+        parser.add_argument('--id', type=int, action='append', dest='ids', help='Only this workspace (repeatable)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List stale workspaces without recreating them or building images')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        upgrader = RollingUpgrader(
+            batch_size=options['batch_size'],
+            max_unavailable=options['max_unavailable'],
+            pause=options['pause'],
+        )
+        workspaces = upgrader.candidates()
+        if options['language']:
+            workspaces = workspaces.filter(git_template__language__in=options['language'])
+        if options['ids']:
+            workspaces = workspaces.filter(id__in=options['ids'])
+
+        self.stdout.write('Looking for containers on outdated images...')
+        stale = upgrader.find_stale(workspaces, build=not options['dry_run'])
+        if options['dry_run']:
+            for workspace, from_image, to_image in stale:
+                self.stdout.write(f"workspace {workspace.id} ({workspace.name}): {from_image} -> {to_image}")
+            self.stdout.write(self.style.SUCCESS(f"{len(stale)} workspace(s) would be upgraded"))
+            return
+
+        started = time.monotonic()
+        results, halted = upgrader.run(stale)
+        report = upgrade_report(stale, results, halted, time.monotonic() - started)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for result in results:
+            if not result.ok:
+                self.stdout.write(self.style.ERROR(f"workspace {result.workspace.id} ({result.workspace.name}): {result.error}"))
+        if halted:
+            self.stdout.write(self.style.ERROR(
+                f"Halted after {report['failed']} failure(s); {report['skipped']} workspace(s) not upgraded"
+            ))
+        style = self.style.ERROR if report['failed'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Upgraded {report['upgraded']} of {report['stale']} stale workspace(s) in {report['seconds']:.1f}s"
+        ))
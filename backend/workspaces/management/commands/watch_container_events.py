@@ -0,0 +1,28 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from containers.services.events import ContainerEventWatcher
+
+
+class Command(BaseCommand):
+    help = 'Keep workspace status in sync with the container runtime event stream'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-interval', type=float, default=None, help='Seconds between batched status writes')
+
+    def handle(self, *args, **options):
+        # The default runtime and every registered node; restart to pick up new nodes
+        watchers = ContainerEventWatcher.for_all_runtimes(batch_interval=options['batch_interval'])
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+
+        for watcher in watchers:
+            watcher.start()
+        self.stdout.write(self.style.SUCCESS(f"Watching container events on {len(watchers)} runtime(s)"))
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Stopping container event watchers...')
+        for watcher in watchers:
+            watcher.stop(timeout=5)
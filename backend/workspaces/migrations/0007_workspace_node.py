@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-17 00:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('containers', '0002_dockernode'),
+        ('workspaces', '0006_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workspace',
+            name='node',
+            field=models.ForeignKey(blank=True, help_text='Docker host the container runs on (empty for the default runtime)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='workspaces', to='containers.dockernode'),
+        ),
+    ]
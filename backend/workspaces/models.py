@@ -84,6 +84,14 @@ class Workspace(models.Model):
         on_delete=models.PROTECT,
         default=ResourceClass.get_default_class
     )
+    node = models.ForeignKey(
+        'containers.DockerNode',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='workspaces',
+        help_text='Docker host the container runs on (empty for the default runtime)',
+    )
     
     # Container-related fields
     container_id = models.CharField(max_length=100, blank=True, null=True)
@@ -102,3 +110,36 @@ class Workspace(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.owner.username})"
+
+class ProvisioningJob(models.Model):
+    """Background job that prepares a workspace's files and container"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name='provisioning_jobs',
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=50, blank=True)
+    stage_timings = models.JSONField(default=dict, help_text='Seconds spent in each provisioning stage')
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Provisioning job {self.id} for workspace {self.workspace_id} ({self.status})"
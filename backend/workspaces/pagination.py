@@ -0,0 +1,15 @@
+from django.conf import settings
+from rest_framework.pagination import PageNumberPagination
+
+
+class WorkspacePagination(PageNumberPagination):
+    """WORKSPACE_PAGE_SIZE workspaces per page, up to WORKSPACE_MAX_PAGE_SIZE with ?page_size="""
+    page_size_query_param = 'page_size'
+
+    @property
+    def page_size(self):
+        return settings.WORKSPACE_PAGE_SIZE
+
+    @property
+    def max_page_size(self):
+        return settings.WORKSPACE_MAX_PAGE_SIZE
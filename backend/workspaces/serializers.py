@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import GitTemplate, ResourceClass, Workspace
+from .models import GitTemplate, ResourceClass, Workspace, ProvisioningJob
 
 class GitTemplateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,3 +47,12 @@ class WorkspaceSerializer(serializers.ModelSerializer):
         # Set the owner to the current user
         validated_data['owner'] = self.context['request'].user
         return super().create(validated_data)
+
+class ProvisioningJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProvisioningJob
+        fields = [
+            'id', 'workspace', 'status', 'stage', 'stage_timings', 'error',
+            'attempts', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
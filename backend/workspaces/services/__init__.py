@@ -1,3 +1,4 @@
 from .git_service import GitService
+from .provisioning import ProvisioningRunner, ProvisioningWorkerPool, enqueue_provisioning
 
-__all__ = ['GitService']
+__all__ = ['GitService', 'ProvisioningRunner', 'ProvisioningWorkerPool', 'enqueue_provisioning']
@@ -0,0 +1,123 @@
+import time
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from containers.services import DockerService
+from workspaces.models import Workspace
+
+logger = logging.getLogger(__name__)
+
+BULK_ACTIONS = ('start', 'stop', 'restart', 'suspend')
+
+
+def filter_workspaces(queryset=None, ids=None, owner=None, template=None, resource_class=None, idle_seconds=None):
+    """
+    Workspaces with a container matching every given filter: ids, owner
+    username, template id, resource class id or name, and no access for
+    ``idle_seconds``.
+    """
+    workspaces = (queryset if queryset is not None else Workspace.objects.all()).filter(container_id__isnull=False)
+    if ids:
+        workspaces = workspaces.filter(id__in=ids)
+    if owner:
+        workspaces = workspaces.filter(owner__username=owner)
+    if template:
+        workspaces = workspaces.filter(git_template_id=template)
+    if resource_class:
+        if str(resource_class).isdigit():
+            workspaces = workspaces.filter(resource_class_id=resource_class)
+        else:
+            workspaces = workspaces.filter(resource_class__name=resource_class)
+    if idle_seconds:
+        cutoff = timezone.now() - timedelta(seconds=idle_seconds)
+        workspaces = workspaces.filter(
+            Q(last_accessed__lt=cutoff) | Q(last_accessed__isnull=True, updated_at__lt=cutoff)
+        )
+    return workspaces.select_related('owner', 'resource_class').order_by('id')
+
+
+class BulkResult:
+    """Outcome of one workspace's lifecycle action"""
+
+    def __init__(self, workspace, seconds=0.0, error=None):
+        self.workspace = workspace
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {
+            'id': self.workspace.id,
+            'name': self.workspace.name,
+            'owner': self.workspace.owner.username,
+            'ok': self.ok,
+            'error': self.error,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+class BulkLifecycle:
+    """
+    Starts, stops, restarts or suspends many workspaces at once.
+
+    Workspaces are processed by a bounded thread pool of BULK_WORKERS
+    threads through the regular DockerService methods, so the admission
+    controller still caps what reaches each daemon and every workspace's
+    outcome is reported on its own. Restart stops and starts the existing
+    container.
+    """
+
+    def __init__(self, docker_service=None, workers=None):
+        self.docker_service = docker_service or DockerService.in_process()
+        self.workers = workers or settings.BULK_WORKERS
+
+    def _restart(self, workspace):
+        return self.docker_service.stop_container(workspace) and self.docker_service.start_container(workspace)
+
+    def _apply(self, workspace, action):
+        close_old_connections()
+        started = time.monotonic()
+        operations = {
+            'start': self.docker_service.start_container,
+            'stop': self.docker_service.stop_container,
+            'restart': self._restart,
+            'suspend': lambda workspace: self.docker_service.suspend_container(workspace, settings.IDLE_ACTION),
+        }
+        try:
+            if operations[action](workspace):
+                return BulkResult(workspace, time.monotonic() - started)
+            error = f"Failed to {action} workspace"
+        except Exception as e:
+            error = str(e)
+        logger.error(f"Bulk {action} of workspace {workspace.id} failed: {error}")
+        return BulkResult(workspace, time.monotonic() - started, error)
+
+    def run(self, workspaces, action):
+        """Apply an action to every workspace and return the per-workspace results"""
+        if action not in BULK_ACTIONS:
+            raise ValueError(f"Unknown action {action!r}, expected one of {', '.join(BULK_ACTIONS)}")
+        workspaces = list(workspaces)
+        if not workspaces:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(workspaces)), thread_name_prefix='bulk') as executor:
+            return list(executor.map(lambda workspace: self._apply(workspace, action), workspaces))
+
+
+def summarize_results(action, results, seconds):
+    """The report returned by the bulk endpoint and command"""
+    failed = sum(1 for result in results if not result.ok)
+    return {
+        'action': action,
+        'total': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'seconds': round(seconds, 3),
+        'results': [result.as_dict() for result in results],
+    }
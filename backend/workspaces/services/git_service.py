@@ -1,9 +1,13 @@
 import os
+import errno
 import shutil
 import stat
-import requests
+import subprocess
 from django.conf import settings
 import logging
+from .template_cache import TemplateCache
+from .materialize import Materializer, set_tree_permissions
+from containers.services.stages import stage
 
 logger = logging.getLogger(__name__)
 
@@ -19,91 +23,53 @@ def handle_remove_readonly(func, path, exc):
         raise
 
 class GitService:
-    def __init__(self):
+    def __init__(self, template_cache=None, materializer=None):
         self.workspace_root = settings.WORKSPACE_ROOT
+        self.template_cache = template_cache or TemplateCache()
+        self.materializer = materializer or Materializer()
 
     def _set_directory_permissions(self, path):
         """Recursively set permissions on a directory"""
         try:
-            # Set directory permissions
-            os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-            
-            # Recursively set permissions on all files and subdirectories
-            for root, dirs, files in os.walk(path):
-                for d in dirs:
-                    try:
-                        os.chmod(os.path.join(root, d), stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-                    except Exception as e:
-                        logger.warning(f"Failed to change directory permissions: {str(e)}")
-                
-                for f in files:
-                    try:
-                        os.chmod(os.path.join(root, f), stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-                    except Exception as e:
-                        logger.warning(f"Failed to change file permissions: {str(e)}")
+            set_tree_permissions(path)
         except Exception as e:
             logger.error(f"Error setting directory permissions: {str(e)}")
 
-    def _download_file(self, url, dest_path):
-        """Download a file from GitHub"""
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            with open(dest_path, 'wb') as f:
-                f.write(response.content)
-            
-            return True
-        except Exception as e:
-            logger.error(f"Failed to download file {url}: {str(e)}")
-            return False
-
-    def _download_directory_contents(self, owner, repo, path, branch, workspace_path, base_path=None):
-        """Recursively download directory contents from GitHub"""
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}?ref={branch}"
-        logger.info(f"Fetching contents from: {api_url}")
+    def _parse_repository(self, template):
+        """Get (owner, repo, branch, template_path) for a GitHub template"""
+        # Parse GitHub URL
+        repo_url = template.repository_url
+        logger.info(f"Processing repository URL: {repo_url}")
+        
+        # Remove .git extension if present
+        repo_url = repo_url.replace('.git', '')
         
+        # Remove /tree/branch if present
+        if '/tree/' in repo_url:
+            repo_url = repo_url.split('/tree/')[0]
+        
+        # Split URL into parts
+        parts = repo_url.rstrip('/').split('/')
+        owner = parts[-2]  # Second to last part is owner
+        repo = parts[-1]   # Last part is repo name
+        branch = template.default_branch or 'main'
+        template_path = template.language.lower() + '-template'
+        return owner, repo, branch, template_path
+
+    def download_template(self, template, dest_path):
+        """Download a template's files into dest_path"""
+        owner, repo, branch, template_path = self._parse_repository(template)
+        logger.info(f"Downloading template: owner={owner}, repo={repo}, branch={branch}, template={template_path}")
+        os.makedirs(dest_path, exist_ok=True)
         try:
-            response = requests.get(api_url)
-            response.raise_for_status()
-            items = response.json()
-
-            if not isinstance(items, list):
-                logger.error(f"Invalid response from GitHub API for {path}: {items}")
-                return False
-
-            logger.info(f"Found {len(items)} items in {path}")
-            
-            # If this is the first call (base_path is None), set it to the template path
-            if base_path is None:
-                base_path = path
-
-            for item in items:
-                # Calculate the relative path from the base template directory
-                relative_path = item['path'].replace(base_path + '/', '')
-                local_path = os.path.join(workspace_path, relative_path)
-                logger.info(f"Processing {item['type']}: {item['path']} -> {local_path}")
-
-                if item['type'] == 'file':
-                    # Download file
-                    logger.info(f"Downloading file: {item['download_url']} -> {local_path}")
-                    if not self._download_file(item['download_url'], local_path):
-                        logger.error(f"Failed to download file: {item['path']}")
-                        return False
-                    logger.info(f"Successfully downloaded: {local_path}")
-                elif item['type'] == 'dir':
-                    # Create directory and recurse
-                    logger.info(f"Creating directory: {local_path}")
-                    os.makedirs(local_path, exist_ok=True)
-                    logger.info(f"Recursing into directory: {item['path']}")
-                    if not self._download_directory_contents(owner, repo, item['path'], branch, workspace_path, base_path):
-                        return False
-
+            # Served from the local template cache; only fetched when the branch moved
+            with stage('template_fetch'):
+                tree = self.template_cache.get(owner, repo, branch, template_path)
+                strategy = self.materializer.materialize(tree, dest_path)
+            logger.info(f"Materialized {template_path} into {dest_path} using {strategy}")
             return True
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get directory contents for {path}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Failed to download template {template_path} from {owner}/{repo}: {str(e)}")
             return False
 
     def clone_repository(self, workspace):
@@ -119,6 +85,7 @@ class GitService:
             # Clean up any existing workspace directory
             if os.path.exists(workspace_path):
                 logger.info(f"Cleaning up existing workspace directory: {workspace_path}")
+                self.materializer.release(workspace_path)
                 shutil.rmtree(workspace_path, onerror=handle_remove_readonly)
 
             # Create workspace directory
@@ -126,28 +93,8 @@ class GitService:
             os.makedirs(workspace_path, exist_ok=True)
             self._set_directory_permissions(workspace_path)
 
-            # Parse GitHub URL
-            repo_url = workspace.git_template.repository_url
-            logger.info(f"Processing repository URL: {repo_url}")
-            
-            # Remove .git extension if present
-            repo_url = repo_url.replace('.git', '')
-            
-            # Remove /tree/branch if present
-            if '/tree/' in repo_url:
-                repo_url = repo_url.split('/tree/')[0]
-            
-            # Split URL into parts
-            parts = repo_url.rstrip('/').split('/')
-            owner = parts[-2]  # Second to last part is owner
-            repo = parts[-1]   # Last part is repo name
-            branch = workspace.git_template.default_branch or 'main'
-            template_path = workspace.git_template.language.lower() + '-template'
-            
-            logger.info(f"Downloading template: owner={owner}, repo={repo}, branch={branch}, template={template_path}")
-
             # Download template directory recursively
-            success = self._download_directory_contents(owner, repo, template_path, branch, workspace_path)
+            success = self.download_template(workspace.git_template, workspace_path)
             if success:
                 logger.info(f"Successfully downloaded template for workspace {workspace.id}")
                 contents = os.listdir(workspace_path)
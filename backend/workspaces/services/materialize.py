@@ -0,0 +1,242 @@
+import os
+import json
+import stat
+import errno
+import shutil
+import logging
+import tempfile
+import subprocess
+import threading
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ioctl number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+# Errors meaning "this filesystem pair cannot share extents", not real failures
+REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+WORLD_RWX = stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO
+
+# Per-workspace record of an overlay's lower tree and mount point
+OVERLAY_STATE = 'mount.json'
+
+
+def set_tree_permissions(path):
+    """Make every directory and file under path readable and writable by the container user"""
+    os.chmod(path, WORLD_RWX)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            entry = os.path.join(root, name)
+            if os.path.islink(entry):
+                continue
+            try:
+                os.chmod(entry, WORLD_RWX)
+            except OSError as e:
+                logger.warning(f"Failed to change permissions of {entry}: {str(e)}")
+
+
+class Materializer:
+    """
+    Produces a private, writable copy of a cached template tree for a workspace.
+
+    Strategies:
+    - ``reflink``: clone every file with FICLONE; blocks are shared with the
+      cache until the workspace writes to them (btrfs, XFS, bcachefs).
+    - ``overlay``: mount an overlayfs with the cached tree as the read-only
+      lower dir and a per-workspace upper dir. No per-file work at all, but
+      it needs mount privileges.
+    - ``copy``: plain copy, preserving modes.
+    ``auto`` uses reflink where the filesystem supports it and copy otherwise.
+    Permissions are set once on the cached tree and carried over by every
+    strategy, so workspaces are not chmod'ed file by file.
+    """
+
+    def __init__(self, strategy=None, overlay_root=None):
+        self.strategy = strategy or settings.WORKSPACE_MATERIALIZE_STRATEGY
+        self.overlay_root = overlay_root or os.path.join(settings.WORKSPACE_ROOT, '.overlay')
+        # (source device, destination device) -> whether FICLONE works between them
+        self._reflink_support = {}
+        self._lock = threading.Lock()
+
+    def materialize(self, tree, dest):
+        """Populate dest from tree and return the strategy that was used"""
+        os.makedirs(dest, exist_ok=True)
+        if self.strategy == 'overlay':
+            self._mount_overlay(tree, dest)
+            return 'overlay'
+        if self.strategy in ('auto', 'reflink') and self._can_reflink(tree, dest):
+            self._copy_tree(tree, dest, self._reflink_file)
+            return 'reflink'
+        if self.strategy == 'reflink':
+            logger.warning(f"Reflinks are not supported between {tree} and {dest}, copying instead")
+        self._copy_tree(tree, dest, shutil.copy2)
+        return 'copy'
+
+    def release(self, dest):
+        """Undo a materialization that holds resources outside dest (overlay mounts)"""
+        if os.path.ismount(dest):
+            subprocess.run(['umount', dest], check=True, capture_output=True)
+        shutil.rmtree(self._overlay_dirs(dest)[0], ignore_errors=True)
+
+    def restore(self):
+        """
+        Mount the overlays of existing workspaces again, e.g. after a reboot.
+        Where mounting fails the workspace gets a plain copy of the lower
+        tree with its upper dir applied on top. Returns the number restored.
+        """
+        if not os.path.isdir(self.overlay_root):
+            return 0
+        # Every server process restores on startup; only one may mount at a time
+        try:
+            lock = open(os.path.join(self.overlay_root, '.restore.lock'), 'w')
+        except OSError as e:
+            logger.error(f"Cannot restore workspace overlays: {str(e)}")
+            return 0
+        with lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            return self._restore_all()
+
+    def _restore_all(self):
+        restored = 0
+        for name in os.listdir(self.overlay_root):
+            base = os.path.join(self.overlay_root, name)
+            try:
+                with open(os.path.join(base, OVERLAY_STATE)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            tree, dest = state['lower'], state['dest']
+            if os.path.ismount(dest):
+                continue
+            if not os.path.isdir(tree):
+                logger.error(f"Cannot restore {dest}: template tree {tree} is gone; changes kept in {base}")
+                continue
+            try:
+                self._mount(tree, dest)
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.warning(f"Failed to remount overlay at {dest}, copying instead: {str(e)}")
+                try:
+                    self._flatten(tree, dest)
+                except OSError as e:
+                    logger.error(f"Failed to restore {dest}: {str(e)}")
+                    continue
+            restored += 1
+        return restored
+
+    def _can_reflink(self, tree, dest):
+        if fcntl is None:
+            return False
+        devices = (os.stat(tree).st_dev, os.stat(dest).st_dev)
+        with self._lock:
+            if devices not in self._reflink_support:
+                self._reflink_support[devices] = self._probe_reflink(tree, dest)
+            return self._reflink_support[devices]
+
+    def _probe_reflink(self, tree, dest):
+        # Probe next to the tree and dest so neither directory is touched
+        fd, probe_src = tempfile.mkstemp(prefix='.reflink-probe-', dir=os.path.dirname(os.path.normpath(tree)))
+        probe_dst = os.path.join(os.path.dirname(os.path.normpath(dest)), os.path.basename(probe_src))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'probe')
+            self._reflink_file(probe_src, probe_dst)
+            return True
+        except OSError as e:
+            if e.errno not in REFLINK_UNSUPPORTED:
+                logger.warning(f"Unexpected error probing reflink support: {str(e)}")
+            return False
+        finally:
+            for path in (probe_src, probe_dst):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _reflink_file(self, src, dst):
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        shutil.copystat(src, dst)
+
+    def _copy_tree(self, tree, dest, copy_file):
+        for root, dirs, files in os.walk(tree):
+            target_root = os.path.join(dest, os.path.relpath(root, tree))
+            for name in dirs:
+                src = os.path.join(root, name)
+                dst = os.path.join(target_root, name)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), dst)
+                else:
+                    os.makedirs(dst, exist_ok=True)
+                    shutil.copymode(src, dst)
+            for name in files:
+                src = os.path.join(root, name)
+                dst = os.path.join(target_root, name)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), dst)
+                else:
+                    copy_file(src, dst)
+
+    def _overlay_dirs(self, dest):
+        base = os.path.join(self.overlay_root, os.path.basename(os.path.normpath(dest)))
+        return base, os.path.join(base, 'upper'), os.path.join(base, 'work')
+
+    def _mount_overlay(self, tree, dest):
+        base, upper, work = self._overlay_dirs(dest)
+        shutil.rmtree(base, ignore_errors=True)
+        os.makedirs(upper)
+        os.makedirs(work)
+        os.chmod(upper, WORLD_RWX)
+        # Mounts do not survive a reboot; restore() needs to know what went where
+        with open(os.path.join(base, OVERLAY_STATE), 'w') as f:
+            json.dump({'lower': tree, 'dest': os.path.abspath(dest)}, f)
+        self._mount(tree, dest)
+
+    def _mount(self, tree, dest):
+        _, upper, work = self._overlay_dirs(dest)
+        os.makedirs(dest, exist_ok=True)
+        subprocess.run(
+            ['mount', '-t', 'overlay', 'overlay',
+             '-o', f"lowerdir={tree},upperdir={upper},workdir={work}", dest],
+            check=True, capture_output=True,
+        )
+
+    def _flatten(self, tree, dest):
+        """Replace an overlay with a copy of what it showed: the lower tree, then the upper dir"""
+        base, upper, _ = self._overlay_dirs(dest)
+        self._copy_tree(tree, dest, shutil.copy2)
+        for root, dirs, files in os.walk(upper):
+            target_root = os.path.join(dest, os.path.relpath(root, upper))
+            for name in dirs + files:
+                src = os.path.join(root, name)
+                dst = os.path.join(target_root, name)
+                mode = os.lstat(src).st_mode
+                if stat.S_ISCHR(mode) and os.lstat(src).st_rdev == 0:
+                    # A whiteout: the file was deleted in the workspace
+                    _remove(dst)
+                elif stat.S_ISDIR(mode):
+                    if os.path.lexists(dst) and not os.path.isdir(dst):
+                        _remove(dst)
+                    os.makedirs(dst, exist_ok=True)
+                    shutil.copymode(src, dst)
+                else:
+                    _remove(dst)
+                    if stat.S_ISLNK(mode):
+                        os.symlink(os.readlink(src), dst)
+                    else:
+                        shutil.copy2(src, dst)
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from containers.services import DockerService
+from workspaces.models import GitTemplate
+from .git_service import GitService
+
+logger = logging.getLogger(__name__)
+
+
+class PrebuildResult:
+    """Outcome of resolving one template's image"""
+
+    def __init__(self, template, image=None, seconds=0.0, size_bytes=None, error=None):
+        self.template = template
+        self.image = image
+        self.seconds = seconds
+        self.size_bytes = size_bytes
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class ImagePrebuilder:
+    """
+    Resolves the image of every GitTemplate ahead of time with the same logic
+    workspace creation uses, so no user pays for a docker build.
+
+    Templates are processed in parallel by a bounded thread pool; shared layers
+    such as ide-base are built once thanks to the image cache's single-flight
+    locking.
+    """
+
+    def __init__(self, docker_service=None, git_service=None, workers=4, with_dependencies=True):
+        self.docker_service = docker_service or DockerService.in_process()
+        self.git_service = git_service or GitService()
+        self.workers = workers
+        self.with_dependencies = with_dependencies
+
+    def _resolve(self, template):
+        close_old_connections()
+        started = time.monotonic()
+        source_dir = None
+        try:
+            # The template layer needs the dependency manifests from the repository
+            if self.with_dependencies:
+                source_dir = tempfile.mkdtemp(prefix=f"prebuild-{template.id}-")
+                if not self.git_service.download_template(template, source_dir):
+                    logger.warning(f"Could not download template {template.name}; building toolchain only")
+                    shutil.rmtree(source_dir, ignore_errors=True)
+                    source_dir = None
+
+            image = self.docker_service.resolve_image(template, source_dir)
+            size_bytes = self.docker_service.runtime.image(image).size
+            return PrebuildResult(template, image, time.monotonic() - started, size_bytes)
+        except Exception as e:
+            logger.error(f"Failed to prebuild image for template {template.name}: {str(e)}")
+            return PrebuildResult(template, seconds=time.monotonic() - started, error=str(e))
+        finally:
+            if source_dir:
+                shutil.rmtree(source_dir, ignore_errors=True)
+
+    def run(self, templates=None):
+        """Resolve images for the given templates (all by default) and return results"""
+        templates = list(templates if templates is not None else GitTemplate.objects.all())
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prebuild') as executor:
+            return list(executor.map(self._resolve, templates))
+
+
+def start_prebuild_on_startup():
+    """Prefetch all template images in a background thread of the web process"""
+    # Management commands such as migrate should not trigger builds
+    if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1] != 'runserver':
+        return
+
+    def prebuild():
+        try:
+            results = ImagePrebuilder(workers=settings.PREBUILD_IMAGES_WORKERS).run()
+            failed = [result.template.name for result in results if not result.ok]
+            logger.info(f"Startup image prefetch finished: {len(results) - len(failed)} ok, {len(failed)} failed")
+        except Exception as e:
+            logger.error(f"Startup image prefetch failed: {str(e)}")
+
+    threading.Thread(target=prebuild, name='image-prebuild', daemon=True).start()
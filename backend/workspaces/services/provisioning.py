@@ -0,0 +1,210 @@
+import time
+import socket
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections, connection
+from django.utils import timezone
+from containers.services import DockerService
+from workspaces.models import ProvisioningJob, Workspace
+from .git_service import GitService
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_provisioning(workspace):
+    """Queue a provisioning job for a newly created workspace"""
+    job = ProvisioningJob.objects.create(workspace=workspace)
+    if settings.PROVISIONING_IN_PROCESS_WORKERS > 0:
+        pool = ProvisioningWorkerPool.in_process()
+        transaction.on_commit(pool.wake)
+    return job
+
+
+class ProvisioningRunner:
+    """Runs the provisioning stages of a single job and records their timing"""
+
+    def __init__(self, git_service=None, docker_service=None):
+        self.git_service = git_service or GitService()
+        self._docker_service = docker_service
+        self._lock = threading.Lock()
+
+    @property
+    def docker_service(self):
+        with self._lock:
+            if self._docker_service is None:
+                self._docker_service = DockerService.in_process()
+            return self._docker_service
+
+    def stages(self):
+        return [
+            # Fails fast, before the clone, when no node has room
+            ('place_workspace', lambda workspace: self.docker_service.place(workspace)),
+            ('clone_repository', self.git_service.clone_repository),
+            ('initialize_container', lambda workspace: self.docker_service.initialize_container(workspace)),
+        ]
+
+    def run(self, job):
+        try:
+            workspace = Workspace.objects.select_related(
+                'git_template', 'resource_class', 'owner'
+            ).get(id=job.workspace_id)
+        except Workspace.DoesNotExist:
+            self._finish(job, 'failed', 'Workspace was deleted before provisioning finished')
+            return False
+
+        job.error = ''
+        for stage, run_stage in self.stages():
+            job.stage = stage
+            job.save(update_fields=['stage'])
+            started = time.monotonic()
+            try:
+                success = run_stage(workspace)
+            except Exception as e:
+                logger.exception(f"Provisioning stage {stage} raised for workspace {workspace.id}")
+                success = False
+                job.error = str(e)
+            job.stage_timings[stage] = round(time.monotonic() - started, 3)
+            job.save(update_fields=['stage_timings'])
+
+            if not success:
+                logger.error(f"Provisioning stage {stage} failed for workspace {workspace.id}")
+                Workspace.objects.filter(id=workspace.id).update(container_status='failed', is_running=False)
+                self._finish(job, 'failed', job.error or f"Stage {stage} failed")
+                return False
+
+        self._finish(job, 'succeeded')
+        return True
+
+    def _finish(self, job, status, error=''):
+        job.status = status
+        job.error = error
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+class ProvisioningWorkerPool:
+    """
+    Pool of threads that claim queued ProvisioningJob rows from the database.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+    pools (in web processes or run_provisioning_workers) can share the queue.
+    All threads of a pool share one runner and therefore one Docker client.
+    """
+    _in_process = None
+    _in_process_lock = threading.Lock()
+
+    def __init__(self, num_workers=4, poll_interval=None, runner_factory=ProvisioningRunner):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval or settings.PROVISIONING_POLL_INTERVAL
+        self.runner_factory = runner_factory
+        self.runner = None
+        self.name = f"{socket.gethostname()}:{id(self):x}"
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._requeue_lock = threading.Lock()
+        self._next_requeue = 0
+
+    @classmethod
+    def in_process(cls):
+        """Get the pool started inside the web process, starting it on first use"""
+        with cls._in_process_lock:
+            if cls._in_process is None:
+                cls._in_process = cls(num_workers=settings.PROVISIONING_IN_PROCESS_WORKERS)
+                cls._in_process.start()
+            return cls._in_process
+
+    def start(self):
+        self.runner = self.runner_factory()
+        for i in range(self.num_workers):
+            thread = threading.Thread(
+                target=self._work, name=f"provisioning-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.num_workers} provisioning workers ({self.name})")
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def requeue_stale(self):
+        """
+        Put back jobs whose worker died without finishing them; jobs that
+        already had PROVISIONING_MAX_ATTEMPTS tries are failed instead.
+        """
+        now = timezone.now()
+        stale = ProvisioningJob.objects.filter(
+            status='running', started_at__lt=now - timedelta(seconds=settings.PROVISIONING_JOB_TIMEOUT)
+        )
+        exhausted = stale.filter(attempts__gte=settings.PROVISIONING_MAX_ATTEMPTS)
+        workspace_ids = list(exhausted.values_list('workspace_id', flat=True))
+        failed = exhausted.update(
+            status='failed', worker='', finished_at=now,
+            error=f"Gave up after {settings.PROVISIONING_MAX_ATTEMPTS} attempts",
+        )
+        if failed:
+            Workspace.objects.filter(id__in=workspace_ids).update(container_status='failed', is_running=False)
+            logger.error(f"Failed {failed} provisioning jobs that ran out of attempts")
+        count = stale.update(status='queued', worker='')
+        if count:
+            logger.warning(f"Requeued {count} stale provisioning jobs")
+        return count
+
+    def _requeue_if_due(self):
+        # One thread of the pool checks, every PROVISIONING_REQUEUE_INTERVAL
+        if time.monotonic() < self._next_requeue or not self._requeue_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_requeue = time.monotonic() + settings.PROVISIONING_REQUEUE_INTERVAL
+            self.requeue_stale()
+        except Exception as e:
+            logger.error(f"Error requeueing stale provisioning jobs: {str(e)}")
+        finally:
+            self._requeue_lock.release()
+
+    def claim(self):
+        """Atomically take the oldest queued job, or None"""
+        with transaction.atomic():
+            job = (
+                ProvisioningJob.objects.select_for_update(skip_locked=True)
+                .filter(status='queued')
+                .order_by('created_at')
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = 'running'
+            job.worker = self.name
+            job.attempts += 1
+            job.started_at = timezone.now()
+            job.save(update_fields=['status', 'worker', 'attempts', 'started_at'])
+            return job
+
+    def _work(self):
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                self._requeue_if_due()
+                try:
+                    job = self.claim()
+                except Exception as e:
+                    logger.error(f"Error claiming provisioning job: {str(e)}")
+                    job = None
+
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+
+                logger.info(f"Worker {threading.current_thread().name} running provisioning job {job.id}")
+                self.runner.run(job)
+        finally:
+            connection.close()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+import requests
+from django.conf import settings
+from .template_downloader import TemplateDownloader
+from .materialize import set_tree_permissions
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def _lock_for(key):
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+class TemplateCache:
+    """
+    On-disk cache of extracted template directories.
+
+    Entries are keyed by (owner, repo, branch, template path) and store the
+    extracted tree of one commit plus that commit's SHA and the ETag of the
+    branch lookup. A cached entry is revalidated with a conditional request
+    (If-None-Match) at most every TEMPLATE_CACHE_REVALIDATE_SECONDS; a 304
+    costs no GitHub rate limit and no download. If GitHub is unreachable the
+    last cached tree is served.
+    """
+
+    def __init__(self, root=None, downloader=None, revalidate_seconds=None):
+        self.root = root or settings.TEMPLATE_CACHE_ROOT
+        self.downloader = downloader or TemplateDownloader()
+        if revalidate_seconds is None:
+            revalidate_seconds = settings.TEMPLATE_CACHE_REVALIDATE_SECONDS
+        self.revalidate_seconds = revalidate_seconds
+
+    def _entry_dir(self, owner, repo, branch, path):
+        key = f"{owner}/{repo}@{branch}:{path}"
+        return os.path.join(self.root, hashlib.sha256(key.encode()).hexdigest()[:24])
+
+    def _read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.isdir(os.path.join(entry_dir, meta.get('tree', ''))):
+            return None
+        return meta
+
+    def _write_meta(self, entry_dir, meta):
+        tmp_path = os.path.join(entry_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(entry_dir, 'meta.json'))
+
+    @contextmanager
+    def _locked(self, entry_dir):
+        os.makedirs(entry_dir, exist_ok=True)
+        with _lock_for(entry_dir):
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(entry_dir, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _latest_commit(self, owner, repo, branch, etag=None):
+        """Return (sha, etag) of the branch head, or (None, etag) if unchanged since etag"""
+        headers = {'Accept': 'application/vnd.github.sha'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.downloader.session.get(
+            f"{self.downloader.api_url}/repos/{owner}/{repo}/commits/{branch}",
+            headers=headers,
+            timeout=15,
+        )
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.text.strip(), response.headers.get('ETag')
+
+    def get(self, owner, repo, branch, path):
+        """Return the path of an up-to-date extracted tree for this template"""
+        entry_dir = self._entry_dir(owner, repo, branch, path)
+        with self._locked(entry_dir):
+            meta = self._read_meta(entry_dir)
+            if meta and time.time() - meta['checked_at'] < self.revalidate_seconds:
+                return os.path.join(entry_dir, meta['tree'])
+
+            try:
+                sha, etag = self._latest_commit(owner, repo, branch, meta and meta.get('etag'))
+            except requests.RequestException as e:
+                if meta:
+                    logger.warning(f"Could not revalidate {owner}/{repo}@{branch}, using cached tree: {str(e)}")
+                    return os.path.join(entry_dir, meta['tree'])
+                raise
+
+            if meta and (sha is None or sha == meta['sha']):
+                logger.info(f"Template cache hit for {owner}/{repo}@{branch}:{path} ({meta['sha'][:12]})")
+                meta.update(etag=etag, checked_at=time.time())
+                self._write_meta(entry_dir, meta)
+                return os.path.join(entry_dir, meta['tree'])
+
+            logger.info(f"Template cache miss for {owner}/{repo}@{branch}:{path}, fetching {sha[:12]}")
+            tree = f"tree-{sha}"
+            tmp_dir = os.path.join(entry_dir, f"{tree}.tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            try:
+                # Download the exact commit we just looked up
+                self.downloader.download(owner, repo, sha, path, tmp_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            # Done once here so materialized workspaces inherit the modes
+            set_tree_permissions(tmp_dir)
+            shutil.rmtree(os.path.join(entry_dir, tree), ignore_errors=True)
+            os.rename(tmp_dir, os.path.join(entry_dir, tree))
+
+            previous = meta['tree'] if meta else None
+            self._write_meta(entry_dir, {
+                'owner': owner, 'repo': repo, 'branch': branch, 'path': path,
+                'sha': sha, 'etag': etag, 'tree': tree, 'checked_at': time.time(),
+            })
+            self._prune(entry_dir, keep={tree, previous})
+            return os.path.join(entry_dir, tree)
+
+    def seed(self, owner, repo, branch, path, source_dir, sha='local'):
+        """Install a local directory as the cached tree of a template (offline benchmarks and tests)"""
+        entry_dir = self._entry_dir(owner, repo, branch, path)
+        with self._locked(entry_dir):
+            tree = f"tree-{sha}"
+            shutil.rmtree(os.path.join(entry_dir, tree), ignore_errors=True)
+            shutil.copytree(source_dir, os.path.join(entry_dir, tree))
+            set_tree_permissions(os.path.join(entry_dir, tree))
+            self._write_meta(entry_dir, {
+                'owner': owner, 'repo': repo, 'branch': branch, 'path': path,
+                'sha': sha, 'etag': None, 'tree': tree, 'checked_at': time.time(),
+            })
+        return os.path.join(entry_dir, tree)
+
+    def _prune(self, entry_dir, keep):
+        # Overlay-mounted workspaces keep using their tree as the lower dir
+        if settings.WORKSPACE_MATERIALIZE_STRATEGY == 'overlay':
+            return
+        # The previous tree is kept because a workspace may still be copying from it
+        for entry in os.listdir(entry_dir):
+            if entry.startswith('tree-') and entry not in keep:
+                shutil.rmtree(os.path.join(entry_dir, entry), ignore_errors=True)
+
@@ -0,0 +1,147 @@
+import os
+import shutil
+import logging
+import tarfile
+import threading
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide GitHub session, so connections are kept alive across downloads"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=max(settings.TEMPLATE_DOWNLOAD_WORKERS, 10),
+                max_retries=2,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept'] = 'application/vnd.github+json'
+            if settings.GITHUB_TOKEN:
+                session.headers['Authorization'] = f"Bearer {settings.GITHUB_TOKEN}"
+            _session = session
+        return _session
+
+
+class TemplateDownloadError(Exception):
+    """Raised when a template directory cannot be downloaded"""
+
+
+class TemplateDownloader:
+    """
+    Downloads one directory of a GitHub repository.
+
+    The whole repository tarball is fetched in a single streamed request and
+    only members under the template directory are extracted. If the tarball
+    cannot be used, the directory listing comes from one recursive git trees
+    request and files are fetched concurrently over the shared session.
+    API and raw URLs come from settings so a local stand-in server can be used.
+    """
+
+    def __init__(self, session=None, api_url=None, raw_url=None, workers=None):
+        self.session = session or get_session()
+        self.api_url = (api_url or settings.GITHUB_API_URL).rstrip('/')
+        self.raw_url = (raw_url or settings.GITHUB_RAW_URL).rstrip('/')
+        self.workers = workers or settings.TEMPLATE_DOWNLOAD_WORKERS
+
+    def download(self, owner, repo, branch, path, dest):
+        """Download repo/path at branch into dest; returns the number of files written"""
+        try:
+            return self.download_tarball(owner, repo, branch, path, dest)
+        except (requests.RequestException, tarfile.TarError, TemplateDownloadError) as e:
+            logger.warning(f"Tarball download of {owner}/{repo} failed, falling back to trees API: {str(e)}")
+            self._clear(dest)
+            return self.download_tree(owner, repo, branch, path, dest)
+
+    def _clear(self, dest):
+        for entry in os.listdir(dest):
+            entry_path = os.path.join(dest, entry)
+            if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+
+    def _target_path(self, dest, relative_path):
+        """Resolve a repository path inside dest, refusing anything that escapes it"""
+        relative_path = posixpath.normpath(relative_path)
+        if relative_path.startswith('../') or relative_path == '..' or posixpath.isabs(relative_path):
+            raise TemplateDownloadError(f"Refusing to write outside the workspace: {relative_path}")
+        return os.path.join(dest, *relative_path.split('/'))
+
+    def download_tarball(self, owner, repo, branch, path, dest):
+        url = f"{self.api_url}/repos/{owner}/{repo}/tarball/{branch}"
+        logger.info(f"Fetching tarball: {url}")
+        prefix = path.strip('/') + '/'
+        written = 0
+
+        with self.session.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with tarfile.open(fileobj=response.raw, mode='r|*') as tar:
+                for member in tar:
+                    # Members are prefixed with "<owner>-<repo>-<sha>/"
+                    _, _, repo_path = member.name.partition('/')
+                    if not repo_path.startswith(prefix):
+                        continue
+                    relative_path = repo_path[len(prefix):]
+                    if not relative_path:
+                        continue
+                    target = self._target_path(dest, relative_path)
+
+                    if member.isdir():
+                        os.makedirs(target, exist_ok=True)
+                    elif member.isfile():
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        with tar.extractfile(member) as source, open(target, 'wb') as f:
+                            shutil.copyfileobj(source, f)
+                        os.chmod(target, member.mode & 0o777)
+                        written += 1
+                    else:
+                        logger.info(f"Skipping non-regular template entry: {repo_path}")
+
+        if not written:
+            raise TemplateDownloadError(f"No files found under {path} in {owner}/{repo}@{branch}")
+        return written
+
+    def download_tree(self, owner, repo, branch, path, dest):
+        url = f"{self.api_url}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
+        logger.info(f"Fetching tree: {url}")
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        tree = response.json()
+        if tree.get('truncated'):
+            logger.warning(f"Tree listing for {owner}/{repo} was truncated by GitHub")
+
+        prefix = path.strip('/') + '/'
+        blobs = [
+            item['path'] for item in tree.get('tree', [])
+            if item['type'] == 'blob' and item['path'].startswith(prefix)
+        ]
+        if not blobs:
+            raise TemplateDownloadError(f"No files found under {path} in {owner}/{repo}@{branch}")
+
+        def fetch(repo_path):
+            target = self._target_path(dest, repo_path[len(prefix):])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with self.session.get(f"{self.raw_url}/{owner}/{repo}/{branch}/{repo_path}", stream=True, timeout=60) as r:
+                r.raise_for_status()
+                with open(target, 'wb') as f:
+                    for chunk in r.iter_content(64 * 1024):
+                        f.write(chunk)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='template-download') as executor:
+            # list() re-raises the first download error
+            list(executor.map(fetch, blobs))
+        return len(blobs)
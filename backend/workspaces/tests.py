@@ -1,3 +1,495 @@
-from django.test import TestCase
+import io
+import os
+import json
+import stat
+import shutil
+import tempfile
+import time
+import tarfile
+import threading
+import subprocess
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from containers.runtime import FakeRuntime, set_runtime
+from containers.services import DockerService
+from containers.services.recipes import BASE_IMAGE
+from .models import GitTemplate, ProvisioningJob, ResourceClass, Workspace
+from .services import ProvisioningRunner, ProvisioningWorkerPool, enqueue_provisioning
+from .services.materialize import Materializer
+from .services.template_cache import TemplateCache
+from .services.template_downloader import TemplateDownloader
 
-# Create your tests here.
+
+class WorkspaceFixtures:
+    """Users and workspaces on an in-memory container runtime"""
+
+    def setUp(self):
+        # Workspace containers mount ~/.ssh read-only, so give them one
+        self.home = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        patcher = mock.patch.dict(os.environ, {'HOME': self.home})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.home, ignore_errors=True)
+        self.runtime = FakeRuntime()
+        set_runtime(self.runtime)
+        self.addCleanup(set_runtime, None)
+        self.docker_service = DockerService()
+
+        self.admin = get_user_model().objects.create_user(username='admin', password='secret', is_admin=True)
+        self.alice = get_user_model().objects.create_user(username='alice', password='secret')
+        self.bob = get_user_model().objects.create_user(username='bob', password='secret')
+
+    def _running_workspace(self, owner, name='ws'):
+        workspace = Workspace.objects.create(name=name, owner=owner)
+        self.assertTrue(self.docker_service.start_container(workspace))
+        return workspace
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+# Bulk actions run in pool threads with their own connections, which must see
+# committed rows; one worker because SQLite test databases lock across threads
+@override_settings(ALLOWED_HOSTS=['testserver'], BULK_WORKERS=1)
+class BulkLifecycleTests(WorkspaceFixtures, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workspaces = [self._running_workspace(self.alice, f"alice-{i}") for i in range(3)]
+        self.workspaces.append(self._running_workspace(self.bob, 'bob'))
+
+    def _statuses(self):
+        return {w.name: self.runtime.inspect(w.container_id).status for w in Workspace.objects.all()}
+
+    def test_stops_only_matching_workspaces(self):
+        with mock.patch.object(DockerService, 'in_process', return_value=self.docker_service):
+            response = self._client(self.admin).post(
+                '/api/workspaces/bulk/', {'action': 'stop', 'owner': 'alice'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total'], response.data['succeeded'], response.data['failed']), (3, 3, 0))
+        self.assertEqual(
+            self._statuses(),
+            {'alice-0': 'exited', 'alice-1': 'exited', 'alice-2': 'exited', 'bob': 'running'},
+        )
+
+    def test_restart_reports_each_workspace(self):
+        self.runtime.remove(self.workspaces[0].container_id, force=True)
+        with mock.patch.object(DockerService, 'in_process', return_value=self.docker_service):
+            response = self._client(self.admin).post(
+                '/api/workspaces/bulk/', {'action': 'restart', 'all': True}, format='json'
+            )
+        results = {result['name']: result for result in response.data['results']}
+        self.assertEqual(response.data['failed'], 0)
+        self.assertTrue(all(result['ok'] for result in results.values()))
+        self.assertEqual(set(self._statuses().values()), {'running'})
+
+    def test_dry_run_and_validation(self):
+        client = self._client(self.admin)
+        response = client.post('/api/workspaces/bulk/', {'action': 'stop', 'ids': [self.workspaces[3].id], 'dry_run': True}, format='json')
+        self.assertEqual([w['name'] for w in response.data['workspaces']], ['bob'])
+        self.assertEqual(self._statuses()['bob'], 'running')
+
+        self.assertEqual(client.post('/api/workspaces/bulk/', {'action': 'stop'}, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/workspaces/bulk/', {'action': 'explode', 'all': True}, format='json').status_code, 400)
+        self.assertEqual(
+            self._client(self.alice).post('/api/workspaces/bulk/', {'action': 'stop', 'all': True}, format='json').status_code,
+            403,
+        )
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], WORKSPACE_PAGE_SIZE=50, WORKSPACE_MAX_PAGE_SIZE=500)
+class QueryBudgetTests(WorkspaceFixtures, TestCase):
+    """Endpoints issue a fixed number of queries however many workspaces they return"""
+
+    def setUp(self):
+        super().setUp()
+        self.template = GitTemplate.objects.create(
+            name='django', repository_url='https://example.com/django.git', language='python', created_by=self.admin
+        )
+        self.resource_class = ResourceClass.objects.create(
+            name='small', cpu_count=1, ram_gb=2, disk_space_gb=10, price_per_hour=0.1
+        )
+
+    def _add_workspaces(self, owner, count):
+        # Rows only: starting containers would run into the per-user running quota
+        for _ in range(count):
+            Workspace.objects.create(
+                name=f"{owner.username}-{Workspace.objects.count()}", owner=owner,
+                git_template=self.template, resource_class=self.resource_class,
+            )
+
+    def _assert_budget(self, user, url, budget):
+        client = self._client(user)
+        self._add_workspaces(user, 1)
+        with self.assertNumQueries(budget):
+            self.assertEqual(client.get(url).status_code, 200)
+        self._add_workspaces(user, 5)
+        with self.assertNumQueries(budget):
+            self.assertEqual(client.get(url).status_code, 200)
+
+    def test_list(self):
+        # COUNT(*) for the page plus one joined select
+        self._assert_budget(self.alice, '/api/workspaces/', 2)
+        self._assert_budget(self.admin, '/api/workspaces/', 2)
+
+    def test_bulk_status(self):
+        # Paged like the list when no ids are given
+        self._assert_budget(self.alice, '/api/workspaces/status/', 2)
+
+    def test_detail(self):
+        self._add_workspaces(self.alice, 1)
+        workspace = Workspace.objects.get()
+        with self.assertNumQueries(1):
+            response = self._client(self.alice).get(f"/api/workspaces/{workspace.id}/")
+        self.assertEqual(response.data['git_template_details']['name'], 'django')
+        self.assertEqual(response.data['owner_username'], 'alice')
+
+    def test_list_is_paginated(self):
+        self._add_workspaces(self.alice, 3)
+        response = self._client(self.alice).get('/api/workspaces/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_bulk_status_is_bounded(self):
+        self._add_workspaces(self.alice, 3)
+        client = self._client(self.alice)
+        self.assertEqual(len(client.get('/api/workspaces/status/', {'page_size': 2}).data), 2)
+        with override_settings(WORKSPACE_MAX_PAGE_SIZE=2):
+            response = client.get('/api/workspaces/status/', {'ids': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OverlayLifecycleTests(WorkspaceFixtures, TestCase):
+    """Overlay mounts are released on delete and restored after a reboot; mount(8) is mocked"""
+
+    def setUp(self):
+        super().setUp()
+        self.root = os.path.join(self.home, 'workspaces')
+        overrides = override_settings(WORKSPACE_ROOT=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.tree = os.path.join(self.home, 'tree')
+        os.makedirs(os.path.join(self.tree, 'src'))
+        for name in ('README.md', 'src/app.py', 'src/old.py'):
+            with open(os.path.join(self.tree, name), 'w') as f:
+                f.write('template')
+        self.materializer = Materializer(strategy='overlay')
+        self.dest = os.path.join(self.root, '1')
+        with mock.patch('workspaces.services.materialize.subprocess.run'):
+            self.assertEqual(self.materializer.materialize(self.tree, self.dest), 'overlay')
+        self.base, self.upper, _ = self.materializer._overlay_dirs(self.dest)
+
+    def test_restore_falls_back_to_copy(self):
+        # What the workspace changed before the reboot, as overlayfs stores it
+        os.makedirs(os.path.join(self.upper, 'src'))
+        with open(os.path.join(self.upper, 'src', 'app.py'), 'w') as f:
+            f.write('edited')
+        with open(os.path.join(self.upper, 'notes.txt'), 'w') as f:
+            f.write('new')
+        try:
+            os.mknod(os.path.join(self.upper, 'src', 'old.py'), stat.S_IFCHR | 0o600, 0)
+        except PermissionError:
+            self.skipTest('creating whiteouts needs CAP_MKNOD')
+
+        failure = subprocess.CalledProcessError(32, ['mount'])
+        with mock.patch('workspaces.services.materialize.subprocess.run', side_effect=failure):
+            self.assertEqual(self.materializer.restore(), 1)
+        with open(os.path.join(self.dest, 'src', 'app.py')) as f:
+            self.assertEqual(f.read(), 'edited')
+        self.assertTrue(os.path.exists(os.path.join(self.dest, 'README.md')))
+        self.assertTrue(os.path.exists(os.path.join(self.dest, 'notes.txt')))
+        self.assertFalse(os.path.exists(os.path.join(self.dest, 'src', 'old.py')))
+        self.assertFalse(os.path.exists(self.base))
+
+    def test_restore_remounts(self):
+        with mock.patch('workspaces.services.materialize.subprocess.run') as run:
+            self.assertEqual(self.materializer.restore(), 1)
+        self.assertIn(f"lowerdir={self.tree},upperdir={self.upper}", ' '.join(run.call_args.args[0]))
+
+    def test_delete_releases_overlay(self):
+        self.docker_service = DockerService()
+        patcher = mock.patch.object(DockerService, 'in_process', return_value=self.docker_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        workspace = self._running_workspace(self.alice)
+        dest = os.path.join(self.root, str(workspace.id))
+        with mock.patch('workspaces.services.materialize.subprocess.run'):
+            self.materializer.materialize(self.tree, dest)
+        base = self.materializer._overlay_dirs(dest)[0]
+
+        with mock.patch('workspaces.services.materialize.os.path.ismount', return_value=True), \
+                mock.patch('workspaces.services.materialize.subprocess.run') as run:
+            response = self._client(self.alice).delete(f"/api/workspaces/{workspace.id}/")
+        self.assertEqual(response.status_code, 204)
+        run.assert_called_once_with(['umount', dest], check=True, capture_output=True)
+        self.assertFalse(os.path.exists(base))
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    """The GitHub endpoints templates are fetched from, serving one repository o/r"""
+    files = {'python-template/main.py': b'print(1)\n', 'python-template/pkg/util.py': b'X = 1\n', 'README.md': b'repo'}
+
+    def do_GET(self):
+        github = self.server
+        path = self.path.split('?')[0]
+        github.requests.append(path)
+        if path == '/repos/o/r/commits/main':
+            etag = f'"{github.sha}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, b'')
+            return self._send(200, github.sha.encode(), {'ETag': etag})
+        if path.startswith('/repos/o/r/tarball/'):
+            if github.tarball_broken:
+                return self._send(502, b'')
+            return self._send(200, self._tarball(github.sha))
+        if path.startswith('/repos/o/r/git/trees/'):
+            tree = [{'path': name, 'type': 'blob'} for name in self.files]
+            return self._send(200, json.dumps({'tree': tree, 'truncated': False}).encode())
+        if path.startswith('/raw/o/r/'):
+            name = path.split('/', 5)[5]
+            if name in self.files:
+                return self._send(200, self.files[name])
+        self._send(404, b'')
+
+    def _tarball(self, sha):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            for name, data in self.files.items():
+                member = tarfile.TarInfo(f"o-r-{sha[:7]}/{name}")
+                member.size = len(data)
+                member.mode = 0o644
+                tar.addfile(member, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TemplateDownloaderTests(TestCase):
+    """Template downloads and cache revalidation against a local stand-in for GitHub"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGitHub)
+        self.server.sha, self.server.tarball_broken, self.server.requests = 'a' * 40, False, []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.downloader = TemplateDownloader(session=requests.Session(), api_url=base, raw_url=f"{base}/raw", workers=2)
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest, ignore_errors=True)
+
+    def _assert_template(self, root):
+        with open(os.path.join(root, 'main.py'), 'rb') as f:
+            self.assertEqual(f.read(), b'print(1)\n')
+        self.assertTrue(os.path.exists(os.path.join(root, 'pkg', 'util.py')))
+        self.assertFalse(os.path.exists(os.path.join(root, 'README.md')))
+
+    def test_tarball_extracts_the_template_directory(self):
+        self.assertEqual(self.downloader.download('o', 'r', 'main', 'python-template', self.dest), 2)
+        self._assert_template(self.dest)
+        self.assertFalse(any('/git/trees/' in path for path in self.server.requests))
+
+    def test_falls_back_to_trees_api(self):
+        self.server.tarball_broken = True
+        self.assertEqual(self.downloader.download('o', 'r', 'main', 'python-template', self.dest), 2)
+        self._assert_template(self.dest)
+        self.assertIn('/raw/o/r/main/python-template/main.py', self.server.requests)
+
+    def test_cache_revalidates_with_etag(self):
+        cache = TemplateCache(root=self.dest, downloader=self.downloader, revalidate_seconds=0)
+        tree = cache.get('o', 'r', 'main', 'python-template')
+        self._assert_template(tree)
+
+        # Unchanged branch: a 304 and no second download
+        self.assertEqual(cache.get('o', 'r', 'main', 'python-template'), tree)
+        self.assertEqual(sum('/tarball/' in path for path in self.server.requests), 1)
+
+        self.server.sha = 'b' * 40
+        updated = cache.get('o', 'r', 'main', 'python-template')
+        self.assertNotEqual(updated, tree)
+        self.assertTrue(updated.endswith('tree-' + 'b' * 40))
+        self.assertIn(f"/repos/o/r/tarball/{'b' * 40}", self.server.requests)
+
+    def test_cache_serves_last_tree_when_github_is_unreachable(self):
+        cache = TemplateCache(root=self.dest, downloader=self.downloader, revalidate_seconds=0)
+        tree = cache.get('o', 'r', 'main', 'python-template')
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertEqual(cache.get('o', 'r', 'main', 'python-template'), tree)
+
+
+# Workers claim jobs on their own connections, so rows must be committed
+@override_settings(PROVISIONING_IN_PROCESS_WORKERS=0, PROVISIONING_JOB_TIMEOUT=60, PROVISIONING_MAX_ATTEMPTS=2)
+class ProvisioningQueueTests(WorkspaceFixtures, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(WORKSPACE_ROOT=os.path.join(self.home, 'workspaces'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.pool = ProvisioningWorkerPool(num_workers=1, poll_interval=0.05, runner_factory=self._runner)
+        self.template = GitTemplate.objects.create(
+            name='django', repository_url='https://example.com/django.git', language='python', created_by=self.admin
+        )
+
+    def _runner(self):
+        # Templateless workspaces get an empty project directory instead of a clone
+        def clone_repository(workspace):
+            os.makedirs(os.path.join(settings.WORKSPACE_ROOT, str(workspace.id)), exist_ok=True)
+            return True
+        return ProvisioningRunner(git_service=mock.Mock(clone_repository=clone_repository), docker_service=self.docker_service)
+
+    def _job(self, **fields):
+        workspace = Workspace.objects.create(
+            name='ws', owner=self.alice, git_template=self.template, container_status='provisioning'
+        )
+        job = enqueue_provisioning(workspace)
+        if fields:
+            ProvisioningJob.objects.filter(id=job.id).update(**fields)
+        return job
+
+    def test_claims_oldest_queued_job_once(self):
+        first, second = self._job(), self._job()
+        claimed = self.pool.claim()
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (first.id, 'running', 1))
+        self.assertEqual(self.pool.claim().id, second.id)
+        self.assertIsNone(self.pool.claim())
+
+    def test_requeues_stale_jobs_until_attempts_run_out(self):
+        started_at = timezone.now() - timedelta(minutes=5)
+        retry = self._job(status='running', attempts=1, started_at=started_at)
+        poison = self._job(status='running', attempts=2, started_at=started_at)
+        fresh = self._job(status='running', attempts=1, started_at=timezone.now())
+
+        self.assertEqual(self.pool.requeue_stale(), 1)
+        statuses = dict(ProvisioningJob.objects.values_list('id', 'status'))
+        self.assertEqual((statuses[retry.id], statuses[poison.id], statuses[fresh.id]), ('queued', 'failed', 'running'))
+        self.assertEqual(Workspace.objects.get(id=poison.workspace_id).container_status, 'failed')
+
+    def test_running_pool_requeues_orphaned_jobs(self):
+        orphan = self._job(status='running', attempts=1, started_at=timezone.now() - timedelta(minutes=5))
+        with override_settings(PROVISIONING_REQUEUE_INTERVAL=0.05):
+            self.pool.start()
+            self.addCleanup(self.pool.stop, 5)
+            deadline = time.monotonic() + 10
+            while ProvisioningJob.objects.get(id=orphan.id).status != 'succeeded' and time.monotonic() < deadline:
+                time.sleep(0.05)
+        orphan.refresh_from_db()
+        self.assertEqual((orphan.status, orphan.attempts), ('succeeded', 2))
+
+    def test_create_returns_job_to_poll(self):
+        client = self._client(self.alice)
+        response = client.post('/api/workspaces/', {'name': 'new', 'git_template': self.template.id}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_url = f"/api/workspaces/jobs/{response.data['job']['id']}/"
+        self.assertEqual(client.get(job_url).data['status'], 'queued')
+
+        job = self.pool.claim()
+        self.assertTrue(self._runner().run(job))
+        polled = client.get(job_url).data
+        self.assertEqual(polled['status'], 'succeeded')
+        self.assertEqual(set(polled['stage_timings']), {'place_workspace', 'clone_repository', 'initialize_container'})
+        self.assertEqual(self._client(self.bob).get(job_url).status_code, 404)
+
+    def test_job_filter_rejects_bad_workspace_ids(self):
+        client = self._client(self.alice)
+        self.assertEqual(client.get('/api/workspaces/jobs/', {'workspace': 'abc'}).status_code, 400)
+        job = self._job()
+        response = client.get('/api/workspaces/jobs/', {'workspace': job.workspace_id})
+        self.assertEqual([entry['id'] for entry in response.data], [job.id])
+
+
+# Templates build on pool threads with their own connections
+class PrebuildImagesCommandTests(WorkspaceFixtures, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(IMAGE_BUILD_ROOT=os.path.join(self.home, 'builds'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        os.makedirs(settings.IMAGE_BUILD_ROOT)
+        patcher = mock.patch.object(DockerService, 'in_process', return_value=self.docker_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, language in (('Python', 'python'), ('Go', 'go')):
+            GitTemplate.objects.create(
+                name=name, repository_url=f"https://example.com/{language}.git", language=language, created_by=self.admin
+            )
+
+    def _built(self):
+        return sorted(tag.split(':')[0] for tag in self.runtime._images if tag != BASE_IMAGE)
+
+    def test_builds_every_template_image(self):
+        out = io.StringIO()
+        call_command('prebuild_images', '--skip-dependencies', '--workers', '1', stdout=out)
+        self.assertEqual(self._built(), ['ide-base', 'ide-go', 'ide-python'])
+        self.assertIn('Prebuilt images for 2 templates', out.getvalue())
+
+    def test_language_filter(self):
+        call_command('prebuild_images', '--skip-dependencies', '--language', 'go', stdout=io.StringIO())
+        self.assertEqual(self._built(), ['ide-base', 'ide-go'])
+
+    def test_failed_builds_exit_non_zero(self):
+        build = self.runtime.build
+
+        def fake_build(path, tag, labels=None):
+            if tag.startswith('ide-go:'):
+                yield {'error': 'toolchain download failed'}
+                return
+            yield from build(path, tag, labels)
+
+        with mock.patch.object(self.runtime, 'build', fake_build):
+            with self.assertRaisesRegex(CommandError, r'1 of 2 images failed to build: Go'):
+                call_command('prebuild_images', '--skip-dependencies', stdout=io.StringIO())
+        self.assertEqual(self._built(), ['ide-base', 'ide-python'])
+
+
+class BenchmarkCommandTests(TestCase):
+    """Comparing against a baseline fails the command on regressions"""
+
+    REPORT = {'operations': {'create': {'p50_ms': 100.0, 'p95_ms': 200.0}}, 'stages': {}}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.baseline = os.path.join(directory, 'baseline.json')
+        report = json.loads(json.dumps(self.REPORT))
+        patcher = mock.patch('containers.benchmark.WorkspaceBenchmark.run', return_value=report)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _baseline(self, p95_ms):
+        with open(self.baseline, 'w') as f:
+            json.dump({'operations': {'create': {'p50_ms': 100.0, 'p95_ms': p95_ms}}}, f)
+
+    def test_regression_exits_non_zero(self):
+        self._baseline(150.0)
+        out = io.StringIO()
+        with self.assertRaisesRegex(CommandError, r'1 regression\(s\)'):
+            call_command('benchmark_workspaces', '--baseline', self.baseline, stdout=out, stderr=io.StringIO())
+        self.assertEqual(len(json.loads(out.getvalue())['regressions']), 1)
+
+    def test_within_threshold_passes(self):
+        self._baseline(190.0)
+        out = io.StringIO()
+        call_command('benchmark_workspaces', '--baseline', self.baseline, stdout=out, stderr=io.StringIO())
+        self.assertEqual(json.loads(out.getvalue())['regressions'], [])
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import WorkspaceViewSet, GitTemplateViewSet, ResourceClassViewSet
+from .views import WorkspaceViewSet, GitTemplateViewSet, ResourceClassViewSet, ProvisioningJobViewSet
 
 router = DefaultRouter()
 router.register(r'templates', GitTemplateViewSet, basename='git-template')
 router.register(r'resources', ResourceClassViewSet, basename='resource-class')
+router.register(r'jobs', ProvisioningJobViewSet, basename='provisioning-job')
 router.register(r'', WorkspaceViewSet, basename='workspace')
 
 urlpatterns = [
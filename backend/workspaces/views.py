@@ -1,12 +1,29 @@
+import time
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from .models import GitTemplate, ResourceClass, Workspace
-from .serializers import GitTemplateSerializer, ResourceClassSerializer, WorkspaceSerializer
+from .models import GitTemplate, ResourceClass, Workspace, ProvisioningJob
+from .serializers import (
+    GitTemplateSerializer, ResourceClassSerializer, WorkspaceSerializer, ProvisioningJobSerializer
+)
+from .pagination import WorkspacePagination
 from .permissions import IsAdminUser
+from .renderers import EventStreamRenderer
+from .services import enqueue_provisioning
+from .services.bulk import BULK_ACTIONS, BulkLifecycle, filter_workspaces, summarize_results
+from containers.gateway import TICKET_PARAM, issue_ticket
 from containers.services import DockerService
+from containers.services.reaper import mark_accessed
+from containers.services.events import DOCKER_STATUS_STATES, state_from_events
+from containers.services.admission import AdmissionController, AdmissionTimeout, QuotaExceeded
+from containers.services.scheduler import NoCapacity
 
 class GitTemplateViewSet(viewsets.ModelViewSet):
     """
@@ -61,12 +78,26 @@ class WorkspaceViewSet(viewsets.ModelViewSet):
     """
     serializer_class = WorkspaceSerializer
     permission_classes = [IsAuthenticated]
-    docker_service = DockerService()
+    pagination_class = WorkspacePagination
+
+    @property
+    def docker_service(self):
+        return DockerService.in_process()
 
     def get_queryset(self):
+        # Everything the serializer nests and DockerService.for_workspace reads, in one query
+        queryset = Workspace.objects.select_related('owner', 'git_template', 'resource_class', 'node')
         if self.request.user.is_admin:
-            return Workspace.objects.all()
-        return Workspace.objects.filter(owner=self.request.user)
+            return queryset
+        return queryset.filter(owner=self.request.user)
+
+    def handle_exception(self, exc):
+        # Admission and placement refusals are load, not server errors
+        if isinstance(exc, QuotaExceeded):
+            return Response({'error': str(exc)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        if isinstance(exc, (AdmissionTimeout, NoCapacity)):
+            return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        return super().handle_exception(exc)
 
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
@@ -79,6 +110,18 @@ class WorkspaceViewSet(viewsets.ModelViewSet):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    @action(detail=True, methods=['post'])
+    def open(self, request, pk=None):
+        """The URL to open the workspace's IDE at, carrying an owner ticket when served by the gateway"""
+        workspace = self.get_object()
+        if not workspace.container_url:
+            return Response({'error': 'Workspace has no container'}, status=status.HTTP_404_NOT_FOUND)
+        mark_accessed(workspace.id)
+        url = workspace.container_url
+        if settings.WORKSPACE_GATEWAY_ENABLED and workspace.owner_id == request.user.id:
+            url += f"?{TICKET_PARAM}={issue_ticket(workspace)}"
+        return Response({'url': url})
+
     @action(detail=True, methods=['post'])
     def stop(self, request, pk=None):
         workspace = self.get_object()
@@ -93,19 +136,181 @@ class WorkspaceViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         workspace = self.get_object()
+        if state_from_events():
+            # Kept current by the container event watcher; no daemon round-trip
+            return Response(workspace.is_running)
         container_status = self.docker_service.get_container_status(workspace)
         return Response(container_status)
 
+    @action(detail=False, methods=['get'], url_path='status')
+    def bulk_status(self, request):
+        """
+        Get the status of several workspaces in one call: ?ids=1,2,3, at most
+        WORKSPACE_MAX_PAGE_SIZE of them. Without ids, reports on the same
+        page of workspaces the list endpoint returns for ?page=&page_size=.
+        """
+        workspaces = self.get_queryset()
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                ids = [int(i) for i in ids.split(',') if i.strip()]
+            except ValueError:
+                return Response({'error': 'ids must be a comma-separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > settings.WORKSPACE_MAX_PAGE_SIZE:
+                return Response(
+                    {'error': f"At most {settings.WORKSPACE_MAX_PAGE_SIZE} ids per request"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            workspaces = list(workspaces.filter(id__in=ids))
+        else:
+            workspaces = self.paginate_queryset(workspaces)
+
+        if not state_from_events():
+            try:
+                container_statuses = self.docker_service.get_container_statuses(workspaces)
+            except Exception as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            for workspace in workspaces:
+                container_status = container_statuses.get(workspace.id)
+                if container_status:
+                    workspace.is_running = container_status == 'running'
+                    workspace.container_status = DOCKER_STATUS_STATES.get(container_status, 'stopped')
+
+        return Response({
+            str(workspace.id): {
+                'is_running': workspace.is_running,
+                'container_status': workspace.container_status,
+                'metrics': self.docker_service.for_workspace(workspace).metrics.latest(workspace.id) if workspace.is_running else None,
+            }
+            for workspace in workspaces
+        })
+
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """Get recent CPU, memory, network and block I/O samples of the workspace container"""
+        workspace = self.get_object()
+        history = self.docker_service.for_workspace(workspace).metrics.history(workspace.id)
+        return Response({
+            'latest': history[-1] if history else None,
+            'history': history,
+        })
+
     @action(detail=True, methods=['get'])
     def logs(self, request, pk=None):
         workspace = self.get_object()
+        mark_accessed(workspace.id)
         container_logs = self.docker_service.get_container_logs(workspace)
         return Response({'logs': container_logs})
 
-    def perform_create(self, serializer):
-        workspace = serializer.save()
-        # Initialize the container when workspace is created
-        success = self.docker_service.initialize_container(workspace)
-        if not success:
-            workspace.delete()
-            raise Exception("Failed to initialize workspace container")
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='logs/stream',
+        renderer_classes=[JSONRenderer, EventStreamRenderer],
+    )
+    def stream_logs(self, request, pk=None):
+        """
+        Stream new container log lines as server-sent events. One Docker log
+        stream per container is shared by all viewers. Resume with ?since=
+        or Last-Event-ID set to the last event id received.
+        """
+        workspace = self.get_object()
+        if not workspace.container_id:
+            return Response({'error': 'Workspace has no container'}, status=status.HTTP_404_NOT_FOUND)
+        mark_accessed(workspace.id)
+
+        since = request.query_params.get('since') or request.headers.get('Last-Event-ID')
+        events = self.docker_service.stream_logs(
+            workspace, since, asynchronous=isinstance(request._request, ASGIRequest)
+        )
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+        return response
+
+    @action(detail=False, methods=['get'], url_path='warm-pool', permission_classes=[IsAuthenticated, IsAdminUser])
+    def warm_pool(self, request):
+        """Get warm pool hit/miss counters (admin only)"""
+        return Response(self.docker_service.warm_pool.stats())
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdminUser])
+    def bulk(self, request):
+        """
+        Start, stop, restart or suspend every workspace matching the filters
+        (admin only): {"action": "restart", "ids": [...], "owner": "alice",
+        "template": 1, "resource_class": "Basic", "idle_minutes": 60,
+        "dry_run": false}. Returns one result per workspace.
+        """
+        action_name = request.data.get('action')
+        if action_name not in BULK_ACTIONS:
+            return Response({'error': f"action must be one of {', '.join(BULK_ACTIONS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(i) for i in request.data.get('ids') or []]
+            idle_minutes = float(request.data.get('idle_minutes') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers and idle_minutes a number'}, status=status.HTTP_400_BAD_REQUEST)
+        filters = {
+            'ids': ids,
+            'owner': request.data.get('owner'),
+            'template': request.data.get('template'),
+            'resource_class': request.data.get('resource_class'),
+            'idle_seconds': idle_minutes * 60,
+        }
+        if not any(filters.values()) and not request.data.get('all'):
+            return Response({'error': 'Pass at least one filter, or "all": true'}, status=status.HTTP_400_BAD_REQUEST)
+
+        workspaces = list(filter_workspaces(self.get_queryset(), **filters))
+        if request.data.get('dry_run'):
+            return Response({
+                'action': action_name,
+                'total': len(workspaces),
+                'workspaces': [{'id': w.id, 'name': w.name, 'owner': w.owner.username} for w in workspaces],
+            })
+        started = time.monotonic()
+        results = BulkLifecycle(self.docker_service).run(workspaces, action_name)
+        return Response(summarize_results(action_name, results, time.monotonic() - started))
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdminUser])
+    def admission(self, request):
+        """Get admission queue depth, wait times and quota counters (admin only)"""
+        return Response(self.docker_service.admission.stats())
+
+    def perform_destroy(self, instance):
+        # Remove the container (and its port lease) along with the row
+        self.docker_service.delete_container(instance)
+        instance.delete()
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create the workspace record and queue its provisioning.
+        Returns 202 with the provisioning job; poll /api/workspaces/jobs/<id>/.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        AdmissionController.in_process().check_quota(request.user.id)
+        workspace = serializer.save(container_status='provisioning')
+        job = enqueue_provisioning(workspace)
+
+        data = dict(serializer.data)
+        data['job'] = ProvisioningJobSerializer(job).data
+        headers = self.get_success_headers(serializer.data)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+class ProvisioningJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for polling workspace provisioning jobs.
+    Regular users can only see jobs for their own workspaces.
+    """
+    serializer_class = ProvisioningJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = ProvisioningJob.objects.all()
+        if not self.request.user.is_admin:
+            queryset = queryset.filter(workspace__owner=self.request.user)
+        workspace = self.request.query_params.get('workspace', None)
+        if workspace:
+            if not workspace.isdigit():
+                raise ValidationError({'workspace': 'Must be a workspace id'})
+            queryset = queryset.filter(workspace_id=workspace)
+        return queryset
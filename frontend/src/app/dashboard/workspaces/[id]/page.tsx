@@ -34,7 +34,8 @@ export default function WorkspacePage() {
                 setIsStarting(false);
                 clearInterval(interval);
                 if (updated.container_url) {
-                  window.open(updated.container_url, '_blank');
+                  const opened = await workspaces.open(id);
+                  window.open(opened.data.url, '_blank');
                 }
               }
               setWorkspace(updated);
@@ -46,7 +47,8 @@ export default function WorkspacePage() {
           }, 2000);
           return () => clearInterval(interval);
         } else if (data.container_status === 'running' && data.container_url) {
-          const newWindow = window.open(data.container_url, '_blank');
+          const opened = await workspaces.open(id);
+          const newWindow = window.open(opened.data.url, '_blank');
           if (newWindow) {
             // Only redirect if window opened successfully
             setTimeout(() => {
@@ -5,13 +5,15 @@ import { useRouter } from 'next/navigation';
 import { CreateWorkspaceForm } from '@/components/workspace/CreateWorkspaceForm';
 import { TemplatesGallery } from '@/components/workspace/TemplatesGallery';
 import { workspaces } from '@/utils/api';
-import { GitTemplate, ResourceClass } from '@/types/workspace';
+import { GitTemplate, ProvisioningJob, ResourceClass } from '@/types/workspace';
 import { useAuth } from '@/hooks/useAuth';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { Button } from '@/components/ui/button';
 import { ArrowLeft } from 'lucide-react';
 import Link from 'next/link';
 
+const PROVISIONING_POLL_MS = 1000;
+
 export default function NewWorkspacePage() {
   const { user, isLoading: isAuthLoading } = useAuth();
   const router = useRouter();
@@ -21,6 +23,7 @@ export default function NewWorkspacePage() {
   const [resources, setResources] = useState<ResourceClass[]>([]);
   const [selectedTemplate, setSelectedTemplate] = useState<GitTemplate | null>(null);
   const [activeTab, setActiveTab] = useState<string>("templates");
+  const [provisioning, setProvisioning] = useState<ProvisioningJob | null>(null);
 
   useEffect(() => {
     if (isAuthLoading) return;
@@ -50,13 +53,29 @@ export default function NewWorkspacePage() {
     fetchData();
   }, [user, isAuthLoading, router]);
 
+  const waitForProvisioning = async (job: ProvisioningJob) => {
+    while (job.status === 'queued' || job.status === 'running') {
+      setProvisioning(job);
+      await new Promise(resolve => setTimeout(resolve, PROVISIONING_POLL_MS));
+      job = (await workspaces.job(job.id)).data;
+    }
+    return job;
+  };
+
   const handleCreateWorkspace = async (data: { name: string; git_template: number; resource_class: number }) => {
     try {
       setError('');
-      await workspaces.create(data);
+      const response = await workspaces.create(data);
+      const job = await waitForProvisioning(response.data.job);
+      if (job.status === 'failed') {
+        setProvisioning(null);
+        setError(`Failed to set up workspace${job.error ? `: ${job.error}` : '.'}`);
+        return;
+      }
       router.push('/dashboard/workspaces');
     } catch (error) {
       console.error('Error creating workspace:', error);
+      setProvisioning(null);
       setError('Failed to create workspace. Please try again.');
     }
   };
@@ -82,6 +101,14 @@ export default function NewWorkspacePage() {
         </div>
       )}
 
+      {provisioning && (
+        <div className="bg-muted px-4 py-3 rounded">
+          {provisioning.status === 'queued'
+            ? 'Workspace queued for setup...'
+            : `Setting up workspace${provisioning.stage ? ` (${provisioning.stage.replace(/_/g, ' ')})` : ''}...`}
+        </div>
+      )}
+
       <Tabs value={activeTab} onValueChange={setActiveTab} className="space-y-6">
         <TabsList>
           <TabsTrigger value="templates">Choose Template</TabsTrigger>
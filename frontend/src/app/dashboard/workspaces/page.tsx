@@ -13,7 +13,7 @@ import { Progress } from '@/components/ui/progress';
 import { Tooltip, TooltipContent, TooltipProvider, TooltipTrigger } from '@/components/ui/tooltip';
 import { Collapsible, CollapsibleContent, CollapsibleTrigger } from '@/components/ui/collapsible';
 import { Workspace, WorkspaceStatus } from '@/types/workspace';
-import { workspaces as workspaceApi } from '@/utils/api';
+import { workspaces as workspaceApi, WORKSPACE_PAGE_SIZE } from '@/utils/api';
 import { useAuth } from '@/hooks/useAuth';
 import { 
   Copy, 
@@ -119,6 +119,8 @@ interface UserDetails {
 
 export default function WorkspacesPage() {
   const [workspaces, setWorkspaces] = useState<Workspace[]>([]);
+  const [page, setPage] = useState(1);
+  const [totalCount, setTotalCount] = useState(0);
   const [error, setError] = useState('');
   const router = useRouter();
   const [searchQuery, setSearchQuery] = useState('');
@@ -135,12 +137,13 @@ export default function WorkspacesPage() {
 
   // Get workspace stats
   const workspaceStats = useMemo(() => {
-    const total = workspaces.length;
+    // Running/stopped/error are counted on the current page only
+    const total = totalCount;
     const running = workspaces.filter(w => w.status === 'Running').length;
     const stopped = workspaces.filter(w => w.status === 'Stopped').length;
     const error = workspaces.filter(w => w.status === 'Error').length;
     return { total, running, stopped, error };
-  }, [workspaces]);
+  }, [workspaces, totalCount]);
 
   // Get unique template types
   const templateTypes = useMemo(() => {
@@ -171,8 +174,9 @@ export default function WorkspacesPage() {
 
   const fetchWorkspaces = useCallback(async () => {
     try {
-      const response = await workspaceApi.list();
-      const normalizedWorkspaces = response.data.map(workspace => ({
+      const response = await workspaceApi.list(page);
+      setTotalCount(response.data.count);
+      const normalizedWorkspaces = response.data.results.map(workspace => ({
         ...workspace,
         status: workspace.status || 'Stopped'
       }));
@@ -188,7 +192,9 @@ export default function WorkspacesPage() {
         router.replace('/login');
       }
     }
-  }, [router]);
+  }, [router, page]);
+
+  const pageCount = Math.max(1, Math.ceil(totalCount / WORKSPACE_PAGE_SIZE));
 
   useEffect(() => {
     // Only fetch workspaces if we have a user and auth is not loading
@@ -298,6 +304,7 @@ export default function WorkspacesPage() {
     try {
       await workspaceApi.delete(workspaceToDelete.id.toString());
       setWorkspaces(workspaces.filter(w => w.id.toString() !== workspaceToDelete.id.toString()));
+      setTotalCount(count => count - 1);
       toast.success('Workspace deleted successfully');
       setWorkspaceToDelete(null);
     } catch (err) {
@@ -306,13 +313,22 @@ export default function WorkspacesPage() {
     }
   };
 
-  const openWorkspaceInBrowser = () => {
+  const openWorkspaceInBrowser = async () => {
     if (selectedWorkspace?.container_url) {
       // Make sure container is ready
       if (selectedWorkspace.status === 'Running') {
-        const url = selectedWorkspace.container_url;
-        window.open(url, '_blank', 'noopener,noreferrer');
-        setPasswordDialogOpen(false);
+        // Open the tab before awaiting, so popup blockers treat it as the click's
+        const tab = window.open('', '_blank');
+        if (tab) tab.opener = null;
+        try {
+          const opened = await workspaceApi.open(selectedWorkspace.id.toString());
+          if (tab) tab.location.href = opened.data.url;
+          setPasswordDialogOpen(false);
+        } catch (err) {
+          tab?.close();
+          toast.error('Failed to open workspace');
+          console.error('Error opening workspace:', err);
+        }
       } else {
         toast.error('Workspace is not ready', {
           description: 'Please wait a few moments for the workspace to start.'
@@ -772,6 +788,20 @@ export default function WorkspacesPage() {
             </motion.div>
           ))}
         </div>
+
+        {pageCount > 1 && (
+          <div className="flex items-center justify-center gap-4">
+            <Button variant="outline" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+              Previous
+            </Button>
+            <span className="text-sm text-muted-foreground">
+              Page {page} of {pageCount}
+            </span>
+            <Button variant="outline" disabled={page >= pageCount} onClick={() => setPage(page + 1)}>
+              Next
+            </Button>
+          </div>
+        )}
       </div>
 
       <Dialog open={!!workspaceToDelete} onOpenChange={() => setWorkspaceToDelete(null)}>
@@ -12,67 +12,55 @@ interface LogLine {
   type: 'info' | 'error' | 'success';
 }
 
+// Keep the terminal bounded however long the stream runs
+const MAX_LINES = 1000;
+
+function parseLogLine(timestamp: string, line: string): LogLine {
+  const match = line.match(/^(?:\[.*?\]\s*)?(INFO|ERROR|SUCCESS)?\s*(.*)/);
+  const type = match?.[1]?.toLowerCase() as LogLine['type'] | undefined;
+  return {
+    timestamp,
+    message: match?.[2] || line,
+    type: type || 'info'
+  };
+}
+
 export function WorkspaceTerminal({ workspaceId }: WorkspaceTerminalProps) {
   const [logs, setLogs] = useState<LogLine[]>([]);
   const [error, setError] = useState<string>();
   const scrollRef = useRef<HTMLDivElement>(null);
-  const intervalRef = useRef<NodeJS.Timeout | undefined>(undefined);
 
   useEffect(() => {
-    const fetchLogs = async () => {
-      try {
-        const logs = await workspaces.logs(workspaceId);
-        if (logs) {
-          const newLogs = logs.map((line: string) => {
-            // Parse log line to extract timestamp and type
-            const match = line.match(/\[(.*?)\]\s*(INFO|ERROR|SUCCESS)?\s*(.*)/);
-            if (match) {
-              const [, timestamp, type, message] = match;
-              return {
-                timestamp,
-                message: message || line,
-                type: (type?.toLowerCase() as 'info' | 'error' | 'success') || 'info'
-              };
-            }
-            return {
-              timestamp: new Date().toISOString(),
-              message: line,
-              type: 'info' as const
-            };
-          });
+    const controller = new AbortController();
+    let since: string | undefined;
 
-          setLogs(prev => {
-            // Only add new logs that we haven't seen before
-            const lastLog = prev[prev.length - 1];
-            const startIndex = lastLog 
-              ? newLogs.findIndex(log => 
-                  log.timestamp > lastLog.timestamp || 
-                  (log.timestamp === lastLog.timestamp && log.message !== lastLog.message)
-                )
-              : 0;
-            
-            return startIndex === -1 
-              ? prev 
-              : [...prev, ...newLogs.slice(startIndex)];
-          });
+    const follow = async () => {
+      // The server pushes only new lines; on reconnect we resume after the last one seen
+      while (!controller.signal.aborted) {
+        let ended = false;
+        try {
+          since = await workspaces.streamLogs(workspaceId, (event) => {
+            if (event.event === 'end') {
+              ended = true;
+            } else if (event.event === 'message' && event.id) {
+              const line = parseLogLine(event.id, event.data);
+              setLogs(prev => [...prev, line].slice(-MAX_LINES));
+            }
+          }, { since, signal: controller.signal });
+          setError(undefined);
+        } catch (error) {
+          if (controller.signal.aborted) return;
+          console.error('Error streaming logs:', error);
+          setError('Failed to fetch logs');
         }
-      } catch (error) {
-        console.error('Error fetching logs:', error);
-        setError('Failed to fetch logs');
+        // The container stopped; wait longer before looking for a new one
+        await new Promise(resolve => setTimeout(resolve, ended ? 5000 : 1000));
       }
     };
 
-    // Initial fetch
-    fetchLogs();
-
-    // Poll for new logs every second
-    intervalRef.current = setInterval(fetchLogs, 1000);
+    follow();
 
-    return () => {
-      if (intervalRef.current) {
-        clearInterval(intervalRef.current);
-      }
-    };
+    return () => controller.abort();
   }, [workspaceId]);
 
   // Auto-scroll to bottom when new logs arrive
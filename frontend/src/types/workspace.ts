@@ -22,6 +22,20 @@ export type WorkspaceStatus = 'Running' | 'Stopped' | 'Error';
 
 export type ContainerStatus = 'created' | 'starting' | 'running' | 'stopped' | 'failed';
 
+export type ProvisioningStatus = 'queued' | 'running' | 'succeeded' | 'failed';
+
+export interface ProvisioningJob {
+  id: number;
+  workspace: number;
+  status: ProvisioningStatus;
+  stage: string;
+  error: string;
+  attempts: number;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
 export interface SharedUser {
   username: string;
   access_level: 'read' | 'write';
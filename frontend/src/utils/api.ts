@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Workspace, GitTemplate, ResourceClass } from '@/types/workspace';
+import { Workspace, GitTemplate, ResourceClass, ProvisioningJob } from '@/types/workspace';
 
 interface User {
   id: number;
@@ -20,8 +20,17 @@ interface ApiResponse<T> {
   message?: string;
 }
 
+export interface Paginated<T> {
+  count: number;
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8001';
 
+export const WORKSPACE_PAGE_SIZE = 24;
+
 const api = axios.create({
   baseURL: API_URL
 });
@@ -160,14 +169,16 @@ export const auth = {
 };
 
 export const workspaces = {
-  list: async (): Promise<ApiResponse<Workspace[]>> => {
+  list: async (page = 1, pageSize = WORKSPACE_PAGE_SIZE): Promise<ApiResponse<Paginated<Workspace>>> => {
     try {
       const token = localStorage.getItem('access_token');
       if (!token) {
         throw new Error('No access token available');
       }
       
-      const response = await api.get('/api/workspaces/');
+      const response = await api.get<Paginated<Workspace>>('/api/workspaces/', {
+        params: { page, page_size: pageSize },
+      });
       return { data: response.data };
     } catch (error) {
       console.error('Failed to fetch workspaces:', error);
@@ -175,11 +186,17 @@ export const workspaces = {
     }
   },
 
-  create: async (data: Partial<Workspace>): Promise<ApiResponse<Workspace>> => {
+  // Answers 202 once the workspace is queued; poll its job until provisioning finishes
+  create: async (data: Partial<Workspace>): Promise<ApiResponse<Workspace & { job: ProvisioningJob }>> => {
     const response = await api.post('/api/workspaces/', data);
     return response;
   },
 
+  job: async (id: number): Promise<ApiResponse<ProvisioningJob>> => {
+    const response = await api.get(`/api/workspaces/jobs/${id}/`);
+    return response;
+  },
+
   get: async (id: string): Promise<ApiResponse<Workspace>> => {
     const response = await api.get(`/api/workspaces/${id}/`);
     return response;
@@ -195,6 +212,12 @@ export const workspaces = {
     return { data: undefined };
   },
 
+  // URL of the workspace IDE, with an owner ticket the gateway trades for a cookie
+  open: async (id: string): Promise<ApiResponse<{ url: string }>> => {
+    const response = await api.post(`/api/workspaces/${id}/open/`);
+    return { data: response.data };
+  },
+
   stop: async (id: string): Promise<ApiResponse<void>> => {
     await api.post(`/api/workspaces/${id}/stop/`);
     return { data: undefined };
@@ -208,6 +231,64 @@ export const workspaces = {
 
   logs: (id: string) => 
     api.get<string[]>(`/api/workspaces/${id}/logs/`).then(response => response.data),
+
+  // Follows new log lines over server-sent events. Uses fetch rather than
+  // EventSource so the JWT can be sent in the Authorization header.
+  // Resolves when the server ends the stream; returns the last event id seen.
+  streamLogs: async (
+    id: string,
+    onEvent: (event: LogStreamEvent) => void,
+    options: { since?: string; signal?: AbortSignal } = {}
+  ): Promise<string | undefined> => {
+    const token = localStorage.getItem('access_token');
+    const query = options.since ? `?since=${encodeURIComponent(options.since)}` : '';
+    const response = await fetch(`${API_URL}/api/workspaces/${id}/logs/stream/${query}`, {
+      headers: {
+        Accept: 'text/event-stream',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      },
+      signal: options.signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Log stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let lastId = options.since;
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return lastId;
+      buffer += value;
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        const lines = block.split('\n').filter(line => !line.startsWith(':')); // drop keep-alive comments
+        if (lines.length === 0) continue;
+
+        const event: LogStreamEvent = { event: 'message', data: '' };
+        for (const line of lines) {
+          const separator = line.indexOf(':');
+          const field = separator === -1 ? line : line.slice(0, separator);
+          const fieldValue = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+          if (field === 'id') event.id = fieldValue;
+          else if (field === 'event') event.event = fieldValue;
+          else if (field === 'data') event.data = event.data ? `${event.data}\n${fieldValue}` : fieldValue;
+        }
+        if (event.id) lastId = event.id;
+        onEvent(event);
+      }
+    }
+  },
 };
 
+export interface LogStreamEvent {
+  id?: string;
+  event: string;
+  data: string;
+}
+
 export default api;